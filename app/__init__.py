@@ -1,12 +1,14 @@
 import os
-from flask import Flask
+import pickle
+from flask import Flask, request, session
 from flask_session import Session
 from dotenv import load_dotenv
 import redis
 
 load_dotenv()
 
-def create_app():
+def create_app(test_config=None):
+    """Build the app; test_config overrides settings before sessions and the database start."""
     app = Flask(__name__, static_folder='../static', template_folder='../templates')
     
     app.secret_key = os.getenv("FLASK_SECRET_KEY", "dev_secret_key_for_testing_12345")
@@ -27,26 +29,48 @@ def create_app():
         print(f"❌ Redis connection failed: {e}")
         # Fallback to filesystem
         app.config['SESSION_TYPE'] = 'filesystem'
-        app.config['SESSION_FILE_DIR'] = os.path.join(os.path.dirname(__file__), '..', 'instance', 'sessions')
-        os.makedirs(app.config['SESSION_FILE_DIR'], exist_ok=True)
-    
-    Session(app)
-    app.config['DEBUG'] = True
+        app.config['SESSION_FILE_DIR'] = os.getenv(
+            'SESSION_FILE_DIR', os.path.join(os.path.dirname(__file__), '..', 'instance', 'sessions'))
     
     # Database configuration
     db_path = os.path.join(os.path.dirname(__file__), '..', 'instance', 'chats.db')
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', f'sqlite:///{db_path}')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-    # Initialize SQLAlchemy
+    from .config import INGEST_WORKERS
+    app.config['INGEST_WORKERS'] = INGEST_WORKERS
+
+    if test_config:
+        app.config.update(test_config)
+    if app.config['SESSION_TYPE'] == 'filesystem':
+        os.makedirs(app.config['SESSION_FILE_DIR'], exist_ok=True)
+    
+    Session(app)
+    app.config['DEBUG'] = True
+
+    from .metrics import metrics
+
+    @app.after_request
+    def record_session_size(response):
+        # Only requests that changed the session pay for pickling it again
+        if request.endpoint != 'static' and session.modified:
+            metrics.observe('session.bytes', len(pickle.dumps(dict(session))))
+        return response
+    
+    # Initialize SQLAlchemy with the SQLite storage profile (WAL, pragmas, read/write pools)
     from .models import db
+    from .migrations import upgrade_schema
+    from .storage import configure_storage, install_storage_profile
+    configure_storage(app)
     db.init_app(app)
     
     # Create tables
     with app.app_context():
+        install_storage_profile(db.engines.values())
         db.create_all()
-        print(f"✅ Database tables created at {db_path}")
+        upgrade_schema(db.engine)
+        print(f"✅ Database tables created at {db.engine.url.database}")
 
 
 
@@ -0,0 +1,232 @@
+"""ASGI entry point with asyncio-native /chat and /stream.
+
+    uvicorn app.asgi:application --host 0.0.0.0 --port 5011
+
+Every other route runs the existing Flask app through WsgiToAsgi. The two
+generation routes do their request-bound work (session, database, prompt
+assembly) in a worker thread under a normal Flask request context. /chat
+then talks to Ollama with the async client. /stream hands the answer to a
+generation worker through the token bus, exactly like the WSGI route, and
+relays its events, so request ids, Last-Event-ID resumption
+(GET /stream/<id>) and cancellation work the same under either server.
+"""
+import asyncio
+import io
+import json
+import sys
+from asgiref.wsgi import WsgiToAsgi
+from flask import request, jsonify, Response
+from . import create_app
+from .chat_memory import ChatMemoryManager
+from .generation import reserve_generation, relay_events
+from .langchain_client import langchain_client
+from .limiter import ollama_limiter, OllamaBusy, busy_response
+from .routes import command_reply, with_training_context, dispatch_turn
+from .config import OLLAMA_MODEL
+
+flask_app = create_app()
+wsgi_application = WsgiToAsgi(flask_app)
+
+
+def _prepare_turn(environ, streaming):
+    """Record the user's message and plan the answer inside a Flask request.
+
+    Returns (response, plan, slot, chat_id, reply_key, request_id).
+    response already carries the session cookie. A /chat turn comes back
+    with a plan to run; a /stream turn has already been dispatched and comes
+    back with its request_id. Both are None when the reply is complete
+    (commands, validation errors, a busy model, a repeated turn).
+    """
+    with flask_app.request_context(environ):
+        data = request.get_json(force=True, silent=True)
+        user_msg = (data or {}).get("message", "").strip()
+        image_url = (data or {}).get("image_url")
+        client_key = (data or {}).get("client_key")
+        reply_key = ChatMemoryManager.reply_key(client_key)
+        plan = slot = chat_id = stored = request_id = None
+
+        if user_msg or image_url:
+            # A retried turn that already finished gets its stored answer
+            ChatMemoryManager.use_chat((data or {}).get("chat_id"))
+            stored = ChatMemoryManager.stored_reply(client_key)
+
+        if not user_msg and not image_url:
+            response = jsonify({"error": "empty message"})
+            response.status_code = 400
+        elif stored is not None:
+            response = jsonify({"reply": stored})
+        else:
+            ChatMemoryManager.add_to_active_chat_history({"role": "user", "content": user_msg, "image_url": image_url, "client_key": client_key})
+            reply = command_reply(user_msg)
+            if reply is not None:
+                ChatMemoryManager.add_to_active_chat_history({"role": "assistant", "content": reply, "client_key": reply_key})
+                response = jsonify({"reply": reply})
+            elif not langchain_client.available:
+                reply = "Ollama client not available"
+                ChatMemoryManager.add_to_active_chat_history({"role": "assistant", "content": reply, "client_key": reply_key})
+                response = jsonify({"reply": reply})
+            elif streaming:
+                try:
+                    slot = reserve_generation(OLLAMA_MODEL)
+                except OllamaBusy as busy:
+                    response = busy_response(busy)
+                else:
+                    summary, history = ChatMemoryManager.get_prompt_context()
+                    request_id = dispatch_turn(user_msg, history, summary, client_key, slot)
+                    slot = None  # the generation worker releases it
+                    response = Response(mimetype="text/event-stream")
+            else:
+                chat_id = ChatMemoryManager.get_or_create_active_chat_id()
+                summary, history = ChatMemoryManager.get_prompt_context()
+                chat_history = [msg for msg in history if msg["role"] in ("user", "assistant")]
+                plan = langchain_client.prepare_stream(with_training_context(user_msg), chat_history, chat_id, summary)
+                if plan['cached'] is not None:
+                    # A cache hit needs no model call, so it never waits for a slot
+                    ChatMemoryManager.add_to_active_chat_history({"role": "assistant", "content": plan['cached'], "client_key": reply_key})
+                    response = jsonify({"reply": plan['cached']})
+                    plan = None
+                else:
+                    try:
+                        slot = ollama_limiter.slot(OLLAMA_MODEL)
+                    except OllamaBusy as busy:
+                        response = busy_response(busy)
+                        plan = None
+                    else:
+                        response = Response(mimetype="application/json")
+        return flask_app.process_response(response), plan, slot, chat_id, reply_key, request_id
+
+
+def _save_reply(chat_id, text, client_key):
+    with flask_app.app_context():
+        ChatMemoryManager.persist_message(chat_id, {"role": "assistant", "content": text, "client_key": client_key})
+
+
+def _build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope, so Flask can open its session."""
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope["query_string"].decode("ascii"),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "SERVER_NAME": (scope.get("server") or ("localhost", 80))[0],
+        "SERVER_PORT": str((scope.get("server") or ("localhost", 80))[1]),
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin1").upper().replace("-", "_")
+        value = value.decode("latin1")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        if name in environ:
+            value = f"{environ[name]}{'; ' if name == 'HTTP_COOKIE' else ','}{value}"
+        environ[name] = value
+    return environ
+
+
+async def _read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        body.extend(message.get("body", b""))
+        if not message.get("more_body"):
+            return bytes(body)
+
+
+async def _start(send, response):
+    headers = [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in response.headers.items()]
+    await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+
+
+async def _send_flask_response(send, response):
+    await _start(send, response)
+    await send({"type": "http.response.body", "body": response.get_data()})
+
+
+async def _cancel_on_disconnect(receive, task):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            task.cancel()
+            return
+
+
+async def _relay(receive, send, response, request_id):
+    """Send the generation's SSE frames; a dropped client leaves it running to resume."""
+    await _start(send, response)
+    watcher = asyncio.create_task(_cancel_on_disconnect(receive, asyncio.current_task()))
+    frames = relay_events(request_id)
+    try:
+        # The token bus read blocks, so each wait for new events runs in a thread
+        while True:
+            frame = await asyncio.to_thread(next, frames, None)
+            if frame is None:
+                break
+            await send({"type": "http.response.body", "body": frame.encode(), "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+    finally:
+        watcher.cancel()
+
+
+async def _handle_turn(scope, receive, send, streaming):
+    body = await _read_body(receive)
+    environ = _build_environ(scope, body)
+    response, plan, slot, chat_id, reply_key, request_id = await asyncio.to_thread(_prepare_turn, environ, streaming)
+    if request_id is not None:
+        await _relay(receive, send, response, request_id)
+        return
+    if plan is None:
+        await _send_flask_response(send, response)
+        return
+
+    # Stop generating (and free the slot) as soon as the client goes away
+    watcher = asyncio.create_task(_cancel_on_disconnect(receive, asyncio.current_task()))
+    try:
+        parts = []
+        try:
+            async for chunk in langchain_client.astream_plan(plan):
+                parts.append(chunk)
+            reply = "".join(parts)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            reply = f"Error: {str(e)}"
+        await asyncio.to_thread(_save_reply, chat_id, reply, reply_key)
+
+        payload = json.dumps({"reply": reply}).encode()
+        response.headers["Content-Length"] = str(len(payload))
+        await _start(send, response)
+        await send({"type": "http.response.body", "body": payload})
+    finally:
+        watcher.cancel()
+        slot.release()
+
+
+ASYNC_ROUTES = {
+    "/chat": lambda scope, receive, send: _handle_turn(scope, receive, send, streaming=False),
+    "/stream": lambda scope, receive, send: _handle_turn(scope, receive, send, streaming=True),
+}
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    handler = ASYNC_ROUTES.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+    if handler:
+        await handler(scope, receive, send)
+    else:
+        await wsgi_application(scope, receive, send)
@@ -0,0 +1,98 @@
+import hashlib
+import io
+import os
+import uuid
+from sqlalchemy.exc import IntegrityError
+from .models import db, Blob, DocumentChunk
+from .config import UPLOAD_DIR
+
+BLOB_DIR = UPLOAD_DIR / "blobs"
+TMP_DIR = UPLOAD_DIR / "tmp"
+READ_BLOCK = 64 * 1024
+
+
+def blob_path(digest: str, ext: str):
+    return BLOB_DIR / digest[:2] / f"{digest}{ext}"
+
+
+def stored_copies(digest: str) -> list:
+    """Every file saved under a digest; the same bytes uploaded with another extension get their own."""
+    folder = BLOB_DIR / digest[:2]
+    return [path for path in folder.glob(f"{digest}*") if path.name == digest or path.name.startswith(f"{digest}.")]
+
+
+def blob_url(digest: str, ext: str) -> str:
+    return f"/static/uploads/blobs/{digest[:2]}/{digest}{ext}"
+
+
+def save_upload(file_storage, ext: str):
+    """Stream an upload to disk while hashing it; keep one copy per digest.
+
+    Returns (digest, size, path).
+    """
+    return _save_stream(file_storage.stream, ext)
+
+
+def save_bytes(data: bytes, ext: str):
+    """Store bytes the app produced itself, such as a fetched API response, like an upload."""
+    return _save_stream(io.BytesIO(data), ext)
+
+
+def _save_stream(stream, ext: str):
+    TMP_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = TMP_DIR / uuid.uuid4().hex
+    sha = hashlib.sha256()
+    size = 0
+    with open(tmp_path, "wb") as out:
+        while True:
+            block = stream.read(READ_BLOCK)
+            if not block:
+                break
+            sha.update(block)
+            size += len(block)
+            out.write(block)
+
+    digest = sha.hexdigest()
+    dest = blob_path(digest, ext)
+    if dest.exists():
+        os.remove(tmp_path)
+    else:
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, dest)
+    return digest, size, dest
+
+
+def acquire_blob(digest: str, ext: str, size: int, doc_type: str):
+    """Take a reference on a blob, creating its row on first upload.
+
+    Returns (blob, created). The caller commits.
+    """
+    updated = Blob.query.filter_by(digest=digest).update({Blob.ref_count: Blob.ref_count + 1})
+    if updated:
+        return db.session.get(Blob, digest), False
+    blob = Blob(digest=digest, ext=ext, size=size, doc_type=doc_type, ref_count=1)
+    try:
+        with db.session.begin_nested():
+            db.session.add(blob)
+    except IntegrityError:
+        # Another request stored the same bytes first
+        Blob.query.filter_by(digest=digest).update({Blob.ref_count: Blob.ref_count + 1})
+        return db.session.get(Blob, digest), False
+    return blob, True
+
+
+def release_blob(digest: str) -> list:
+    """Drop a reference; the last one removes the cached extraction and files.
+
+    Returns the file paths to unlink once the caller has committed.
+    """
+    Blob.query.filter_by(digest=digest).update({Blob.ref_count: Blob.ref_count - 1})
+    blob = db.session.get(Blob, digest)
+    if not blob:
+        return []
+    db.session.refresh(blob)
+    if blob.ref_count > 0:
+        return []
+    DocumentChunk.query.filter_by(blob_digest=digest).delete()
+    db.session.delete(blob)
+    return stored_copies(digest)
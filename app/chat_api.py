@@ -2,10 +2,14 @@ import uuid
 import json
 from datetime import datetime
 from flask import Blueprint, request, jsonify, session
+from sqlalchemy.exc import IntegrityError
 from .models import db, Chat, Message
+from .document_store import delete_chat_documents
 from .auth import auth_manager
-from .langchain_client import langchain_client
-from .config import OLLAMA_MODEL
+from .title_worker import schedule_title
+from .chat_memory import ChatMemoryManager
+from .session_manager import ChatSessionManager
+from .message_search import search_messages
 
 chat_api_bp = Blueprint('chat_api', __name__)
 
@@ -38,12 +42,15 @@ def start_chat():
         id=chat_id,
         user_id=user_id,
         name="New Chat",
+        needs_title=True,
         created=datetime.utcnow(),
         updated=datetime.utcnow()
     )
     
     db.session.add(chat)
     db.session.commit()
+    # /chat and /stream write to the session's active chat
+    ChatSessionManager.set_active_chat(chat_id, user_id)
     
     return jsonify({
         'success': True,
@@ -63,25 +70,39 @@ def save_message(chat_id):
     role = data.get('role')  # 'user' or 'assistant'
     content = data.get('content')
     image_url = data.get('image_url')
+    # Idempotency key: posting the same key again returns the stored message
+    client_key = data.get('client_key') or request.headers.get('Idempotency-Key')
     
     if not role or not content:
         return jsonify({'error': 'Role and content required'}), 400
+    if client_key and len(client_key) > 80:
+        return jsonify({'error': 'client_key is limited to 80 characters'}), 400
+    
+    existing = ChatMemoryManager.find_message(chat_id, client_key)
+    if existing:
+        return jsonify({'success': True, 'message_id': existing.id, 'duplicate': True})
     
     message = Message(
         chat_id=chat_id,
         role=role,
         content=content,
         image_url=image_url,
+        client_key=client_key,
         timestamp=datetime.utcnow()
     )
     
+    # The message triggers bump the chat's updated time and counters
     db.session.add(message)
     
-    # Update chat timestamp
-    chat = Chat.query.get(chat_id)
-    chat.updated = datetime.utcnow()
-    
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The same key arrived concurrently
+        db.session.rollback()
+        existing = ChatMemoryManager.find_message(chat_id, client_key)
+        return jsonify({'success': True, 'message_id': existing.id, 'duplicate': True})
+    if role == 'assistant':
+        schedule_title(chat_id)
     
     return jsonify({
         'success': True,
@@ -90,13 +111,18 @@ def save_message(chat_id):
 
 @chat_api_bp.route('/chat/<chat_id>/history', methods=['GET'])
 def get_chat_history(chat_id):
-    """Get chat history for specific chat"""
+    """Get a page of chat history: ?limit=N with an optional before= or after= message id"""
     user_id = get_user_id()
     
     if not validate_chat_ownership(chat_id, user_id):
         return jsonify({'error': 'Chat not found or access denied'}), 404
     
-    messages = Message.query.filter_by(chat_id=chat_id).order_by(Message.timestamp).all()
+    messages, has_more = ChatMemoryManager.get_history_page(
+        chat_id,
+        limit=request.args.get('limit', type=int),
+        before=request.args.get('before', type=int),
+        after=request.args.get('after', type=int)
+    )
     
     history = []
     for msg in messages:
@@ -111,33 +137,67 @@ def get_chat_history(chat_id):
     return jsonify({
         'success': True,
         'chat_id': chat_id,
-        'history': history
+        'history': history,
+        'has_more': has_more,
+        # Cursors for the next page back (older) and forward (newer)
+        'before': history[0]['id'] if history else None,
+        'after': history[-1]['id'] if history else None
     })
 
 @chat_api_bp.route('/chats', methods=['GET'])
 def get_user_chats():
-    """Get all chats for current user (excluding datetime-named chats)"""
+    """Get a page of the current user's chats, excluding auto-named "Chat MM/DD HH:MM" ones"""
     user_id = get_user_id()
     
-    chats = Chat.query.filter_by(user_id=user_id).order_by(Chat.updated.desc()).all()
+    try:
+        chats, next_cursor = ChatSessionManager.list_chats(
+            user_id,
+            limit=request.args.get('limit', type=int),
+            cursor=request.args.get('cursor'),
+            named_only=True
+        )
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
     
     chat_list = []
     for chat in chats:
-        # Hide chats with datetime pattern names (e.g., "Chat 12/14 11:59")
-        import re
-        datetime_pattern = r'^Chat \d{1,2}/\d{1,2} \d{1,2}:\d{2}$'
-        
-        if not re.match(datetime_pattern, chat.name):
-            chat_list.append({
-                'id': chat.id,
-                'name': chat.name,
-                'created': chat.created.isoformat(),
-                'updated': chat.updated.isoformat()
-            })
+        chat_list.append({
+            'id': chat.id,
+            'name': chat.name,
+            'title_pending': chat.needs_title,
+            'created': chat.created.isoformat(),
+            'updated': chat.updated.isoformat(),
+            'message_count': chat.message_count,
+            'last_message_at': chat.last_message_at.isoformat() if chat.last_message_at else None,
+            'last_message_preview': chat.last_message_preview
+        })
     
     return jsonify({
         'success': True,
-        'chats': chat_list
+        'chats': chat_list,
+        'next_cursor': next_cursor
+    })
+
+@chat_api_bp.route('/chats/search', methods=['GET'])
+def search_chats():
+    """Search the current user's messages: ?q= with optional limit and offset"""
+    user_id = get_user_id()
+    query = request.args.get('q', '').strip()
+    
+    if not query:
+        return jsonify({'error': 'Query required'}), 400
+    
+    results, next_offset = search_messages(
+        user_id, query,
+        limit=request.args.get('limit', type=int),
+        offset=request.args.get('offset', 0, type=int)
+    )
+    
+    return jsonify({
+        'success': True,
+        'query': query,
+        'results': results,
+        'next_offset': next_offset
     })
 
 @chat_api_bp.route('/chat/<chat_id>', methods=['PUT'])
@@ -153,6 +213,8 @@ def update_chat(chat_id):
     
     if 'name' in data:
         chat.name = data['name']
+        chat.needs_title = False
+        chat.is_auto_named = False
     
     chat.updated = datetime.utcnow()
     db.session.commit()
@@ -170,7 +232,8 @@ def delete_chat(chat_id):
     if not validate_chat_ownership(chat_id, user_id):
         return jsonify({'error': 'Chat not found or access denied'}), 404
     
-    # Delete messages first
+    # Release uploaded documents and delete messages first
+    delete_chat_documents(chat_id)
     Message.query.filter_by(chat_id=chat_id).delete()
     
     # Delete chat
@@ -196,6 +259,8 @@ def clear_chat_history(chat_id):
     # Update chat timestamp
     chat = Chat.query.get(chat_id)
     chat.updated = datetime.utcnow()
+    chat.summary = None
+    chat.summary_upto = None
     
     db.session.commit()
     
@@ -206,29 +271,15 @@ def clear_chat_history(chat_id):
 
 @chat_api_bp.route('/chat/<chat_id>/generate_title', methods=['POST'])
 def generate_title(chat_id):
-    """Generate a title for the chat using AI"""
+    """Queue AI title generation; the new name shows up in /chats"""
     user_id = get_user_id()
     
     if not validate_chat_ownership(chat_id, user_id):
         return jsonify({'error': 'Chat not found or access denied'}), 404
     
-    # Get chat history
-    messages = Message.query.filter_by(chat_id=chat_id).order_by(Message.timestamp).all()
-    if not messages:
-        return jsonify({'success': False, 'error': 'No messages to generate title from'})
-    
-    history = [{'role': msg.role, 'content': msg.content} for msg in messages]
-    
-    # Generate title
-    new_title = langchain_client.generate_title(history)
-    
-    # Update chat
     chat = Chat.query.get(chat_id)
-    chat.name = new_title
-    db.session.commit()
+    if not chat.needs_title:
+        return jsonify({'success': True, 'title': chat.name, 'pending': False})
     
-    return jsonify({
-        'success': True,
-        'title': new_title
-    })
-
+    schedule_title(chat_id)
+    return jsonify({'success': True, 'title': chat.name, 'pending': True}), 202
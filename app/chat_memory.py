@@ -1,8 +1,44 @@
 from flask import session
+from sqlalchemy.exc import IntegrityError
 from .session_manager import ChatSessionManager
-from .models import db, Message
+from .models import db, Chat, Message
+from .summarizer import schedule_summary
+from .title_worker import schedule_title
+from .config import HISTORY_MESSAGES, SUMMARY_EVERY_MESSAGES, CHAT_HISTORY_PAGE_SIZE, CHAT_HISTORY_PAGE_MAX
 
 class ChatMemoryManager:
+    @staticmethod
+    def get_or_create_active_chat_id():
+        user_id = session.get('user_id', 'guest')
+        active_chat_id = ChatSessionManager.get_active_chat_id(user_id)
+        if not active_chat_id:
+            active_chat_id, _ = ChatSessionManager.create_new_chat(user_id)
+        return active_chat_id
+    
+    @staticmethod
+    def use_chat(chat_id):
+        """Make the chat the client is showing the active one, if the user owns it."""
+        user_id = session.get('user_id', 'guest')
+        if not chat_id or chat_id == ChatSessionManager.get_active_chat_id(user_id):
+            return
+        if Chat.query.filter_by(id=chat_id, user_id=user_id).first():
+            ChatSessionManager.set_active_chat(chat_id, user_id)
+    
+    @staticmethod
+    def reply_key(client_key):
+        """Idempotency key for the answer to the message sent with client_key."""
+        return f"{client_key}:reply" if client_key else None
+    
+    @staticmethod
+    def stored_reply(client_key):
+        """The saved answer to a turn that is being sent again, if it finished."""
+        user_id = session.get('user_id', 'guest')
+        active_chat_id = ChatSessionManager.get_active_chat_id(user_id)
+        if not client_key or not active_chat_id:
+            return None
+        message = ChatMemoryManager.find_message(active_chat_id, ChatMemoryManager.reply_key(client_key))
+        return message.content if message else None
+    
     @staticmethod
     def get_active_chat_memory():
         user_id = session.get('user_id', 'guest')
@@ -34,51 +70,110 @@ class ChatMemoryManager:
         if not active_chat_id:
             return []
         
-        # Get from database first
-        messages = Message.query.filter_by(chat_id=active_chat_id).order_by(Message.timestamp).all()
-        if messages:
-            return [{
-                'role': msg.role,
-                'content': msg.content,
-                'image_url': msg.image_url,
-                'timestamp': msg.timestamp.isoformat()
-            } for msg in messages]
+        messages = Message.query.filter_by(chat_id=active_chat_id).order_by(Message.id).all()
+        return [{
+            'role': msg.role,
+            'content': msg.content,
+            'image_url': msg.image_url,
+            'timestamp': msg.timestamp.isoformat(),
+            'token_count': msg.token_count
+        } for msg in messages]
+    
+    @staticmethod
+    def get_history_page(chat_id, limit=None, before=None, after=None):
+        """One page of a chat's messages, oldest first, by message id cursor.
         
-        # Fallback to session storage
-        chat_session = ChatSessionManager.get_chat_session(active_chat_id, user_id)
-        return chat_session.get('history', [])
+        Without a cursor this is the newest page; `before` walks back to
+        older messages and `after` forward to newer ones. Each page costs
+        one range scan of the (chat_id, id) index however long the chat is.
+        Returns (messages, has_more) where has_more refers to the direction
+        being paged.
+        """
+        limit = max(1, min(limit or CHAT_HISTORY_PAGE_SIZE, CHAT_HISTORY_PAGE_MAX))
+        query = Message.query.filter(Message.chat_id == chat_id)
+        if after is not None:
+            rows = query.filter(Message.id > after).order_by(Message.id).limit(limit + 1).all()
+            return rows[:limit], len(rows) > limit
+        if before is not None:
+            query = query.filter(Message.id < before)
+        rows = query.order_by(Message.id.desc()).limit(limit + 1).all()
+        return list(reversed(rows[:limit])), len(rows) > limit
     
     @staticmethod
-    def add_to_active_chat_history(message):
+    def get_prompt_context():
+        """The chat's rolling summary and the turns it does not cover, oldest first.
+
+        Only the unsummarized tail is loaded, capped so a lagging summary
+        never lets the prompt grow. The newest message (the question being
+        answered) is left out.
+        """
         user_id = session.get('user_id', 'guest')
         active_chat_id = ChatSessionManager.get_active_chat_id(user_id)
+        chat = db.session.get(Chat, active_chat_id) if active_chat_id else None
+        if not chat:
+            return "", []
         
-        # Always create a new chat if none exists
-        if not active_chat_id:
-            active_chat_id, _ = ChatSessionManager.create_new_chat(user_id)
+        rows = (Message.query
+                .filter(Message.chat_id == chat.id, Message.id > (chat.summary_upto or 0))
+                .order_by(Message.id.desc())
+                .limit(HISTORY_MESSAGES + SUMMARY_EVERY_MESSAGES + 1)
+                .all())
+        return chat.summary or "", [{
+            'role': msg.role,
+            'content': msg.content,
+            'token_count': msg.token_count
+        } for msg in reversed(rows[1:])]
+    
+    @staticmethod
+    def find_message(chat_id, client_key):
+        if not client_key:
+            return None
+        return Message.query.filter_by(chat_id=chat_id, client_key=client_key).first()
+    
+    @staticmethod
+    def persist_message(chat_id, message):
+        """Write one message to a chat; needs an app context but no session.
         
-        # Store in database
+        A message whose client_key is already stored in the chat is not
+        written again; the stored row is returned instead.
+        """
+        client_key = message.get('client_key')
+        existing = ChatMemoryManager.find_message(chat_id, client_key)
+        if existing:
+            return existing
         try:
             db_message = Message(
-                chat_id=active_chat_id,
+                chat_id=chat_id,
                 role=message['role'],
                 content=message['content'],
-                image_url=message.get('image_url')
+                image_url=message.get('image_url'),
+                client_key=client_key
             )
             db.session.add(db_message)
             db.session.commit()
+            if message['role'] == 'assistant':
+                schedule_title(chat_id)
+                schedule_summary(chat_id)
+            return db_message
+        except IntegrityError:
+            # Same key written concurrently by a retried request
+            db.session.rollback()
+            return ChatMemoryManager.find_message(chat_id, client_key)
         except Exception as e:
             print(f"Error saving message to DB: {e}")
             db.session.rollback()
+            return None
+    
+    @staticmethod
+    def add_to_active_chat_history(message):
+        """Save a message to the active chat, creating one if needed.
         
-        # Also store in session as backup
-        chat_session = ChatSessionManager.get_chat_session(active_chat_id, user_id)
-        if 'history' not in chat_session:
-            chat_session['history'] = []
-        
-        chat_session['history'].append(message)
-        ChatSessionManager.update_chat_session(active_chat_id, chat_session, user_id)
-        return chat_session['history']
+        The database is the only copy: keeping history in the session made
+        every request re-serialize a list that only ever grew.
+        """
+        # Always create a new chat if none exists
+        active_chat_id = ChatMemoryManager.get_or_create_active_chat_id()
+        return ChatMemoryManager.persist_message(active_chat_id, message)
     
     @staticmethod
     def clear_active_chat_history():
@@ -90,15 +185,11 @@ class ChatMemoryManager:
         # Clear from database
         try:
             Message.query.filter_by(chat_id=active_chat_id).delete()
+            Chat.query.filter_by(id=active_chat_id).update({Chat.summary: None, Chat.summary_upto: None})
             db.session.commit()
         except Exception as e:
             print(f"Error clearing messages from DB: {e}")
             db.session.rollback()
-        
-        # Clear from session
-        chat_session = ChatSessionManager.get_chat_session(active_chat_id, user_id)
-        chat_session['history'] = []
-        ChatSessionManager.update_chat_session(active_chat_id, chat_session, user_id)
         return []
     
     @staticmethod
@@ -19,3 +19,108 @@ SYSTEM_PROMPT = (
 )
 
 OLLAMA_MODEL = "llama3.2:3b"
+
+
+def _model_map(env_name):
+    """Parse per-model integer overrides such as "llama3.2:3b=2,mistral=1"."""
+    return {
+        name.strip(): int(value)
+        for name, _, value in (item.rpartition("=") for item in os.getenv(env_name, "").split(","))
+        if name.strip() and value.strip().isdigit()
+    }
+
+
+# Shared Ollama client
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "10"))
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Generation concurrency per model and per process; overrides look like "llama3.2:3b=2,mistral=1"
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
+OLLAMA_MAX_QUEUE = int(os.getenv("OLLAMA_MAX_QUEUE", "8"))
+OLLAMA_QUEUE_TIMEOUT = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "30"))
+OLLAMA_MODEL_CONCURRENCY = _model_map("OLLAMA_MODEL_CONCURRENCY")
+
+# Uploaded-file retrieval
+RETRIEVAL_CHUNK_WORDS = 180
+RETRIEVAL_CHUNK_OVERLAP = 30
+RETRIEVAL_TOP_K = 4
+JSON_INDEX_CACHE_SIZE = int(os.getenv("JSON_INDEX_CACHE_SIZE", "32"))  # parsed JSON path indexes kept per process
+
+# Prompt token budget (num_ctx minus room for the answer); per-model overrides like "llama3.2:3b=3000"
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1536"))
+PROMPT_TOKEN_BUDGETS = _model_map("PROMPT_TOKEN_BUDGETS")
+
+# Upload ingestion (0 runs extraction inline in the request)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_CHUNK_BATCH = int(os.getenv("INGEST_CHUNK_BATCH", "200"))  # chunk rows inserted per statement
+INGEST_STALE_AFTER = float(os.getenv("INGEST_STALE_AFTER", "600"))  # seconds before a stuck extraction is retried
+
+# PDF extraction caps
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "500"))
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(20 * 1024 * 1024)))
+
+# Exact-match LLM response cache; set RESPONSE_CACHE_REDIS_URL to share it across workers
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "900"))
+RESPONSE_CACHE_REDIS_URL = os.getenv("RESPONSE_CACHE_REDIS_URL", "")
+
+# Opt-in semantic cache: serve a stored answer to a paraphrase in the same context
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_SCOPES = int(os.getenv("SEMANTIC_CACHE_SCOPES", "256"))
+SEMANTIC_CACHE_PER_SCOPE = int(os.getenv("SEMANTIC_CACHE_PER_SCOPE", "128"))
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "512"))
+
+# Per-chat Ollama context reuse; keep the token cap under the model's num_ctx
+CONVERSATION_STATE_CHATS = int(os.getenv("CONVERSATION_STATE_CHATS", "256"))
+CONVERSATION_STATE_MAX_TOKENS = int(os.getenv("CONVERSATION_STATE_MAX_TOKENS", "1536"))
+
+# Conversation window: recent messages sent verbatim, older ones folded into a rolling summary
+HISTORY_MESSAGES = int(os.getenv("HISTORY_MESSAGES", "6"))
+SUMMARY_EVERY_MESSAGES = int(os.getenv("SUMMARY_EVERY_MESSAGES", "8"))  # 0 disables summaries
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "llama3.2:1b")  # small model, so summaries stay off the chat model
+SUMMARY_MAX_WORDS = int(os.getenv("SUMMARY_MAX_WORDS", "150"))
+
+# Background chat titles: chats waiting together within the window share one model call
+TITLE_BATCH_SIZE = int(os.getenv("TITLE_BATCH_SIZE", "8"))
+TITLE_BATCH_WINDOW = float(os.getenv("TITLE_BATCH_WINDOW", "2"))
+
+# Generation workers: set GENERATION_REDIS_URL to run them as separate processes
+# (python -m app.generation_worker) over Redis Streams; otherwise threads in each web process
+GENERATION_REDIS_URL = os.getenv("GENERATION_REDIS_URL", "")
+GENERATION_WORKER_THREADS = int(os.getenv("GENERATION_WORKER_THREADS", "8"))
+GENERATION_STREAM_TTL = int(os.getenv("GENERATION_STREAM_TTL", "600"))
+GENERATION_STREAM_MAXLEN = int(os.getenv("GENERATION_STREAM_MAXLEN", "10000"))
+GENERATION_MAX_QUEUE = int(os.getenv("GENERATION_MAX_QUEUE", "32"))  # queued Redis jobs before /stream returns 429
+
+# SSE coalescing: after the first token, deltas are sent together every window or once this many bytes wait
+SSE_FLUSH_MS = float(os.getenv("SSE_FLUSH_MS", "40"))  # 0 sends every token as its own frame
+SSE_FLUSH_BYTES = int(os.getenv("SSE_FLUSH_BYTES", "512"))
+
+# Chat history pages: messages per /chat/<id>/history request
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "50"))
+CHAT_HISTORY_PAGE_MAX = int(os.getenv("CHAT_HISTORY_PAGE_MAX", "200"))
+
+# Sidebar pages: chats per /chats request
+CHAT_LIST_PAGE_SIZE = int(os.getenv("CHAT_LIST_PAGE_SIZE", "50"))
+CHAT_LIST_PAGE_MAX = int(os.getenv("CHAT_LIST_PAGE_MAX", "200"))
+
+# Message search: results per /chats/search request
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+SEARCH_PAGE_MAX = int(os.getenv("SEARCH_PAGE_MAX", "100"))
+
+# SQLite storage profile: WAL lets readers run while one writer commits.
+# Reads share a pool; ORM writes go through their own small pool so writers
+# queue in-process instead of spinning on the database lock.
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # NORMAL is durable to app crashes in WAL mode
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))  # per connection
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", "10"))
+SQLITE_READ_MAX_OVERFLOW = int(os.getenv("SQLITE_READ_MAX_OVERFLOW", "20"))
+SQLITE_WRITE_POOL_SIZE = int(os.getenv("SQLITE_WRITE_POOL_SIZE", "1"))  # 0 disables write routing
+SQLITE_WRITE_TIMEOUT = float(os.getenv("SQLITE_WRITE_TIMEOUT", "30"))  # seconds to wait for the writer
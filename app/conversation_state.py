@@ -0,0 +1,68 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from .metrics import metrics
+from .response_cache import normalize_messages
+from .config import CONVERSATION_STATE_CHATS, CONVERSATION_STATE_MAX_TOKENS
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ConversationStateCache:
+    """Per-chat Ollama context tokens, so a follow-up only sends the new turn.
+
+    The saved context covers the system prompt plus every turn so far. It is
+    only reused when the caller's system key (the prompt parts that persist
+    between turns) is byte-identical and the chat's last exchange is the one
+    that produced it; anything else (new memory or summary, an edited or
+    extra message, another worker answering) is a full resend, whose own
+    context is then saved for the next turn.
+    """
+
+    def __init__(self, max_chats=CONVERSATION_STATE_CHATS, max_tokens=CONVERSATION_STATE_MAX_TOKENS):
+        self.max_chats = max_chats
+        self.max_tokens = max_tokens
+        self._states = OrderedDict()  # chat_id -> (system digest, last exchange digest, context)
+        self._lock = threading.Lock()
+
+    def resume(self, chat_id, system: str, history: list):
+        """Context tokens to continue from, or None when a full resend is needed."""
+        if not chat_id or not history:
+            return None
+        with self._lock:
+            state = self._states.get(chat_id)
+            if state:
+                self._states.move_to_end(chat_id)
+        if (state and state[0] == _digest(system)
+                and state[1] == _digest(normalize_messages(history[-2:]))):
+            metrics.incr("conversation_state.resumed")
+            return state[2]
+        metrics.incr("conversation_state.full_resend")
+        return None
+
+    def save(self, chat_id, system: str, user_message: str, reply: str, context):
+        if not chat_id or not context:
+            return
+        if len(context) > self.max_tokens:
+            # Close to num_ctx; let the next turn start over from the window
+            self.drop(chat_id)
+            return
+        exchange = normalize_messages([
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": reply}
+        ])
+        with self._lock:
+            self._states[chat_id] = (_digest(system), _digest(exchange), list(context))
+            self._states.move_to_end(chat_id)
+            while len(self._states) > self.max_chats:
+                self._states.popitem(last=False)
+
+    def drop(self, chat_id):
+        with self._lock:
+            self._states.pop(chat_id, None)
+
+
+conversation_state = ConversationStateCache()
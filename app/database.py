@@ -1,178 +1,93 @@
-import sqlite3
-import os
 from datetime import datetime
-from .config import UPLOAD_DIR
+from sqlalchemy.exc import IntegrityError
+from .models import db, User, UserMemory
 
-DATABASE_PATH = os.path.join(UPLOAD_DIR, 'users.db')
 
-def init_database():
-    """Initialize the database and create tables"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    # Create users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT UNIQUE NOT NULL,
-            username TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            mobile TEXT NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login TIMESTAMP,
-            is_active BOOLEAN DEFAULT 1
-        )
-    ''')
-    
-    # Create user_sessions table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            session_token TEXT UNIQUE NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            expires_at TIMESTAMP NOT NULL,
-            is_active BOOLEAN DEFAULT 1,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
-        )
-    ''')
-    
-    # Create user_memory table for storing AI memory per user
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_memory (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            memory_key TEXT NOT NULL,
-            memory_value TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (user_id),
-            UNIQUE(user_id, memory_key)
-        )
-    ''')
-    
+def _user_row(user):
+    """The users-table shape callers of UserDatabase expect."""
+    return {
+        'id': user.id,
+        'user_id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'mobile': user.mobile,
+        'password_hash': user.password_hash,
+        'created_at': user.created_at,
+        'last_login': user.last_login,
+        'is_active': user.is_active,
+    }
 
-    
-    conn.commit()
-    conn.close()
 
 class UserDatabase:
-    def __init__(self):
-        init_database()
-    
-    def get_connection(self):
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row  # Enable dict-like access
-        return conn
-    
+    """User accounts and per-user memory on the app's pooled SQLAlchemy engine.
+
+    Needs an app context. Tables are created with the rest of the schema by
+    create_app, so nothing here connects or runs DDL at import.
+    """
+
     def create_user(self, user_id, username, email, mobile, password_hash):
         """Create a new user"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
+        db.session.add(User(id=user_id, username=username, email=email, mobile=mobile, password_hash=password_hash))
         try:
-            cursor.execute('''
-                INSERT INTO users (user_id, username, email, mobile, password_hash)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, username, email, mobile, password_hash))
-            
-            conn.commit()
+            db.session.commit()
             return True
-        except sqlite3.IntegrityError:
+        except IntegrityError:
+            db.session.rollback()
             return False
-        finally:
-            conn.close()
-    
+
     def get_user_by_email(self, email):
         """Get user by email"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM users WHERE email = ? AND is_active = 1', (email,))
-        user = cursor.fetchone()
-        conn.close()
-        
-        return dict(user) if user else None
-    
+        user = User.query.filter_by(email=email, is_active=True).first()
+        return _user_row(user) if user else None
+
     def get_user_by_id(self, user_id):
         """Get user by user_id"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM users WHERE user_id = ? AND is_active = 1', (user_id,))
-        user = cursor.fetchone()
-        conn.close()
-        
-        return dict(user) if user else None
-    
+        user = User.query.filter_by(id=user_id, is_active=True).first()
+        return _user_row(user) if user else None
+
     def update_last_login(self, user_id):
         """Update user's last login timestamp"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE users SET last_login = CURRENT_TIMESTAMP 
-            WHERE user_id = ?
-        ''', (user_id,))
-        
-        conn.commit()
-        conn.close()
-    
+        User.query.filter_by(id=user_id).update({User.last_login: datetime.utcnow()})
+        db.session.commit()
+
     def get_all_users(self):
         """Get all active users (admin function)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT user_id, username, email, mobile, created_at, last_login 
-            FROM users WHERE is_active = 1 
-            ORDER BY created_at DESC
-        ''')
-        
-        users = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return users
-    
+        users = User.query.filter_by(is_active=True).order_by(User.created_at.desc()).all()
+        return [{
+            'user_id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'mobile': user.mobile,
+            'created_at': user.created_at,
+            'last_login': user.last_login
+        } for user in users]
+
     def delete_user(self, user_id):
         """Soft delete user (set is_active to 0)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('UPDATE users SET is_active = 0 WHERE user_id = ?', (user_id,))
-        conn.commit()
-        conn.close()
-    
+        User.query.filter_by(id=user_id).update({User.is_active: False})
+        db.session.commit()
+
     def save_user_memory(self, user_id, memory_key, memory_value):
         """Save user-specific memory"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO user_memory (user_id, memory_key, memory_value, updated_at)
-            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-        ''', (user_id, memory_key, memory_value))
-        
-        conn.commit()
-        conn.close()
-    
+        for _ in range(2):
+            memory = UserMemory.query.filter_by(user_id=user_id, memory_key=memory_key).first()
+            if memory:
+                memory.memory_value = memory_value
+            else:
+                db.session.add(UserMemory(user_id=user_id, memory_key=memory_key, memory_value=memory_value))
+            try:
+                db.session.commit()
+                return
+            except IntegrityError:
+                # Same key inserted concurrently; update that row instead
+                db.session.rollback()
+
     def get_user_memory(self, user_id):
         """Get all memory for a user"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT memory_key, memory_value FROM user_memory 
-            WHERE user_id = ? ORDER BY updated_at DESC
-        ''', (user_id,))
-        
-        memory = {row['memory_key']: row['memory_value'] for row in cursor.fetchall()}
-        conn.close()
-        
-        return memory
-    
+        rows = (UserMemory.query.filter_by(user_id=user_id)
+                .order_by(UserMemory.updated_at.desc()).all())
+        return {row.memory_key: row.memory_value for row in rows}
 
 
 # Global database instance
-user_db = UserDatabase()
\ No newline at end of file
+user_db = UserDatabase()
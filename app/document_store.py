@@ -0,0 +1,227 @@
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import insert, inspect, text
+from .models import db, Blob, Document, DocumentChunk
+from .blob_store import acquire_blob, release_blob
+from .retrieval import BM25Index, tokenize
+from .json_index import JsonPathIndex
+from .response_cache import response_cache
+from .metrics import metrics
+from .config import RETRIEVAL_TOP_K, INGEST_CHUNK_BATCH, INGEST_STALE_AFTER, JSON_INDEX_CACHE_SIZE
+
+_fts5_ready = None
+_json_indexes = OrderedDict()  # blob digest -> JsonPathIndex, least recently used first
+_json_indexes_lock = threading.Lock()
+
+
+def fts5_ready() -> bool:
+    """Whether the document_chunk_fts table exists on this database."""
+    global _fts5_ready
+    if _fts5_ready is None:
+        _fts5_ready = inspect(db.engine).has_table('document_chunk_fts')
+    return _fts5_ready
+
+
+def claim_extraction(digest: str) -> bool:
+    """Take over extraction of a blob that failed or whose worker went quiet.
+
+    A blob still 'processing' INGEST_STALE_AFTER seconds after its last
+    claim is assumed to belong to a worker that died. The update is
+    conditional, so only one request wins the retry. The caller commits.
+    """
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=INGEST_STALE_AFTER)
+    claimed = Blob.query.filter(
+        Blob.digest == digest,
+        db.or_(
+            Blob.status == 'failed',
+            db.and_(Blob.status == 'processing', db.func.coalesce(Blob.claimed_at, Blob.created_at) < stale)
+        )
+    ).update({Blob.status: 'processing', Blob.error: None, Blob.claimed_at: now}, synchronize_session='fetch')
+    return bool(claimed)
+
+
+def attach_document(chat_id: str, file_name: str, digest: str, ext: str, size: int, doc_type: str):
+    """Attach stored bytes to a chat.
+
+    Returns (document, needs_extraction); extraction is only needed the first
+    time a digest is seen, or to retry one that failed or stalled.
+    """
+    document = Document.query.filter_by(chat_id=chat_id, blob_digest=digest).first()
+    if document:
+        return document, False
+
+    blob, created = acquire_blob(digest, ext, size, doc_type)
+    needs_extraction = created or claim_extraction(digest)
+
+    document = Document(id=uuid.uuid4().hex, chat_id=chat_id, blob_digest=digest, file_name=file_name)
+    db.session.add(document)
+    db.session.commit()
+    return document, needs_extraction
+
+
+def _result_chunks(result: dict):
+    """Chunks of an extraction result, read line by line when they were spooled."""
+    if 'chunk_file' not in result:
+        yield from result['chunks']
+        return
+    with open(result['chunk_file'], encoding='utf-8') as spool:
+        for line in spool:
+            yield json.loads(line)
+
+
+def _record_pdf_stats(stats: dict):
+    # Extraction runs in a worker process, so its timings are recorded here
+    if stats.get('page_ms'):
+        metrics.incr('ingest.pdf_pages', stats['pages'])
+        metrics.observe('ingest.pdf_ms', sum(stats['page_ms']))
+        metrics.observe('ingest.pdf_slowest_page_ms', max(stats['page_ms']))
+    if stats.get('truncated'):
+        metrics.incr('ingest.pdf_truncated')
+
+
+def save_extraction(digest: str, result: dict):
+    """Cache the output of extraction.extract_file under the blob's digest.
+
+    Chunk rows are inserted INGEST_CHUNK_BATCH at a time, so a large
+    document never has all of its chunks in memory at once.
+    """
+    try:
+        blob = db.session.get(Blob, digest)
+        if not blob:
+            return None
+        # A retried extraction replaces whatever an earlier attempt left
+        DocumentChunk.query.filter_by(blob_digest=digest).delete(synchronize_session=False)
+        chunk_count = 0
+        batch = []
+        for chunk in _result_chunks(result):
+            batch.append({'blob_digest': digest, 'chunk_index': chunk_count, 'content': chunk})
+            chunk_count += 1
+            if len(batch) >= INGEST_CHUNK_BATCH:
+                db.session.execute(insert(DocumentChunk), batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(DocumentChunk), batch)
+        blob.payload = result.get('payload')
+        blob.json_index = result.get('json_index')
+        blob.chunk_count = chunk_count
+        blob.char_count = result['char_count']
+        blob.stats = json.dumps(result['stats']) if result.get('stats') else None
+        blob.status = 'ready'
+        blob.progress = 100
+        db.session.commit()
+    finally:
+        if result.get('chunk_file') and os.path.exists(result['chunk_file']):
+            os.remove(result['chunk_file'])
+    if result.get('stats'):
+        _record_pdf_stats(result['stats'])
+    # Answers cached before the text was indexed no longer reflect the files
+    for (chat_id,) in db.session.query(Document.chat_id).filter_by(blob_digest=digest).distinct():
+        response_cache.invalidate(chat_id)
+    return blob
+
+
+def json_index_for(digest: str):
+    """The parsed path index of a JSON blob, or None until it is extracted.
+
+    A digest's bytes never change, so parsed indexes are kept in a small
+    LRU instead of decoding json_index for every question.
+    """
+    with _json_indexes_lock:
+        index = _json_indexes.get(digest)
+        if index is not None:
+            _json_indexes.move_to_end(digest)
+            return index
+    blob = db.session.get(Blob, digest)
+    if not blob or not blob.json_index:
+        return None
+    index = JsonPathIndex.from_dict(blob.payload, json.loads(blob.json_index))
+    with _json_indexes_lock:
+        _json_indexes[digest] = index
+        while len(_json_indexes) > JSON_INDEX_CACHE_SIZE:
+            _json_indexes.popitem(last=False)
+    return index
+
+
+def mark_failed(digest: str, error: str):
+    blob = db.session.get(Blob, digest)
+    if blob:
+        blob.status = 'failed'
+        blob.error = error
+        db.session.commit()
+
+
+def _match_expression(digests: list, question: str) -> str:
+    """Any term may match, but only inside chunks of the given blobs.
+
+    The digest filter narrows the candidates inside FTS5; the query still
+    joins on document.chat_id, so the scope does not rely on it alone.
+    """
+    terms = list(dict.fromkeys(tokenize(question)))
+    if not terms or not digests:
+        return ""
+    scope = " OR ".join(f'"{d}"' for d in digests)
+    return f'blob_digest:({scope}) AND content:(' + " OR ".join(f'"{t}"' for t in terms) + ')'
+
+
+def search_chunks(chat_id: str, question: str, top_k: int = RETRIEVAL_TOP_K) -> list:
+    """Best matching chunks for a chat as (file_name, chunk_index, content)."""
+    if not tokenize(question):
+        return []
+
+    if fts5_ready():
+        digests = [row.blob_digest for row in
+                   db.session.query(Document.blob_digest).filter_by(chat_id=chat_id).distinct()]
+        expression = _match_expression(digests, question)
+        if not expression:
+            return []
+        rows = db.session.execute(text("""
+            SELECT d.file_name, c.chunk_index, c.content
+            FROM document_chunk_fts
+            JOIN document_chunk c ON c.id = document_chunk_fts.rowid
+            JOIN document d ON d.blob_digest = c.blob_digest
+            WHERE document_chunk_fts MATCH :expression AND d.chat_id = :chat_id
+            ORDER BY bm25(document_chunk_fts)
+            LIMIT :limit
+        """), {'expression': expression, 'chat_id': chat_id, 'limit': top_k})
+        return [tuple(row) for row in rows]
+
+    # No FTS5 in this SQLite build: score the chat's chunks in memory
+    chunks = (db.session.query(Document.file_name, DocumentChunk.chunk_index, DocumentChunk.content)
+              .join(Document, Document.blob_digest == DocumentChunk.blob_digest)
+              .filter(Document.chat_id == chat_id).all())
+    index = BM25Index.from_chunks([row.content for row in chunks])
+    return [tuple(chunks[idx]) for _, idx in index.search(question, top_k)]
+
+
+def first_chunks(document_ids: list) -> list:
+    """Opening chunk of each document as (file_name, content), for previews."""
+    if not document_ids:
+        return []
+    rows = (db.session.query(Document.file_name, DocumentChunk.content)
+            .join(Document, Document.blob_digest == DocumentChunk.blob_digest)
+            .filter(Document.id.in_(document_ids), DocumentChunk.chunk_index == 0)
+            .all())
+    return [tuple(row) for row in rows]
+
+
+def delete_chat_documents(chat_id: str):
+    """Detach every document from a chat, freeing blobs nobody else uses.
+
+    Commits, since unreferenced files are only removed after the commit.
+    """
+    orphaned = []
+    for document in Document.query.filter_by(chat_id=chat_id).all():
+        orphaned.extend(release_blob(document.blob_digest))
+        db.session.delete(document)
+    db.session.commit()
+    response_cache.invalidate(chat_id)
+    for path in orphaned:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,82 @@
+"""Pure file extraction used by the ingestion workers.
+
+Nothing in here touches Flask or the database so it can run in a separate
+process; the parent persists the returned result.
+"""
+import json
+import os
+import tempfile
+from .pdf_utils import iter_pdf_pages
+from .retrieval import chunk_text, iter_chunks
+from .json_index import JsonPathIndex
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp'}
+
+
+def doc_type_for(file_name: str) -> str | None:
+    """Document type for a file name, or None for attachments we don't index."""
+    ext = os.path.splitext(file_name)[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        return None
+    if ext == '.pdf':
+        return 'pdf'
+    if ext == '.json':
+        return 'json'
+    return 'text'
+
+
+def extract_file(file_path: str, doc_type: str) -> dict:
+    """Extract, chunk and index one file."""
+    if doc_type == 'json':
+        with open(file_path, 'r', encoding='utf-8') as f:
+            index = JsonPathIndex.build(json.load(f))
+        return {
+            'chunks': [],
+            'char_count': len(index.compact),
+            'payload': index.compact,
+            'json_index': json.dumps(index.to_dict(), separators=(',', ':'))
+        }
+
+    if doc_type == 'pdf':
+        return extract_pdf(file_path)
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    return {
+        'chunks': chunk_text(content),
+        'char_count': len(content)
+    }
+
+
+def extract_pdf(file_path: str) -> dict:
+    """Chunk a PDF page by page, spooling chunks to a temp file as they are made.
+
+    Only one page and one chunk are in memory at a time. The result carries
+    the spool's path rather than the chunks, and the parent loads it in
+    batches (document_store.save_extraction), which also removes it.
+    """
+    stats = {}
+    char_count = 0
+
+    def pages():
+        nonlocal char_count
+        for text in iter_pdf_pages(file_path, stats=stats):
+            char_count += len(text)
+            yield text
+
+    fd, chunk_file = tempfile.mkstemp(prefix='pdf-', suffix='.chunks')
+    chunk_count = 0
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as spool:
+            for chunk in iter_chunks(pages()):
+                spool.write(json.dumps(chunk) + '\n')
+                chunk_count += 1
+    except Exception:
+        os.remove(chunk_file)
+        raise
+    return {
+        'chunk_file': chunk_file,
+        'chunk_count': chunk_count,
+        'char_count': char_count,
+        'stats': stats
+    }
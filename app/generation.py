@@ -0,0 +1,204 @@
+import json
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from .chat_memory import ChatMemoryManager
+from .langchain_client import langchain_client
+from .limiter import ollama_limiter, OllamaBusy
+from .metrics import metrics
+from .token_bus import get_token_bus
+from .config import GENERATION_WORKER_THREADS, GENERATION_MAX_QUEUE, OLLAMA_MAX_CONCURRENCY, SSE_FLUSH_MS, SSE_FLUSH_BYTES
+
+CANCEL_CHECK_EVERY = 16  # chunks between cancellation checks
+
+
+
+class DeltaCoalescer:
+    """Joins stream deltas so one SSE frame carries many tokens.
+
+    The first delta goes out at once so time to first token is unchanged;
+    after that, deltas are held until window_ms has passed since the last
+    flush or max_bytes are waiting. A reader waiting for the next delta
+    should wait at most timeout() and flush() if nothing came, so a pause
+    in the model's output does not hold text back; flush() also ends the
+    stream.
+    """
+
+    def __init__(self, window_ms=SSE_FLUSH_MS, max_bytes=SSE_FLUSH_BYTES, clock=time.monotonic):
+        self.window = window_ms / 1000
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self._parts = []
+        self._size = 0
+        self._last_flush = None
+
+    def add(self, delta):
+        """The text to send now, or None while it is still buffering."""
+        self._parts.append(delta)
+        self._size += len(delta.encode('utf-8'))
+        if (self._last_flush is None or self._size >= self.max_bytes
+                or self.clock() - self._last_flush >= self.window):
+            return self.flush()
+        return None
+
+    def timeout(self):
+        """Seconds until buffered text is due, or None when nothing is buffered."""
+        if not self._parts:
+            return None
+        return max(0.0, self._last_flush + self.window - self.clock())
+
+    def flush(self):
+        if not self._parts:
+            return None
+        self._last_flush = self.clock()
+        text = "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        return text
+
+
+def record_stream(frames, size):
+    """Per-response SSE frame and byte counts."""
+    metrics.incr('sse.responses')
+    metrics.incr('sse.frames', frames)
+    metrics.incr('sse.bytes', size)
+    metrics.observe('sse.frames_per_response', frames)
+    metrics.observe('sse.bytes_per_response', size)
+
+
+_executor = None
+_executor_pid = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=GENERATION_WORKER_THREADS, thread_name_prefix='generation')
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def run_generation(job, slot=None):
+    """Generate one answer, publishing every chunk to the job's token stream.
+
+    Runs under an app context but without a request: the plan already holds
+    the prompt. The answer is saved before 'done' is published, so a client
+    that reloads the history afterwards always finds it.
+    """
+    bus = get_token_bus()
+    request_id = job['request_id']
+    parts = []
+    try:
+        slot = slot or ollama_limiter.slot(job['model'])
+        with slot:
+            chunks = langchain_client.stream_plan(job['plan'])
+            for i, chunk in enumerate(chunks, 1):
+                parts.append(chunk)
+                bus.publish(request_id, {'delta': chunk})
+                if i % CANCEL_CHECK_EVERY == 0 and bus.cancelled(request_id):
+                    chunks.close()
+                    metrics.incr('generation.cancelled')
+                    break
+        reply = "".join(parts).strip()
+    except Exception as e:
+        reply = f"AI stream error: {e}"
+        bus.publish(request_id, {'delta': reply})
+    if reply:
+        ChatMemoryManager.persist_message(job['chat_id'], {
+            "role": "assistant", "content": reply, "client_key": job.get('reply_key')
+        })
+    bus.publish(request_id, {'done': True})
+
+
+def reserve_generation(model):
+    """Admission for a new generation; raises OllamaBusy when it would only queue.
+
+    In-process workers share this process's limiter, so the slot is taken
+    here and handed to the worker. Worker processes hold their own slots,
+    so the web side only checks how many jobs are already waiting in Redis
+    and returns None.
+    """
+    bus = get_token_bus()
+    if bus.is_local:
+        return ollama_limiter.slot(model)
+    queued = bus.queued_jobs()
+    if queued >= GENERATION_MAX_QUEUE:
+        metrics.incr(f'ollama.rejected.{model}')
+        raise OllamaBusy(model, max(1, math.ceil(queued / OLLAMA_MAX_CONCURRENCY)))
+    return None
+
+
+def dispatch_generation(job, slot=None):
+    """Hand a job to a generation worker: a local thread, or a worker process via Redis."""
+    bus = get_token_bus()
+    bus.open(job['request_id'], job['owner'])
+    bus.publish(job['request_id'], {'request_id': job['request_id']})
+    metrics.incr('generation.dispatched')
+    if not bus.is_local:
+        bus.push_job(job)
+        return
+
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            run_generation(job, slot)
+
+    _get_executor().submit(run)
+
+
+def relay_events(request_id, last_event_id=None, idle_timeout=120):
+    """SSE frames for a generation, starting after last_event_id.
+
+    Only reads the token stream, so any web process can serve it and a
+    reconnecting client resumes without regenerating anything. Deltas are
+    joined by a DeltaCoalescer; a joined frame carries the id of its last
+    delta, so Last-Event-ID still points at the right place to resume.
+    """
+    bus = get_token_bus()
+    coalescer = DeltaCoalescer()
+    after = last_event_id
+    buffered_id = None  # id of the newest delta still in the coalescer
+    idle = 0.0
+    frames = size = 0
+
+    def frame(event_id, event):
+        nonlocal frames, size
+        text = f"id: {event_id}\ndata: {json.dumps(event)}\n\n"
+        frames += 1
+        size += len(text.encode('utf-8'))
+        return text
+
+    try:
+        while True:
+            due = coalescer.timeout()
+            events = bus.read(request_id, after, timeout=15.0 if due is None else due)
+            if not events:
+                if due is not None:
+                    # The model paused; send what is buffered instead of waiting for more
+                    yield frame(buffered_id, {'delta': coalescer.flush()})
+                    continue
+                idle += 15.0
+                if idle >= idle_timeout:
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            idle = 0.0
+            for event_id, event in events:
+                after = event_id
+                if 'delta' in event:
+                    buffered_id = event_id
+                    text = coalescer.add(event['delta'])
+                    if text:
+                        yield frame(event_id, {'delta': text})
+                    continue
+                text = coalescer.flush()
+                if text:
+                    yield frame(buffered_id, {'delta': text})
+                yield frame(event_id, event)
+                if event.get('done'):
+                    return
+    finally:
+        record_stream(frames, size)
@@ -0,0 +1,47 @@
+"""Generation worker process for the Redis Streams token bus.
+
+    GENERATION_REDIS_URL=redis://localhost:6379 python -m app.generation_worker
+
+Pops jobs queued by the web processes and runs them on a thread pool. A job
+is only popped once this process's Ollama limiter has a free slot, so jobs
+wait in Redis (where /stream can see the backlog and answer 429) rather
+than in the pool's queue.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from . import create_app
+from .generation import run_generation
+from .limiter import ollama_limiter, OllamaBusy
+from .token_bus import get_token_bus
+from .config import GENERATION_WORKER_THREADS, OLLAMA_MODEL
+
+
+def main():
+    app = create_app()
+    bus = get_token_bus()
+    if bus.is_local:
+        raise SystemExit("GENERATION_REDIS_URL is not set; generation runs inside the web process")
+
+    def run(job, slot):
+        with app.app_context():
+            try:
+                run_generation(job, slot)
+            except Exception as e:
+                slot.release()
+                print(f"Generation {job.get('request_id')} failed: {e}")
+
+    print(f"✅ Generation worker running {GENERATION_WORKER_THREADS} threads")
+    with ThreadPoolExecutor(max_workers=GENERATION_WORKER_THREADS) as pool:
+        while True:
+            try:
+                slot = ollama_limiter.slot(OLLAMA_MODEL)
+            except OllamaBusy:
+                continue  # every slot still busy after the queue timeout
+            job = bus.pop_job()
+            if job:
+                pool.submit(run, job, slot)
+            else:
+                slot.release()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,16 @@
-import os, json, requests
+import json, requests
 from urllib.parse import urlparse
-from flask import request, session, current_app
-from .pdf_utils import extract_pdf_text
-from .config import UPLOAD_DIR
+from flask import request, session
+from .config import RETRIEVAL_TOP_K, OLLAMA_MODEL
+from .document_store import attach_document, search_chunks, first_chunks, json_index_for
+from .blob_store import save_bytes
+from .ingest import submit_ingestion
+from .models import db, Document
+from .response_cache import response_cache
+from .token_budget import assemble_prompt
 from datetime import datetime
 from .chat_memory import ChatMemoryManager
+from .session_manager import ChatSessionManager
 
 def get_memory_context():
     """Get formatted memory context for AI - only persistent info, not conversation topics"""
@@ -79,179 +85,70 @@ def is_local_url(url: str) -> bool:
         return False
 
 
-def _tokenize_query_for_json(query: str) -> list:
-    q = query.lower()
-    # basic tokenization: words of length >= 3
-    tokens = [t.strip(".,:;!?()[]{}\"'`)\n\t ") for t in q.split()]
-    tokens = [t for t in tokens if len(t) >= 3]
-    return list(dict.fromkeys(tokens))
+def register_file_in_memory(file_name: str, digest: str, ext: str, size: int, doc_type: str):
+    """Attach a stored upload to the active chat.
 
-
-def _search_json_relevant_slices(data, query: str, max_hits: int = 6, max_chars_per_hit: int = 800):
-    """Traverse JSON and pick small relevant slices based on query tokens."""
-    tokens = _tokenize_query_for_json(query)
-    hits = []
-
-    def add_hit(path, snippet):
-        if len(hits) >= max_hits:
-            return
-        try:
-            text = json.dumps(snippet, ensure_ascii=False)
-        except Exception:
-            text = str(snippet)
-        hits.append({
-            "path": "/" + "/".join(map(str, path)),
-            "json": (text[:max_chars_per_hit] + ("..." if len(text) > max_chars_per_hit else ""))
-        })
-
-    def traverse(node, path):
-        if len(hits) >= max_hits:
-            return
-        # Match at dict level
-        if isinstance(node, dict):
-            # key or value contains token
-            for k, v in node.items():
-                key_match = any(t in str(k).lower() for t in tokens)
-                val_str = None
-                if isinstance(v, (str, int, float)):
-                    val_str = str(v).lower()
-                elif isinstance(v, (dict, list)):
-                    # For nested, we still traverse but also check stringified for quick match
-                    try:
-                        val_str = json.dumps(v, ensure_ascii=False)[:3000].lower()
-                    except Exception:
-                        val_str = str(v).lower()
-                else:
-                    val_str = str(v).lower()
-                val_match = any(t in val_str for t in tokens) if val_str else False
-                if key_match or val_match:
-                    add_hit(path + [k], v)
-                traverse(v, path + [k])
-        elif isinstance(node, list):
-            for i, item in enumerate(node):
-                if len(hits) >= max_hits:
-                    break
-                # Quick match on item string
-                try:
-                    item_str = json.dumps(item, ensure_ascii=False)[:1500].lower()
-                except Exception:
-                    item_str = str(item).lower()
-                if any(t in item_str for t in tokens):
-                    add_hit(path + [i], item)
-                traverse(item, path + [i])
-        else:
-            # primitive
-            return
-
-    traverse(data, [])
-
-    if not hits and isinstance(data, (dict, list)):
-        # fallback: top-level preview
-        add_hit([], data)
-    return hits
-
-
-def extract_file_content_to_memory(file_path: str):
-    try:
-        lower = file_path.lower()
-        file_name = os.path.basename(file_path)
-        
-        # Get current memory for the active chat
-        memory = ChatMemoryManager.get_active_chat_memory()
-        if "files" not in memory:
-            memory["files"] = {}
-        
-        file_data = {}
-        if lower.endswith('.pdf'):
-            pdf_text = extract_pdf_text(file_path)
-            file_data = {
-                "type": "pdf",
-                "content": pdf_text,
-                "uploaded_at": str(datetime.now())
-            }
-        elif lower.endswith('.json'):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                parsed = json.load(f)
-            pretty = json.dumps(parsed, ensure_ascii=False, indent=2)
-            file_data = {
-                "type": "json",
-                "content": pretty,
-                "json": parsed,
-                "uploaded_at": str(datetime.now())
-            }
-        else:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            file_data = {
-                "type": "text",
-                "content": content,
-                "uploaded_at": str(datetime.now())
-            }
-        
-        memory["files"][file_name] = file_data
-        ChatMemoryManager.update_active_chat_memory("files", memory["files"])
-        
-        return f"Successfully read and stored {file_data['type']} content: {file_name}"
-    except Exception as e:
-        return f"Error reading file: {str(e)}"
+    Returns (document, needs_extraction). The content is filled in by the
+    ingestion worker; the chat memory only keeps a small handle.
+    """
+    chat_id = ChatMemoryManager.get_or_create_active_chat_id()
+    memory = ChatMemoryManager.get_active_chat_memory()
+    if "files" not in memory:
+        memory["files"] = {}
+    
+    document, needs_extraction = attach_document(chat_id, file_name, digest, ext, size, doc_type)
+    memory["files"][file_name] = document.to_handle()
+    ChatMemoryManager.update_active_chat_memory("files", memory["files"])
+    response_cache.invalidate(chat_id)
+    return document, needs_extraction
 
 
-def get_file_context_for_question(question: str):
+def get_file_context_sections(question: str, top_k: int = RETRIEVAL_TOP_K) -> list:
+    """Retrieved file excerpts for a question, best first."""
     memory = ChatMemoryManager.get_active_chat_memory()
     if "files" not in memory or not memory["files"]:
-        return ""
+        return []
     
     relevant_content = []
     question_lower = question.lower()
+    text_document_ids = []
     
     for file_name, file_info in memory["files"].items():
-        content = file_info["content"]
-        ftype = file_info.get("type")
+        if "document_id" not in file_info:
+            continue
+        if file_info.get("type") != "json":
+            text_document_ids.append(file_info["document_id"])
+            continue
         
-        if ftype == "json" and isinstance(file_info.get("json"), (dict, list)):
-            slices = _search_json_relevant_slices(file_info["json"], question_lower)
-            if slices:
-                for s in slices:
-                    relevant_content.append(f"[Relevant JSON from {file_name} at {s['path']}]:\n{s['json']}")
-            else:
-                relevant_content.append(f"[Available JSON from {file_name}]:\n{content[:1500]}...")
+        document = db.session.get(Document, file_info["document_id"])
+        index = json_index_for(document.blob_digest) if document else None
+        if not index:
+            continue
+        for s in index.search(question_lower):
+            relevant_content.append(f"[Relevant JSON from {file_name} at {s['path']}]:\n{s['json']}")
+    
+    if text_document_ids:
+        chat_id = ChatSessionManager.get_active_chat_id(session.get('user_id', 'guest'))
+        hits = search_chunks(chat_id, question, top_k)
+        if hits:
+            for file_name, idx, chunk in hits:
+                relevant_content.append(f"[Relevant Content from {file_name}, part {idx + 1}]:\n{chunk}")
         else:
-            if any(keyword in question_lower for keyword in content.lower().split()[:200]):
-                relevant_content.append(f"[Highly Relevant Content from {file_name}]:\n{content[:3000]}...")
-            else:
-                relevant_content.append(f"[Available Content from {file_name}]:\n{content[:1500]}...")
+            # Nothing matched - give the model a short look at each file instead
+            for file_name, chunk in first_chunks(text_document_ids):
+                relevant_content.append(f"[Beginning of {file_name}]:\n{chunk}")
     
-    return "\n\n".join(relevant_content) if relevant_content else ""
+    return relevant_content
 
 
 def build_ollama_content(user_msg: str, image_url: str | None = None, system_prompt: str | None = None) -> list:
-    messages = []
-    enhanced_prompt = system_prompt or ""
-    
-    relevant_contexts = []
-    
-    file_context = get_file_context_for_question(user_msg)
-    if file_context:
-        relevant_contexts.append(file_context)
-    
-    api_context = get_api_context_for_question(user_msg)
-    if api_context:
-        relevant_contexts.append(api_context)
-    
-    memory_context = get_memory_context()
-    if memory_context and len(memory_context) < 1000:
-        relevant_contexts.append(memory_context)
-    
-    if relevant_contexts:
-        combined_context = "\n\n".join(relevant_contexts)
-        enhanced_prompt += f"\n\n{combined_context}"
-    
-    if enhanced_prompt:
-        messages.append({"role": "system", "content": enhanced_prompt})
-    
-    messages.append({"role": "user", "content": user_msg})
-    
-    return messages
+    return assemble_prompt(
+        OLLAMA_MODEL,
+        system_prompt or "",
+        user_msg,
+        memory=get_memory_context(),
+        retrieved=get_file_context_sections(user_msg) + get_api_context_sections(user_msg)
+    )
 
 
 def teach_ai(lesson: str):
@@ -338,57 +235,90 @@ def fetch_api_data(api_url: str, api_key: str = None, headers: dict = None):
 
 
 def store_api_data(api_url: str, api_data: dict, api_key: str = None):
+    """Save fetched API data as a chat document, like an uploaded file.
+
+    The session only keeps a handle; JSON is indexed by the ingestion
+    worker and searched through the shared path index cache.
+    """
     try:
+        chat_id = ChatMemoryManager.get_or_create_active_chat_id()
         memory = ChatMemoryManager.get_active_chat_memory()
         if "apis" not in memory:
             memory["apis"] = {}
         
         api_key_name = f"api_{len(memory.get('apis', {})) + 1}"
         
+        if isinstance(api_data, (dict, list)):
+            body, ext, doc_type = json.dumps(api_data, separators=(',', ':')).encode(), '.json', 'json'
+        else:
+            body, ext, doc_type = str(api_data).encode(), '.txt', 'text'
+        digest, size, dest = save_bytes(body, ext)
+        document, needs_extraction = attach_document(chat_id, api_url[:255], digest, ext, size, doc_type)
+        if needs_extraction:
+            submit_ingestion(digest, str(dest), doc_type)
+        
         memory["apis"][api_key_name] = {
             "url": api_url,
-            "data": api_data,
             "fetched_at": str(datetime.now()),
-            "api_key_provided": bool(api_key)
+            "api_key_provided": bool(api_key),
+            **document.to_handle()
         }
-        
         ChatMemoryManager.update_active_chat_memory("apis", memory["apis"])
+        response_cache.invalidate(chat_id)
         
         return f"Successfully fetched and stored data from API: {api_url}"
         
     except Exception as e:
+        db.session.rollback()
         return f"Error storing API data: {str(e)}"
 
 
-def get_api_context_for_question(question: str):
+def get_api_context_sections(question: str) -> list:
+    """Relevant slices of the chat's stored API data, one section per hit."""
     memory = ChatMemoryManager.get_active_chat_memory()
     if "apis" not in memory or not memory["apis"]:
-        return ""
+        return []
     
     relevant_content = []
     question_lower = question.lower()
     
+    text_document_ids = []
     for api_key, api_info in memory["apis"].items():
-        api_data = api_info["data"]
+        if "document_id" not in api_info:
+            continue  # stored in the session before API data moved to documents
         api_url = api_info["url"]
+        if api_info.get("type") != "json":
+            text_document_ids.append(api_info["document_id"])
+            continue
         
-        if isinstance(api_data, (dict, list)):
-            slices = _search_json_relevant_slices(api_data, question_lower)
-            if slices:
-                for s in slices:
-                    relevant_content.append(f"[Relevant API JSON from {api_url} at {s['path']}]:\n{s['json']}")
-            else:
-                preview = json.dumps(api_data, ensure_ascii=False)[:1500]
-                relevant_content.append(f"[Available API JSON from {api_url}]:\n{preview}...")
-        else:
-            data_str = str(api_data)
-            if any(keyword in question_lower for keyword in data_str.lower().split()[:200]):
-                relevant_content.append(f"[Highly Relevant API Data from {api_url}]:\n{data_str[:3000]}...")
-            else:
-                relevant_content.append(f"[Available API Data from {api_url}]:\n{data_str[:1500]}...")
+        document = db.session.get(Document, api_info["document_id"])
+        index = json_index_for(document.blob_digest) if document else None
+        if not index:
+            continue
+        for s in index.search(question_lower):
+            relevant_content.append(f"[Relevant API JSON from {api_url} at {s['path']}]:\n{s['json']}")
+    
+    for api_url, chunk in first_chunks(text_document_ids):
+        relevant_content.append(f"[Available API Data from {api_url}]:\n{chunk}")
     
-    return "\n\n".join(relevant_content) if relevant_content else ""
+    return relevant_content
+
 
+def get_context_sources():
+    """Identity of everything attached to the active chat, for cache scoping.
+
+    Files are named by digest and status so the scope changes when an
+    upload finishes indexing; API data by URL and fetch time.
+    """
+    memory = ChatMemoryManager.get_active_chat_memory()
+    sources = []
+    document_ids = [f["document_id"] for f in memory.get("files", {}).values() if "document_id" in f]
+    if document_ids:
+        for document in Document.query.filter(Document.id.in_(document_ids)).all():
+            sources.append(f"file:{document.blob_digest}:{document.blob.status}")
+    for api_info in memory.get("apis", {}).values():
+        sources.append(f"api:{api_info['url']}@{api_info.get('fetched_at', '')}")
+    return sources
 
 def extract_api_command(user_msg: str):
     """Extract API commands from user message"""
@@ -0,0 +1,47 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+from .models import db
+from .extraction import extract_file
+from .document_store import save_extraction, mark_failed
+
+_executor = None
+_executor_pid = None
+
+
+def get_executor(max_workers: int) -> ProcessPoolExecutor:
+    """Per-process pool; a forked gunicorn worker builds its own."""
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def _persist(digest, get_result):
+    try:
+        save_extraction(digest, get_result())
+    except Exception as e:
+        print(f"Ingestion failed for blob {digest}: {e}")
+        db.session.rollback()
+        mark_failed(digest, str(e))
+
+
+def submit_ingestion(digest: str, file_path: str, doc_type: str):
+    """Extract and index an uploaded file off the request path.
+
+    With INGEST_WORKERS set to 0 the work runs inline, which keeps tests and
+    single-process debugging simple.
+    """
+    app = current_app._get_current_object()
+    workers = app.config.get('INGEST_WORKERS', 0)
+    if workers <= 0:
+        _persist(digest, lambda: extract_file(file_path, doc_type))
+        return
+
+    def on_done(future):
+        with app.app_context():
+            _persist(digest, future.result)
+
+    get_executor(workers).submit(extract_file, file_path, doc_type).add_done_callback(on_done)
@@ -0,0 +1,98 @@
+import json
+from .retrieval import tokenize
+
+
+class JsonPathIndex:
+    """Flattened path -> token index over one compact JSON serialization.
+
+    Every node records its path (``/a/b/3/c``), its parent and the
+    ``[start, end)`` offsets of its text in ``compact``, so a lookup only
+    touches the postings of the query terms and slices the matching spans.
+    """
+
+    def __init__(self, compact, nodes, postings):
+        self.compact = compact
+        self.nodes = nodes  # [path, start, end, parent_id, is_container]
+        self.postings = postings  # token -> [node_id, ...]
+
+    @classmethod
+    def build(cls, data):
+        parts = []
+        nodes = []
+        postings = {}
+        pos = 0
+
+        def emit(s):
+            nonlocal pos
+            parts.append(s)
+            pos += len(s)
+
+        def walk(node, path, parent_id, key_tokens):
+            node_id = len(nodes)
+            is_container = isinstance(node, (dict, list))
+            nodes.append([path or "/", pos, 0, parent_id, is_container])
+            tokens = set(key_tokens)
+            if isinstance(node, dict):
+                emit("{")
+                for i, (k, v) in enumerate(node.items()):
+                    if i:
+                        emit(",")
+                    emit(json.dumps(str(k), ensure_ascii=False))
+                    emit(":")
+                    walk(v, f"{path}/{k}", node_id, tokenize(str(k)))
+                emit("}")
+            elif isinstance(node, list):
+                emit("[")
+                for i, item in enumerate(node):
+                    if i:
+                        emit(",")
+                    walk(item, f"{path}/{i}", node_id, ())
+                emit("]")
+            else:
+                emit(json.dumps(node, ensure_ascii=False))
+                if isinstance(node, str) or (isinstance(node, (int, float)) and not isinstance(node, bool)):
+                    tokens.update(tokenize(str(node)))
+            nodes[node_id][2] = pos
+            for token in tokens:
+                postings.setdefault(token, []).append(node_id)
+
+        walk(data, "", None, ())
+        return cls("".join(parts), nodes, postings)
+
+    def search(self, query: str, max_hits: int = 6, max_chars_per_hit: int = 800) -> list:
+        """Pick small relevant slices as [{"path": ..., "json": ...}, ...]."""
+        scores = {}
+        for token in set(tokenize(query)):
+            for node_id in self.postings.get(token, ()):
+                _, _, _, parent_id, is_container = self.nodes[node_id]
+                # A matching leaf is reported with its enclosing object
+                hit_id = node_id if is_container or parent_id is None else parent_id
+                scores[hit_id] = scores.get(hit_id, 0) + 1
+
+        ranked = sorted(scores, key=lambda n: (-scores[n], self.nodes[n][1]))
+        hits, spans = [], []
+        for node_id in ranked:
+            path, start, end, _, _ = self.nodes[node_id]
+            if any(s <= start and end <= e for s, e in spans):
+                continue
+            spans.append((start, end))
+            hits.append(self._slice(path, start, end, max_chars_per_hit))
+            if len(hits) >= max_hits:
+                break
+
+        if not hits and self.nodes:
+            # fallback: top-level preview
+            hits.append(self._slice("/", 0, len(self.compact), max_chars_per_hit))
+        return hits
+
+    def _slice(self, path, start, end, max_chars):
+        text = self.compact[start:min(end, start + max_chars)]
+        return {"path": path, "json": text + ("..." if end - start > max_chars else "")}
+
+    def to_dict(self):
+        """Index without the serialization, which is stored separately."""
+        return {"nodes": self.nodes, "postings": self.postings}
+
+    @classmethod
+    def from_dict(cls, compact, data):
+        return cls(compact, data["nodes"], data["postings"])
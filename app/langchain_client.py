@@ -1,62 +1,181 @@
-import ollama
-from .config import OLLAMA_MODEL
-from .helpers import get_memory_context, get_file_context_for_question, get_api_context_for_question
+import re
+from .config import OLLAMA_MODEL, OLLAMA_KEEP_ALIVE
+from .openai_client import get_ollama_client, get_async_ollama_client
+from .response_cache import response_cache
+from .semantic_cache import semantic_cache
+from .conversation_state import conversation_state
+from .helpers import get_memory_context, get_file_context_sections, get_api_context_sections, get_context_sources
+from .token_budget import assemble_prompt, budget_for, estimate_tokens, truncate_to_tokens
+
+SYSTEM_PROMPT = "You are Neuro-Core, an advanced AI assistant."
+
+
+def render_turns(messages):
+    """Chat turns as one generate() prompt, so a full resend also returns context."""
+    if len(messages) == 1:
+        return messages[0]['content']
+    return "\n\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in messages)
+
 
 class LangChainClient:
     def __init__(self):
         self.model = OLLAMA_MODEL
         self.available = True
         try:
-            ollama.list()
+            get_ollama_client().list()
         except:
             self.available = False
     
-    def generate_response(self, user_message, chat_history=None, image_url=None):
+    def build_messages(self, user_message, chat_history=None, summary="", retrieved=None):
+        if retrieved is None:
+            retrieved = get_file_context_sections(user_message) + get_api_context_sections(user_message)
+        return assemble_prompt(
+            self.model,
+            SYSTEM_PROMPT,
+            user_message,
+            memory=get_memory_context(),
+            summary=summary,
+            history=chat_history or [],
+            retrieved=retrieved
+        )
+    
+    def _turn_prompt(self, user_message, retrieved, context_tokens):
+        """The new turn on top of resumed context, with this question's retrieved sections."""
+        room = budget_for(self.model) - len(context_tokens) - estimate_tokens(user_message)
+        sections = truncate_to_tokens("\n\n".join(retrieved), max(room, 0)) if retrieved else ""
+        return f"Context: {sections}\n\n{user_message}" if sections else user_message
+    
+    def lookup_cached(self, messages, user_message, chat_history=None, summary=""):
+        """Exact match first, then a paraphrase asked in the same context.
+        
+        Returns (cache_key, scope, answer); answer is None on a miss.
+        """
+        cache_key = response_cache.make_key(self.model, messages)
+        answer = response_cache.get(cache_key)
+        scope = None
+        if semantic_cache.enabled:
+            recent = [{"role": m["role"], "content": m["content"]} for m in chat_history or []]
+            scope = semantic_cache.fingerprint(self.model, get_memory_context() + summary, get_context_sources(), recent)
+            if answer is None:
+                answer = semantic_cache.lookup(scope, user_message)
+        return cache_key, scope, answer
+    
+    def remember(self, cache_key, scope, user_message, answer, chat_id=None):
+        response_cache.set(cache_key, answer, tags=[chat_id])
+        if scope:
+            semantic_cache.store(scope, user_message, answer)
+    
+    def generate_response(self, plan):
+        """The whole answer for a plan from prepare_stream, for callers that do not stream.
+        
+        Callers check plan['cached'] first, so a cache hit never waits for a
+        generation slot.
+        """
+        if plan['cached'] is not None:
+            return plan['cached']
         if not self.available:
             return "Ollama client not available"
         
         try:
-            context = f"{get_memory_context()}{get_file_context_for_question(user_message)}{get_api_context_for_question(user_message)}"
-            
-            messages = []
-            if context:
-                messages.append({"role": "system", "content": f"You are Neuro-Core, an advanced AI assistant. Context: {context}"})
-            else:
-                messages.append({"role": "system", "content": "You are Neuro-Core, an advanced AI assistant."})
-            
-            if chat_history:
-                for msg in chat_history[-5:]:  # Last 5 messages for context
-                    messages.append(msg)
-            
-            messages.append({"role": "user", "content": user_message})
-            
-            response = ollama.chat(model=self.model, messages=messages)
-            return response['message']['content']
+            return "".join(self.stream_plan(plan))
         except Exception as e:
             return f"Error: {str(e)}"
     
-    def generate_streaming_response(self, user_message, chat_history=None, image_url=None):
+    def prepare_stream(self, user_message, chat_history=None, chat_id=None, summary=""):
+        """Everything a streamed answer needs from the request, gathered up front.
+        
+        The returned plan holds plain data only, so stream_plan/astream_plan
+        can run it later without a Flask request or session. Saved context
+        is looked up when the plan runs, in the process that will save it.
+        """
+        retrieved = get_file_context_sections(user_message) + get_api_context_sections(user_message)
+        messages = self.build_messages(user_message, chat_history, summary, retrieved)
+        cache_key, scope, cached = self.lookup_cached(messages, user_message, chat_history, summary)
+        # Retrieved sections change with every question, so saved context is
+        # keyed on the parts of the system prompt that carry over between turns
+        state_key = "\n".join([SYSTEM_PROMPT, get_memory_context(), summary])
+        return {
+            'messages': messages,
+            'retrieved': retrieved,
+            'user_message': user_message,
+            'chat_id': chat_id,
+            'cache_key': cache_key,
+            'scope': scope,
+            'cached': cached,
+            'state_key': state_key,
+            # Continue from the model's own context, or resend and keep the new one
+            'use_context': bool(chat_id)
+        }
+    
+    def _generate_kwargs(self, plan):
+        """generate() arguments, continuing from the chat's saved context when it still matches."""
+        messages = plan['messages']
+        context_tokens = conversation_state.resume(plan['chat_id'], plan['state_key'], messages[1:-1])
+        if context_tokens is not None:
+            prompt = self._turn_prompt(plan['user_message'], plan['retrieved'], context_tokens)
+        else:
+            prompt = render_turns(messages[1:])
+        return dict(
+            model=self.model, prompt=prompt,
+            system=None if context_tokens else messages[0]['content'], context=context_tokens,
+            stream=True, keep_alive=OLLAMA_KEEP_ALIVE
+        )
+    
+    def _finish_plan(self, plan, text, new_context=None):
+        if plan['use_context']:
+            conversation_state.save(plan['chat_id'], plan['state_key'], plan['user_message'], text, new_context)
+        self.remember(plan['cache_key'], plan['scope'], plan['user_message'], text, plan['chat_id'])
+    
+    def stream_plan(self, plan):
+        if plan['cached'] is not None:
+            yield plan['cached']
+            return
+        
+        parts = []
+        new_context = None
+        if plan['use_context']:
+            for chunk in get_ollama_client().generate(**self._generate_kwargs(plan)):
+                if chunk['response']:
+                    parts.append(chunk['response'])
+                    yield chunk['response']
+                if chunk['done']:
+                    new_context = chunk['context']
+        else:
+            for chunk in get_ollama_client().chat(model=self.model, messages=plan['messages'], stream=True, keep_alive=OLLAMA_KEEP_ALIVE):
+                parts.append(chunk['message']['content'])
+                yield chunk['message']['content']
+        self._finish_plan(plan, "".join(parts), new_context)
+    
+    async def astream_plan(self, plan):
+        """stream_plan on the asyncio Ollama client, for the ASGI entry point."""
+        if plan['cached'] is not None:
+            yield plan['cached']
+            return
+        
+        parts = []
+        new_context = None
+        client = get_async_ollama_client()
+        if plan['use_context']:
+            async for chunk in await client.generate(**self._generate_kwargs(plan)):
+                if chunk['response']:
+                    parts.append(chunk['response'])
+                    yield chunk['response']
+                if chunk['done']:
+                    new_context = chunk['context']
+        else:
+            async for chunk in await client.chat(model=self.model, messages=plan['messages'], stream=True, keep_alive=OLLAMA_KEEP_ALIVE):
+                parts.append(chunk['message']['content'])
+                yield chunk['message']['content']
+        self._finish_plan(plan, "".join(parts), new_context)
+    
+    def generate_streaming_response(self, user_message, chat_history=None, image_url=None, chat_id=None, summary=""):
         if not self.available:
             yield "Ollama client not available"
             return
         
         try:
-            context = f"{get_memory_context()}{get_file_context_for_question(user_message)}{get_api_context_for_question(user_message)}"
-            
-            messages = []
-            if context:
-                messages.append({"role": "system", "content": f"You are Neuro-Core, an advanced AI assistant. Context: {context}"})
-            else:
-                messages.append({"role": "system", "content": "You are Neuro-Core, an advanced AI assistant."})
-            
-            if chat_history:
-                for msg in chat_history[-5:]:
-                    messages.append(msg)
-            
-            messages.append({"role": "user", "content": user_message})
-            
-            for chunk in ollama.chat(model=self.model, messages=messages, stream=True):
-                yield chunk['message']['content']
+            plan = self.prepare_stream(user_message, chat_history, chat_id, summary)
+            yield from self.stream_plan(plan)
         except Exception as e:
             yield f"Error: {str(e)}"
 
@@ -80,24 +199,72 @@ class LangChainClient:
             
             messages.append({"role": "user", "content": f"Generate a title for this conversation:\n\n{context_str}"})
             
-            response = ollama.chat(model=self.model, messages=messages)
-            title = response['message']['content'].strip()
+            cache_key = response_cache.make_key(self.model, messages)
+            title = response_cache.get(cache_key)
+            if title is not None:
+                return title
             
-            # Aggressive cleaning
-            import re
-            # Remove any markdown headers or bolding
-            title = re.sub(r'[#*`]', '', title)
-            # Remove common prefixes
-            title = re.sub(r'^(Title|Subject|Topic|Here is):?\s*', '', title, flags=re.IGNORECASE)
-            # Remove quotes
-            title = title.strip('"\'')
-            # Truncate if still too long (fallback)
-            if len(title) > 50:
-                title = title[:47] + "..."
+            response = get_ollama_client().chat(model=self.model, messages=messages)
+            title = clean_title(response['message']['content'])
             
+            response_cache.set(cache_key, title)
             return title
         except Exception as e:
             print(f"Error generating title: {e}")
             return "New Chat"
 
+    def generate_title_batch(self, conversations):
+        """Titles for several (first user message, first AI message) pairs in one call.
+        
+        Returns a list aligned with conversations; an entry is None when the
+        model's answer for it could not be parsed, so the caller can fall
+        back to generate_title for that chat.
+        """
+        if not self.available or not conversations:
+            return [None] * len(conversations)
+        
+        try:
+            numbered = "\n\n".join(
+                f"{i}. User: {user_msg[:200]}\n   AI: {ai_msg[:100]}"
+                for i, (user_msg, ai_msg) in enumerate(conversations, 1)
+            )
+            messages = [
+                {"role": "system", "content": TITLE_BATCH_PROMPT},
+                {"role": "user", "content": f"Generate a title for each of these conversations:\n\n{numbered}"}
+            ]
+            response = get_ollama_client().chat(model=self.model, messages=messages)
+            titles = [None] * len(conversations)
+            for line in response['message']['content'].splitlines():
+                match = re.match(r'^\s*(\d+)[.):\-]\s*(.+)$', line)
+                if match and 1 <= int(match.group(1)) <= len(conversations):
+                    titles[int(match.group(1)) - 1] = clean_title(match.group(2)) or None
+            return titles
+        except Exception as e:
+            print(f"Error generating titles: {e}")
+            return [None] * len(conversations)
+
+
+TITLE_BATCH_PROMPT = (
+    "You are a specialized title generator. For each numbered conversation, create a concise, "
+    "professional and descriptive title (max 5 words).\nRules:\n"
+    "1. Output one line per conversation in the form '<number>. <title>'.\n"
+    "2. Do NOT use quotes, markdown, or special characters.\n"
+    "3. Focus on the main topic or intent."
+)
+
+
+def clean_title(title):
+    """Aggressive cleaning of a model-written title"""
+    title = title.strip()
+    # Remove any markdown headers or bolding
+    title = re.sub(r'[#*`]', '', title)
+    # Remove common prefixes
+    title = re.sub(r'^(Title|Subject|Topic|Here is):?\s*', '', title, flags=re.IGNORECASE)
+    # Remove quotes
+    title = title.strip('"\'')
+    # Truncate if still too long (fallback)
+    if len(title) > 50:
+        title = title[:47] + "..."
+    return title
+
 langchain_client = LangChainClient()
\ No newline at end of file
@@ -0,0 +1,140 @@
+import math
+import threading
+import time
+from flask import jsonify
+from .metrics import metrics
+from .config import OLLAMA_MAX_CONCURRENCY, OLLAMA_MAX_QUEUE, OLLAMA_QUEUE_TIMEOUT, OLLAMA_MODEL_CONCURRENCY
+
+
+class OllamaBusy(Exception):
+    """Raised when a model's wait queue is full or the wait timed out."""
+
+    def __init__(self, model, retry_after):
+        super().__init__(f"{model} is busy")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class Slot:
+    """A held generation slot; release() is safe to call more than once."""
+
+    def __init__(self, gate):
+        self._gate = gate
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._gate.release(time.monotonic() - self._started)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ModelGate:
+    """Concurrency semaphore with a bounded wait queue for one model."""
+
+    def __init__(self, model, max_concurrency, max_queue, wait_timeout):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.wait_timeout = wait_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+
+    def acquire(self, blocking: bool = True) -> Slot:
+        started = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if not blocking or self.waiting >= self.max_queue:
+                    metrics.incr(f'ollama.rejected.{self.model}')
+                    raise OllamaBusy(self.model, self.retry_after())
+                self.waiting += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.wait_timeout)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+            if not acquired:
+                metrics.incr(f'ollama.timed_out.{self.model}')
+                raise OllamaBusy(self.model, self.retry_after())
+
+        with self._lock:
+            self.active += 1
+        metrics.observe(f'ollama.queue_wait_ms.{self.model}', (time.monotonic() - started) * 1000)
+        return Slot(self)
+
+    def release(self, held_seconds):
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
+        metrics.observe(f'ollama.slot_held_ms.{self.model}', held_seconds * 1000)
+
+    def retry_after(self) -> int:
+        """Seconds until a queued request would likely get a slot."""
+        avg_hold = metrics.average(f'ollama.slot_held_ms.{self.model}') / 1000 or 1.0
+        return max(1, math.ceil(avg_hold * (self.waiting + 1) / self.max_concurrency))
+
+    def state(self):
+        return {
+            'active': self.active,
+            'waiting': self.waiting,
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue
+        }
+
+
+class OllamaLimiter:
+    """Per-model gates in front of every Ollama generation call."""
+
+    def __init__(self):
+        self._gates = {}
+        self._lock = threading.Lock()
+
+    def gate(self, model) -> ModelGate:
+        with self._lock:
+            if model not in self._gates:
+                self._gates[model] = ModelGate(
+                    model,
+                    OLLAMA_MODEL_CONCURRENCY.get(model, OLLAMA_MAX_CONCURRENCY),
+                    OLLAMA_MAX_QUEUE,
+                    OLLAMA_QUEUE_TIMEOUT
+                )
+            return self._gates[model]
+
+    def slot(self, model, blocking: bool = True) -> Slot:
+        """Wait for a slot; raises OllamaBusy instead of queueing without bound."""
+        return self.gate(model).acquire(blocking)
+
+    def state(self):
+        with self._lock:
+            gates = list(self._gates.values())
+        return {gate.model: gate.state() for gate in gates}
+
+
+def idle_slot(model):
+    """A slot taken only when one is free, so background work never delays a user."""
+    while True:
+        try:
+            return ollama_limiter.slot(model, blocking=False)
+        except OllamaBusy as busy:
+            time.sleep(busy.retry_after)
+
+
+def busy_response(busy: OllamaBusy):
+    response = jsonify({
+        'error': 'The AI model is busy, please retry shortly',
+        'retry_after': busy.retry_after
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(busy.retry_after)
+    return response
+
+
+ollama_limiter = OllamaLimiter()
@@ -0,0 +1,89 @@
+import html
+from sqlalchemy import DateTime, inspect, text
+from .models import db, Chat, Message
+from .retrieval import tokenize
+from .config import SEARCH_PAGE_SIZE, SEARCH_PAGE_MAX
+
+# Snippet highlight markers; the snippet is HTML-escaped before they become <mark>
+_OPEN, _CLOSE = '\x02', '\x03'
+
+_fts5_ready = None
+
+
+def fts5_ready() -> bool:
+    """Whether the message_fts table exists on this database."""
+    global _fts5_ready
+    if _fts5_ready is None:
+        _fts5_ready = inspect(db.engine).has_table('message_fts')
+    return _fts5_ready
+
+
+def _match_expression(user_id: str, query: str) -> str:
+    """Every term must match, after the same stemming the index applies.
+
+    The owner phrase narrows the candidates inside FTS5; the query still
+    checks chat.user_id, since one id's tokens could appear inside another's.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return ""
+    owner = user_id.replace('"', '""')
+    return f'owner:"{owner}" AND content:(' + " AND ".join(f'"{t}"' for t in terms) + ')'
+
+
+def _highlight(snippet: str) -> str:
+    return html.escape(snippet).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>')
+
+
+def search_messages(user_id: str, query: str, limit: int = None, offset: int = 0):
+    """Messages in the user's chats matching query, best first.
+
+    Returns (results, next_offset); next_offset is None on the last page.
+    Each result carries the chat id and name and an HTML-safe snippet with
+    the matched terms wrapped in <mark>.
+    """
+    limit = max(1, min(limit or SEARCH_PAGE_SIZE, SEARCH_PAGE_MAX))
+    offset = max(0, offset or 0)
+    expression = _match_expression(user_id, query)
+    if not expression:
+        return [], None
+
+    if fts5_ready():
+        rows = db.session.execute(text("""
+            SELECT m.id, m.chat_id, c.name, m.role, m.timestamp,
+                   snippet(message_fts, 0, :open, :close, '…', 16) AS snippet
+            FROM message_fts
+            JOIN message m ON m.id = message_fts.rowid
+            JOIN chat c ON c.id = m.chat_id
+            WHERE message_fts MATCH :expression AND c.user_id = :user_id
+            ORDER BY message_fts.rank
+            LIMIT :limit OFFSET :offset
+        """).columns(timestamp=DateTime), {'expression': expression, 'user_id': user_id, 'open': _OPEN, 'close': _CLOSE,
+               'limit': limit + 1, 'offset': offset}).all()
+        results = [{
+            'message_id': row.id,
+            'chat_id': row.chat_id,
+            'chat_name': row.name,
+            'role': row.role,
+            'timestamp': row.timestamp.isoformat(),
+            'snippet': _highlight(row.snippet)
+        } for row in rows[:limit]]
+    else:
+        # No FTS5 in this SQLite build: substring match, newest first
+        terms = tokenize(query)
+        q = (db.session.query(Message, Chat.name)
+             .join(Chat, Chat.id == Message.chat_id)
+             .filter(Chat.user_id == user_id, *[Message.content.ilike(f'%{t}%') for t in terms])
+             .order_by(Message.id.desc()))
+        rows = q.limit(limit + 1).offset(offset).all()
+        results = [{
+            'message_id': message.id,
+            'chat_id': message.chat_id,
+            'chat_name': name,
+            'role': message.role,
+            'timestamp': message.timestamp.isoformat(),
+            'snippet': html.escape(message.content[:160])
+        } for message, name in rows[:limit]]
+
+    next_offset = offset + limit if len(rows) > limit else None
+    return results, next_offset
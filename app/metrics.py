@@ -0,0 +1,48 @@
+import threading
+from collections import defaultdict
+
+
+class Metrics:
+    """Thread-safe in-process counters and timing summaries.
+
+    Values are per worker process; /metrics reports the process that served
+    the request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._timings = {}
+
+    def incr(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float):
+        """Record one sample (usually milliseconds) under a summary."""
+        with self._lock:
+            summary = self._timings.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+            summary['count'] += 1
+            summary['total'] += value
+            summary['max'] = max(summary['max'], value)
+
+    def average(self, name: str) -> float:
+        with self._lock:
+            summary = self._timings.get(name)
+            return summary['total'] / summary['count'] if summary and summary['count'] else 0.0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'timings': {
+                    name: {
+                        'count': s['count'],
+                        'avg': round(s['total'] / s['count'], 2) if s['count'] else 0.0,
+                        'max': round(s['max'], 2)
+                    } for name, s in self._timings.items()
+                }
+            }
+
+
+metrics = Metrics()
@@ -0,0 +1,94 @@
+from sqlalchemy import inspect, text
+from .models import CHAT_STATS_TRIGGERS, DOCUMENT_CHUNK_FTS, MESSAGE_FTS, sqlite_has_fts5
+
+# Columns added to existing tables after their first release: (table, column, DDL type)
+ADDED_COLUMNS = [
+    ('message', 'token_count', 'INTEGER'),
+    ('chat', 'summary', 'TEXT'),
+    ('chat', 'summary_upto', 'INTEGER'),
+    ('chat', 'needs_title', 'BOOLEAN NOT NULL DEFAULT 0'),
+    ('message', 'client_key', 'VARCHAR(80)'),
+    ('chat', 'last_message_at', 'DATETIME'),
+    ('chat', 'last_message_preview', 'VARCHAR(120)'),
+    ('chat', 'message_count', 'INTEGER NOT NULL DEFAULT 0'),  # backfills all three
+    ('chat', 'is_auto_named', 'BOOLEAN NOT NULL DEFAULT 0'),
+    ('blob', 'claimed_at', 'DATETIME'),
+]
+
+# Indexes added to existing tables after their first release: (table, name, columns, unique)
+ADDED_INDEXES = [
+    ('message', 'ix_message_chat_client_key', ('chat_id', 'client_key'), True),
+    ('message', 'ix_message_chat_id_id', ('chat_id', 'id'), False),
+    ('chat', 'ix_chat_user_updated_id', ('user_id', 'updated', 'id'), False),
+    ('chat', 'ix_chat_user_listed_id', ('user_id', 'is_auto_named', 'updated', 'id'), False),
+]
+
+# Indexes replaced by a later one above: (table, name)
+DROPPED_INDEXES = [
+    ('chat', 'ix_chat_user_updated'),  # no id column, so the listing's tie-break still sorted
+    ('chat', 'ix_chat_user_listed'),
+]
+
+# One-off data fixes run right after a column is added: (table, column) -> SQL
+BACKFILLS = {
+    ('chat', 'needs_title'): "UPDATE chat SET needs_title = 1 WHERE name = 'New Chat'",
+    ('chat', 'message_count'): """UPDATE chat SET
+        message_count = (SELECT COUNT(*) FROM message WHERE message.chat_id = chat.id),
+        last_message_at = (SELECT timestamp FROM message WHERE message.chat_id = chat.id ORDER BY id DESC LIMIT 1),
+        last_message_preview = (SELECT replace(replace(substr(content, 1, 120), char(10), ' '), char(13), ' ')
+                                FROM message WHERE message.chat_id = chat.id ORDER BY id DESC LIMIT 1)""",
+    ('chat', 'is_auto_named'): "UPDATE chat SET is_auto_named = 1 WHERE name GLOB 'Chat [0-9]*/[0-9]* [0-9]*:[0-9][0-9]'",
+}
+
+
+def upgrade_schema(engine):
+    """Bring an existing database up to the current models.
+
+    db.create_all() only creates missing tables, so columns added later are
+    applied here. Safe to run on every start.
+    """
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table, column, ddl_type in ADDED_COLUMNS:
+            if table not in tables:
+                continue
+            existing = {c['name'] for c in inspector.get_columns(table)}
+            if column not in existing:
+                conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl_type}'))
+                if (table, column) in BACKFILLS:
+                    conn.execute(text(BACKFILLS[(table, column)]))
+                print(f"✅ Added column {table}.{column}")
+        current = inspect(conn)
+        for table, name in DROPPED_INDEXES:
+            if table in tables and name in {i['name'] for i in current.get_indexes(table)}:
+                conn.execute(text(f'DROP INDEX "{name}"'))
+                print(f"✅ Dropped index {name}")
+        for table, name, columns, unique in ADDED_INDEXES:
+            if table not in tables:
+                continue
+            existing = {c['name'] for c in current.get_columns(table)}
+            if not set(columns) <= existing or name in {i['name'] for i in current.get_indexes(table)}:
+                continue
+            conn.execute(text(f'CREATE {"UNIQUE " if unique else ""}INDEX {name} ON "{table}" ({", ".join(columns)})'))
+            print(f"✅ Added index {name}")
+        if engine.dialect.name == 'sqlite' and {'chat', 'message'} <= tables:
+            for statement in CHAT_STATS_TRIGGERS:
+                conn.execute(text(statement))
+        if {'chat', 'message'} <= tables and 'message_fts' not in tables and sqlite_has_fts5(conn):
+            for statement in MESSAGE_FTS:
+                conn.execute(text(statement))
+            # Index the messages written before the table existed
+            conn.execute(text("INSERT INTO message_fts(message_fts) VALUES ('rebuild')"))
+            print("✅ Built message search index")
+        if 'document_chunk' in tables and sqlite_has_fts5(conn):
+            columns = {row[1] for row in conn.exec_driver_sql('PRAGMA table_info(document_chunk_fts)')}
+            if 'blob_digest' not in columns:
+                # Older index without the digest column; its triggers write the old shape
+                for statement in ('DROP TRIGGER IF EXISTS document_chunk_ai', 'DROP TRIGGER IF EXISTS document_chunk_ad',
+                                  'DROP TABLE IF EXISTS document_chunk_fts'):
+                    conn.execute(text(statement))
+                for statement in DOCUMENT_CHUNK_FTS:
+                    conn.execute(text(statement))
+                conn.execute(text("INSERT INTO document_chunk_fts(document_chunk_fts) VALUES ('rebuild')"))
+                print("✅ Built document chunk search index")
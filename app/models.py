@@ -1,8 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
 from datetime import datetime
 import json
+from .token_budget import estimate_tokens
+from .storage import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class Chat(db.Model):
     id = db.Column(db.String(50), primary_key=True)
@@ -10,7 +13,21 @@ class Chat(db.Model):
     name = db.Column(db.String(200), nullable=False)
     created = db.Column(db.DateTime, default=datetime.utcnow)
     updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    summary = db.Column(db.Text)  # rolling summary of messages up to summary_upto
+    summary_upto = db.Column(db.Integer)
+    needs_title = db.Column(db.Boolean, nullable=False, default=False, server_default='0')  # placeholder name awaiting a generated title
+    is_auto_named = db.Column(db.Boolean, nullable=False, default=False, server_default='0')  # "Chat MM/DD HH:MM", hidden from /chats
+    # Maintained by the message triggers below, so listings never touch message
+    message_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_message_at = db.Column(db.DateTime)
+    last_message_preview = db.Column(db.String(120))
     messages = db.relationship('Message', backref='chat', lazy=True, cascade='all, delete-orphan')
+    documents = db.relationship('Document', backref='chat', lazy=True, cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_chat_user_updated_id', 'user_id', 'updated', 'id'),  # sidebar listing, newest first
+        db.Index('ix_chat_user_listed_id', 'user_id', 'is_auto_named', 'updated', 'id'),  # same, named chats only
+    )
 
     def to_dict(self):
         return {
@@ -19,6 +36,9 @@ class Chat(db.Model):
             'name': self.name,
             'created': self.created.isoformat(),
             'updated': self.updated.isoformat(),
+            'message_count': self.message_count,
+            'last_message_at': self.last_message_at.isoformat() if self.last_message_at else None,
+            'last_message_preview': self.last_message_preview,
             'messages': [msg.to_dict() for msg in self.messages]
         }
 
@@ -29,6 +49,13 @@ class Message(db.Model):
     content = db.Column(db.Text, nullable=False)
     image_url = db.Column(db.String(500))
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    token_count = db.Column(db.Integer)
+    client_key = db.Column(db.String(80))  # idempotency key sent by the client, unique per chat
+
+    __table_args__ = (
+        db.Index('ix_message_chat_client_key', 'chat_id', 'client_key', unique=True),
+        db.Index('ix_message_chat_id_id', 'chat_id', 'id'),  # keyset pagination of a chat's history
+    )
 
     def to_dict(self):
         return {
@@ -39,6 +66,35 @@ class Message(db.Model):
             'timestamp': self.timestamp.isoformat()
         }
 
+@event.listens_for(Message, 'before_insert')
+def _count_message_tokens(mapper, connection, message):
+    # Counted once at write time so prompt assembly never re-tokenizes history
+    if message.token_count is None:
+        message.token_count = estimate_tokens(message.content)
+
+# Chat listing columns kept in step with message inserts and deletes inside
+# the same transaction, whichever code path (ORM, bulk delete, cascade) writes.
+_PREVIEW = "replace(replace(substr({}, 1, 120), char(10), ' '), char(13), ' ')"
+
+CHAT_STATS_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS message_chat_stats_ai AFTER INSERT ON message BEGIN
+        UPDATE chat SET message_count = message_count + 1,
+            last_message_at = new.timestamp,
+            last_message_preview = {_PREVIEW.format('new.content')},
+            updated = coalesce(new.timestamp, updated)
+        WHERE id = new.chat_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS message_chat_stats_ad AFTER DELETE ON message BEGIN
+        UPDATE chat SET message_count = max(message_count - 1, 0),
+            last_message_at = (SELECT timestamp FROM message WHERE chat_id = old.chat_id ORDER BY id DESC LIMIT 1),
+            last_message_preview = (SELECT {_PREVIEW.format('content')} FROM message WHERE chat_id = old.chat_id ORDER BY id DESC LIMIT 1)
+        WHERE id = old.chat_id;
+    END""",
+]
+
+for _statement in CHAT_STATS_TRIGGERS:
+    event.listen(Message.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+
 class TrainingData(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_input = db.Column(db.Text, nullable=False)
@@ -76,4 +132,149 @@ class User(db.Model):
             'mobile': self.mobile,
             'is_guest': self.is_guest,
             'created_at': self.created_at.isoformat() if self.created_at else None
-        }
\ No newline at end of file
+        }
+
+class UserMemory(db.Model):
+    """One remembered fact per user and key"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(50), nullable=False)
+    memory_key = db.Column(db.String(100), nullable=False)
+    memory_value = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_user_memory_user_key', 'user_id', 'memory_key', unique=True),
+    )
+
+class Blob(db.Model):
+    """Uploaded bytes stored once per SHA-256 digest, with the cached extraction"""
+    digest = db.Column(db.String(64), primary_key=True)
+    ext = db.Column(db.String(20), default='')
+    size = db.Column(db.Integer, default=0)
+    ref_count = db.Column(db.Integer, default=0)  # Document rows pointing here
+    doc_type = db.Column(db.String(20), nullable=False)  # 'pdf', 'json' or 'text'
+    payload = db.Column(db.Text)  # compact JSON for 'json' documents
+    json_index = db.Column(db.Text)  # serialized JsonPathIndex over payload
+    chunk_count = db.Column(db.Integer, default=0)
+    char_count = db.Column(db.Integer, default=0)
+    status = db.Column(db.String(20), default='processing')  # 'processing', 'ready' or 'failed'
+    progress = db.Column(db.Integer, default=0)  # percent
+    error = db.Column(db.Text)
+    stats = db.Column(db.Text)  # JSON extraction stats, e.g. PDF page count and per-page ms
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime, default=datetime.utcnow)  # when the current extraction started
+
+class Document(db.Model):
+    """An uploaded file attached to a chat; its content is shared through Blob"""
+    id = db.Column(db.String(50), primary_key=True)
+    chat_id = db.Column(db.String(50), db.ForeignKey('chat.id'), nullable=False, index=True)
+    blob_digest = db.Column(db.String(64), db.ForeignKey('blob.digest'), nullable=False, index=True)
+    file_name = db.Column(db.String(255), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    blob = db.relationship('Blob', lazy='joined')
+
+    @property
+    def doc_type(self):
+        return self.blob.doc_type
+
+    def to_handle(self):
+        """Small reference kept in the chat session instead of the content"""
+        return {
+            'type': self.doc_type,
+            'document_id': self.id,
+            'uploaded_at': self.created_at.isoformat()
+        }
+
+    def to_job_dict(self):
+        blob = self.blob
+        return {
+            'job_id': self.id,
+            'filename': self.file_name,
+            'type': blob.doc_type,
+            'digest': blob.digest,
+            'status': blob.status,
+            'progress': blob.progress,
+            'chunks': blob.chunk_count,
+            'chars': blob.char_count,
+            'stats': json.loads(blob.stats) if blob.stats else None,
+            'error': blob.error
+        }
+
+class DocumentChunk(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    blob_digest = db.Column(db.String(64), db.ForeignKey('blob.digest'), nullable=False, index=True)
+    chunk_index = db.Column(db.Integer, nullable=False)
+    content = db.Column(db.Text, nullable=False)
+
+
+def sqlite_has_fts5(bind):
+    """Whether the connection is SQLite built with FTS5."""
+    if bind.dialect.name != 'sqlite':
+        return False
+    options = [row[0] for row in bind.exec_driver_sql('PRAGMA compile_options')]
+    return 'ENABLE_FTS5' in options
+
+
+def _sqlite_has_fts5(ddl, target, bind, **kw):
+    return sqlite_has_fts5(bind)
+
+
+# External-content FTS5 index over chunk text, kept in sync by triggers so
+# bulk deletes through the ORM are reflected as well. The blob digest is
+# indexed as a second column so a chat's search only walks the posting
+# lists of its own documents' blobs.
+DOCUMENT_CHUNK_FTS = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS document_chunk_fts USING fts5(
+        content, blob_digest, content='document_chunk', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS document_chunk_ai AFTER INSERT ON document_chunk BEGIN
+        INSERT INTO document_chunk_fts(rowid, content, blob_digest) VALUES (new.id, new.content, new.blob_digest);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS document_chunk_ad AFTER DELETE ON document_chunk BEGIN
+        INSERT INTO document_chunk_fts(document_chunk_fts, rowid, content, blob_digest)
+        VALUES ('delete', old.id, old.content, old.blob_digest);
+    END""",
+]
+
+for _statement in DOCUMENT_CHUNK_FTS:
+    event.listen(DocumentChunk.__table__, 'after_create', DDL(_statement).execute_if(callable_=_sqlite_has_fts5))
+event.listen(DocumentChunk.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS document_chunk_fts').execute_if(dialect='sqlite'))
+
+
+# Full-text index over chat messages for /chats/search, maintained the same
+# way; clearing a chat is a bulk delete, which the delete trigger covers.
+# The owning user is indexed as a second column so a search intersects
+# posting lists inside FTS5 instead of ranking every user's matches.
+# Messages are always deleted before their chat (ORM cascade order), so the
+# owner lookup in the delete trigger still finds it.
+MESSAGE_FTS = [
+    """CREATE VIEW IF NOT EXISTS message_fts_source AS
+        SELECT message.id AS id, message.content AS content, chat.user_id AS owner
+        FROM message JOIN chat ON chat.id = message.chat_id""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+        content, owner, content='message_fts_source', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_ai AFTER INSERT ON message BEGIN
+        INSERT INTO message_fts(rowid, content, owner)
+        VALUES (new.id, new.content, (SELECT user_id FROM chat WHERE id = new.chat_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_ad AFTER DELETE ON message BEGIN
+        INSERT INTO message_fts(message_fts, rowid, content, owner)
+        VALUES ('delete', old.id, old.content, (SELECT user_id FROM chat WHERE id = old.chat_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_au AFTER UPDATE OF content ON message BEGIN
+        INSERT INTO message_fts(message_fts, rowid, content, owner)
+        VALUES ('delete', old.id, old.content, (SELECT user_id FROM chat WHERE id = old.chat_id));
+        INSERT INTO message_fts(rowid, content, owner)
+        VALUES (new.id, new.content, (SELECT user_id FROM chat WHERE id = new.chat_id));
+    END""",
+]
+
+for _statement in MESSAGE_FTS:
+    event.listen(Message.__table__, 'after_create', DDL(_statement).execute_if(callable_=_sqlite_has_fts5))
+event.listen(Message.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS message_fts').execute_if(dialect='sqlite'))
+event.listen(Message.__table__, 'before_drop',
+             DDL('DROP VIEW IF EXISTS message_fts_source').execute_if(dialect='sqlite'))
@@ -1,3 +1,51 @@
-from ollama import Client as OllamaClient
+import asyncio
+import os
+import threading
+import weakref
+import httpx
+from ollama import Client as OllamaClient, AsyncClient as AsyncOllamaClient
+from .config import OLLAMA_HOST, OLLAMA_TIMEOUT, OLLAMA_CONNECT_TIMEOUT, OLLAMA_POOL_SIZE
 
-client = OllamaClient(host='http://localhost:11434')
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+def get_ollama_client() -> OllamaClient:
+    """Process-wide Ollama client with a keep-alive connection pool.
+
+    Every code path that talks to Ollama shares this client. It is rebuilt
+    after a fork so gunicorn workers never share sockets with the master.
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = OllamaClient(**_client_options())
+                _client_pid = os.getpid()
+    return _client
+
+
+def get_async_ollama_client() -> AsyncOllamaClient:
+    """Pooled asyncio Ollama client for the running event loop.
+
+    httpx async pools are bound to the loop that created them, so each loop
+    (one per ASGI worker) gets its own.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncOllamaClient(**_client_options())
+    return client
+
+
+def _client_options():
+    return dict(
+        host=OLLAMA_HOST,
+        timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=OLLAMA_POOL_SIZE,
+            max_keepalive_connections=OLLAMA_POOL_SIZE,
+            keepalive_expiry=60
+        )
+    )
@@ -1,14 +1,32 @@
+import time
 from PyPDF2 import PdfReader
+from .config import PDF_MAX_PAGES, PDF_MAX_BYTES
 
-def extract_pdf_text(local_path: str) -> str:
-    """Extract text from a PDF file saved on the server."""
-    try:
-        reader = PdfReader(local_path)
-        parts = []
-        for p in reader.pages:
-            t = p.extract_text() or ""
-            if t:
-                parts.append(t)
-        return "\n\n".join(parts).strip()
-    except Exception as e:
-        return f"[PDF read error: {e}]"
+def iter_pdf_pages(local_path: str, max_pages: int = PDF_MAX_PAGES, max_bytes: int = PDF_MAX_BYTES, stats: dict | None = None):
+    """Yield the text of each page as it is decoded.
+
+    Stops after max_pages pages or max_bytes of UTF-8 text. If a stats dict
+    is passed it is filled with the page count, per-page decode time in
+    milliseconds and whether a cap cut the document short.
+    """
+    if stats is None:
+        stats = {}
+    stats.update(pages=0, page_ms=[], truncated=False)
+    reader = PdfReader(local_path)
+    used = 0
+    for page in reader.pages:
+        if stats['pages'] >= max_pages:
+            stats['truncated'] = True
+            return
+        started = time.perf_counter()
+        text = page.extract_text() or ""
+        stats['page_ms'].append(round((time.perf_counter() - started) * 1000, 1))
+        stats['pages'] += 1
+        size = len(text.encode('utf-8'))
+        if used + size > max_bytes:
+            stats['truncated'] = True
+            yield text.encode('utf-8')[:max_bytes - used].decode('utf-8', 'ignore')
+            return
+        used += size
+        if text:
+            yield text
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from .metrics import metrics
+from .config import RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_REDIS_URL
+
+
+def normalize_messages(messages):
+    """Role plus whitespace-collapsed content, the parts that change the answer."""
+    return [{"role": m["role"], "content": " ".join(str(m.get("content", "")).split())} for m in messages]
+
+
+class ResponseCache:
+    """Exact-match cache of model answers with LRU + TTL eviction.
+
+    The in-process tier is always on; a Redis tier is used when
+    RESPONSE_CACHE_REDIS_URL is set so workers share hits. Entries can be
+    tagged (with a chat id) and dropped together when that chat's files or
+    API data change.
+    """
+
+    PREFIX = "neuro_core:llm:"
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, redis_url=RESPONSE_CACHE_REDIS_URL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags = {}  # tag -> set of keys, pruned whenever an entry leaves
+        self._lock = threading.Lock()
+        self._redis = None
+        if redis_url:
+            try:
+                import redis
+                self._redis = redis.from_url(redis_url)
+                self._redis.ping()
+            except Exception as e:
+                print(f"Response cache Redis tier disabled: {e}")
+                self._redis = None
+
+    @staticmethod
+    def make_key(model, messages, options=None):
+        raw = json.dumps({"model": model, "messages": normalize_messages(messages), "options": options or {}},
+                         sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    metrics.incr("response_cache.hit")
+                    return entry[1]
+                self._drop(key)
+
+        if self._redis is not None:
+            try:
+                value = self._redis.get(self.PREFIX + key)
+            except Exception:
+                value = None
+            if value is not None:
+                value, tags = self._decode(value)
+                self._store_local(key, value, tags)
+                metrics.incr("response_cache.hit_redis")
+                return value
+
+        metrics.incr("response_cache.miss")
+        return None
+
+    def set(self, key, value, tags=()):
+        tags = [t for t in tags if t]
+        self._store_local(key, value, tags)
+        if self._redis is not None:
+            try:
+                pipe = self._redis.pipeline()
+                # Tags travel with the value so a worker that reads it can invalidate it
+                pipe.setex(self.PREFIX + key, int(self.ttl), json.dumps({"value": value, "tags": tags}))
+                for tag in tags:
+                    pipe.sadd(f"{self.PREFIX}tag:{tag}", key)
+                    pipe.expire(f"{self.PREFIX}tag:{tag}", int(self.ttl))
+                pipe.execute()
+            except Exception as e:
+                print(f"Response cache Redis write failed: {e}")
+
+    @staticmethod
+    def _decode(raw):
+        """(value, tags) from a Redis entry; plain strings predate stored tags."""
+        raw = raw.decode("utf-8")
+        try:
+            entry = json.loads(raw)
+        except ValueError:
+            return raw, []
+        if isinstance(entry, dict) and "value" in entry:
+            return entry["value"], entry.get("tags") or []
+        return raw, []
+
+    def _store_local(self, key, value, tags):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                metrics.incr("response_cache.evicted")
+
+    def _drop(self, key):
+        """Remove an entry and its tag references; the caller holds the lock."""
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, tag):
+        """Drop every entry stored under a tag."""
+        if not tag:
+            return
+        with self._lock:
+            for key in list(self._tags.get(tag, ())):
+                self._drop(key)
+        if self._redis is not None:
+            try:
+                tag_key = f"{self.PREFIX}tag:{tag}"
+                keys = self._redis.smembers(tag_key)
+                if keys:
+                    self._redis.delete(*[self.PREFIX + k.decode("utf-8") for k in keys])
+                self._redis.delete(tag_key)
+            except Exception as e:
+                print(f"Response cache Redis invalidation failed: {e}")
+        metrics.incr("response_cache.invalidated")
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,87 @@
+import math
+import re
+from collections import Counter
+from .config import RETRIEVAL_CHUNK_WORDS, RETRIEVAL_CHUNK_OVERLAP
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in is it its
+me my of on or so that the their there this to was what when where which who why
+will with you your about tell give show please
+""".split())
+
+
+def tokenize(text: str) -> list:
+    """Lowercase word tokens used for both indexing and querying."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def iter_chunks(pieces, chunk_words: int = RETRIEVAL_CHUNK_WORDS, overlap: int = RETRIEVAL_CHUNK_OVERLAP):
+    """Yield fixed-size word windows with a small overlap from a stream of text.
+
+    Only about one chunk of words is buffered, so pages can be fed in as
+    they are decoded.
+    """
+    kept = min(overlap, chunk_words // 2)
+    step = max(1, chunk_words - kept)
+    buffer = []
+    emitted = False
+    for piece in pieces:
+        buffer.extend(piece.split())
+        while len(buffer) >= chunk_words:
+            yield " ".join(buffer[:chunk_words])
+            emitted = True
+            del buffer[:step]
+    # The tail is only new text if it goes past the overlap already emitted
+    if buffer and (not emitted or len(buffer) > chunk_words - step):
+        yield " ".join(buffer)
+
+
+def chunk_text(text: str, chunk_words: int = RETRIEVAL_CHUNK_WORDS, overlap: int = RETRIEVAL_CHUNK_OVERLAP) -> list:
+    """Split text into fixed-size word windows with a small overlap."""
+    return list(iter_chunks([text], chunk_words, overlap))
+
+
+class BM25Index:
+    """Okapi BM25 over fixed-size chunks of a single document.
+
+    Used when SQLite was built without FTS5.
+    """
+
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self, chunks, postings, lengths):
+        self.chunks = chunks
+        self.postings = postings  # term -> [[chunk_idx, tf], ...]
+        self.lengths = lengths
+        self.avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+    @classmethod
+    def from_chunks(cls, chunks: list):
+        postings = {}
+        lengths = []
+        for idx, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append([idx, tf])
+        return cls(chunks, postings, lengths)
+
+    def search(self, query: str, top_k: int = 3) -> list:
+        """Return [(score, chunk_idx), ...] best first."""
+        n = len(self.chunks)
+        if not n:
+            return []
+        scores = {}
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for idx, tf in plist:
+                norm = self.K1 * (1 - self.B + self.B * self.lengths[idx] / (self.avg_length or 1))
+                scores[idx] = scores.get(idx, 0.0) + idf * tf * (self.K1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [(score, idx) for idx, score in ranked[:top_k]]
@@ -1,15 +1,24 @@
-import os, uuid, json
+import os, json, time, uuid
 from flask import Blueprint, render_template, request, jsonify, session, Response, stream_with_context, redirect, url_for
 from werkzeug.utils import secure_filename
-from .helpers import build_ollama_content, extract_personal_info, extract_teaching_command, extract_api_command, fetch_api_data, store_api_data
+from .helpers import register_file_in_memory, build_ollama_content, extract_personal_info, extract_teaching_command, extract_api_command, fetch_api_data, store_api_data
 from .session_manager import ChatSessionManager
 from .chat_memory import ChatMemoryManager
-from .openai_client import client
+from .openai_client import get_ollama_client
 from .langchain_client import langchain_client
-from .config import UPLOAD_DIR, SYSTEM_PROMPT, OLLAMA_MODEL
+from .config import SYSTEM_PROMPT, OLLAMA_MODEL
 from .auth import auth_manager
 from .database import user_db
 from .ai_trainer import ai_trainer
+from .extraction import doc_type_for
+from .ingest import submit_ingestion
+from .blob_store import save_upload, blob_url
+from .limiter import ollama_limiter, OllamaBusy, busy_response
+from .metrics import metrics
+from .semantic_cache import semantic_cache
+from .generation import reserve_generation, dispatch_generation, relay_events
+from .token_bus import get_token_bus
+from .models import db, Chat, Document
 
 bp = Blueprint("main", __name__)
 
@@ -109,6 +118,31 @@ def new_chat():
     ChatSessionManager.clear_active_chat(user_id)
     return jsonify({"success": True, "message": "Ready for new chat"})
 
+def _save_upload(f):
+    """Store one uploaded file by content digest and queue it for ingestion."""
+    name = secure_filename(f.filename)
+    ext = os.path.splitext(name)[1].lower() or ".png"
+    digest, size, dest = save_upload(f, ext)
+    result = {"url": blob_url(digest, ext), "filename": name}
+    
+    doc_type = doc_type_for(name)
+    if not doc_type:
+        # Images are only attached to messages, not indexed
+        result["status"] = "ready"
+        return result
+    
+    document, needs_extraction = register_file_in_memory(name, digest, ext, size, doc_type)
+    if needs_extraction:
+        submit_ingestion(digest, str(dest), doc_type)
+        db.session.refresh(document.blob)
+    result.update(document.to_job_dict())
+    return result
+
+def _get_user_document(job_id):
+    user_id = session.get('user_id', 'guest')
+    return (Document.query.join(Chat, Chat.id == Document.chat_id)
+            .filter(Document.id == job_id, Chat.user_id == user_id).first())
+
 @bp.post("/upload")
 def upload():
     if not auth_manager.is_authenticated():
@@ -119,32 +153,55 @@ def upload():
     f = request.files["file"]
     if not f.filename:
         return jsonify({"error": "empty filename"}), 400
-    name = secure_filename(f.filename)
-    ext = os.path.splitext(name)[1].lower() or ".png"
-    fname = f"{uuid.uuid4().hex}{ext}"
-    dest = os.path.join(UPLOAD_DIR, fname)
-    f.save(dest)
-    url = f"/static/uploads/{fname}"
     
-    from .helpers import extract_file_content_to_memory
-    try:
-        storage_result = extract_file_content_to_memory(dest)
-    except Exception as e:
-        storage_result = f"Error: {str(e)}"
+    result = _save_upload(f)
+    return jsonify(result), 202 if result["status"] == "processing" else 200
+
+@bp.post("/upload/batch")
+def upload_batch():
+    """Upload several files at once; they are ingested in parallel"""
+    if not auth_manager.is_authenticated():
+        return jsonify({"error": "File upload requires login"}), 401
     
-    return jsonify({
-        "url": url, 
-        "storage_result": storage_result,
-        "filename": name
-    })
+    files = [f for f in request.files.getlist("files") if f.filename]
+    if not files:
+        return jsonify({"error": "no files"}), 400
+    
+    return jsonify({"jobs": [_save_upload(f) for f in files]}), 202
+
+@bp.get("/upload/<job_id>")
+def upload_status(job_id):
+    document = _get_user_document(job_id)
+    if not document:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(document.to_job_dict())
+
+@bp.get("/upload/<job_id>/events")
+def upload_events(job_id):
+    """Server-sent progress feed for one ingestion job"""
+    if not _get_user_document(job_id):
+        return jsonify({"error": "Job not found"}), 404
+    
+    @stream_with_context
+    def progress_stream():
+        last = None
+        deadline = time.monotonic() + 300
+        while time.monotonic() < deadline:
+            # End the read transaction so commits from the worker are visible
+            db.session.rollback()
+            job = db.session.get(Document, job_id).to_job_dict()
+            if job != last:
+                yield f"data: {json.dumps(job)}\n\n"
+                last = job
+            if job["status"] in ("ready", "failed"):
+                return
+            time.sleep(0.5)
+    return Response(progress_stream(), mimetype="text/event-stream")
 
 
 def call_openai_sync(user_msg: str, image_url: str | None = None) -> str:
-    if not client:
-        raise RuntimeError("AI client not configured.")
-    
     messages = build_ollama_content(user_msg, image_url, SYSTEM_PROMPT)
-    resp = client.chat(model=OLLAMA_MODEL, messages=messages)
+    resp = get_ollama_client().chat(model=OLLAMA_MODEL, messages=messages)
     
     content = ""
     try:
@@ -170,74 +227,89 @@ def call_openai_sync(user_msg: str, image_url: str | None = None) -> str:
     content = content.strip()
     return content or "I'm sorry, I couldn't generate a response. Please try again."
 
+def command_reply(user_msg: str):
+    """Reply to personal info, teaching and API commands; None means ask the model."""
+    personal_response = extract_personal_info(user_msg)
+    teaching_response = extract_teaching_command(user_msg)
+    api_command = extract_api_command(user_msg)
+    
+    if personal_response:
+        return personal_response
+    if teaching_response:
+        return teaching_response
+    if not api_command:
+        return None
+    if api_command == "URL_NOT_FOUND":
+        return "I can fetch data from APIs! Please provide a URL. For example: 'fetch api https://api.example.com/data' or 'get data from https://jsonplaceholder.typicode.com/posts/1'"
+    # Fetch data from the API
+    try:
+        api_result = fetch_api_data(api_command)
+        if api_result['success']:
+            # Store the API data
+            storage_result = store_api_data(api_command, api_result['data'])
+            return f" {storage_result}\n\nI've fetched and stored data from: {api_command}\n\nNow you can ask me questions about this data!"
+        return f" Failed to fetch API data: {api_result.get('error', 'Unknown error')}"
+    except Exception as e:
+        return f" Error processing API request: {str(e)}"
+
+def with_training_context(user_msg: str) -> str:
+    """Prefix the question with matching training data, if any."""
+    training_context = ai_trainer.get_training_context(user_msg)
+    return f"{training_context}\n{user_msg}" if training_context else user_msg
+
 @bp.post("/chat")
 def chat():
     data = request.get_json(force=True)
     user_msg = (data or {}).get("message", "").strip()
     image_url = (data or {}).get("image_url")
 
+    client_key = (data or {}).get("client_key")
+
     if not user_msg and not image_url:
         return jsonify({"error": "empty message"}), 400
 
+    # Write to the chat the client is showing; a retried turn that already
+    # finished gets its stored answer instead of a second one
+    ChatMemoryManager.use_chat((data or {}).get("chat_id"))
+    stored = ChatMemoryManager.stored_reply(client_key)
+    if stored is not None:
+        return jsonify({"reply": stored})
+
     # Add user message to history first
-    ChatMemoryManager.add_to_active_chat_history({"role": "user", "content": user_msg, "image_url": image_url})
-    history = ChatMemoryManager.get_active_chat_history()
+    ChatMemoryManager.add_to_active_chat_history({"role": "user", "content": user_msg, "image_url": image_url, "client_key": client_key})
+    summary, history = ChatMemoryManager.get_prompt_context()
 
     # Check for personal info, teaching commands, or API commands first
-    personal_response = extract_personal_info(user_msg)
-    teaching_response = extract_teaching_command(user_msg)
-    api_command = extract_api_command(user_msg)
-    
-    if personal_response:
-        reply: str = personal_response
-    elif teaching_response:
-        reply = teaching_response
-    elif api_command:
-        if api_command == "URL_NOT_FOUND":
-            reply = "I can fetch data from APIs! Please provide a URL. For example: 'fetch api https://api.example.com/data' or 'get data from https://jsonplaceholder.typicode.com/posts/1'"
-        else:
-            # Fetch data from the API
-            try:
-                api_result = fetch_api_data(api_command)
-                if api_result['success']:
-                    # Store the API data
-                    storage_result = store_api_data(api_command, api_result['data'])
-                    reply = f" {storage_result}\n\nI've fetched and stored data from: {api_command}\n\nNow you can ask me questions about this data!"
-                else:
-                    reply = f" Failed to fetch API data: {api_result.get('error', 'Unknown error')}"
-            except Exception as e:
-                reply = f" Error processing API request: {str(e)}"
-    else:
+    reply = command_reply(user_msg)
+    if reply is None:
+        # Summary plus the recent turns it does not cover yet
+        chat_history = [msg for msg in history if msg["role"] in ("user", "assistant")]
+        plan = langchain_client.prepare_stream(
+            with_training_context(user_msg), chat_history,
+            ChatMemoryManager.get_or_create_active_chat_id(), summary
+        )
+        reply = plan['cached']
+    if reply is None:
+        # Only a cache miss needs the model: wait for a generation slot;
+        # a full queue is rejected straight away
         try:
-            # Use LangChain for better user-friendly responses
-            # Convert history to LangChain format - limit to recent context only
-            chat_history = []
-            recent_messages = history[-6:-1] if len(history) > 6 else history[:-1]  # Only last 5 exchanges
-            for msg in recent_messages:
-                if msg["role"] == "user":
-                    chat_history.append({"role": "user", "content": msg["content"]})
-                elif msg["role"] == "assistant":
-                    chat_history.append({"role": "assistant", "content": msg["content"]})
-            
-            # Get enhanced system prompt with training data
-            enhanced_prompt = ai_trainer.get_enhanced_system_prompt(SYSTEM_PROMPT)
-            training_context = ai_trainer.get_training_context(user_msg)
-            
-            # Add training context to user message if available
-            enhanced_user_msg = f"{training_context}\n{user_msg}" if training_context else user_msg
-            
-            reply = langchain_client.generate_response(enhanced_user_msg, chat_history, image_url)
-        except Exception:
+            slot = ollama_limiter.slot(OLLAMA_MODEL)
+        except OllamaBusy as busy:
+            return busy_response(busy)
+        with slot:
             try:
-                reply = call_openai_sync(user_msg, image_url) if client else "AI client not configured."
-            except Exception as e2:
-                reply = f"AI service error: {e2}"
+                reply = langchain_client.generate_response(plan)
+            except Exception:
+                try:
+                    reply = call_openai_sync(user_msg, image_url)
+                except Exception as e2:
+                    reply = f"AI service error: {e2}"
 
     # Always ensure a string reply
     if reply is None:
         reply = "I'm sorry, I couldn't generate a response. Please try again."
 
-    ChatMemoryManager.add_to_active_chat_history({"role": "assistant", "content": reply})
+    ChatMemoryManager.add_to_active_chat_history({"role": "assistant", "content": reply, "client_key": ChatMemoryManager.reply_key(client_key)})
     return jsonify({"reply": reply})
 
 @bp.post("/teach")
@@ -271,76 +343,87 @@ def stream():
     user_msg = (data or {}).get("message", "").strip()
     image_url = (data or {}).get("image_url")
 
+    client_key = (data or {}).get("client_key")
+
     if not user_msg and not image_url:
         return jsonify({"error": "empty message"}), 400
 
+    # Write to the chat the client is showing; a retried turn that already
+    # finished gets its stored answer instead of a second one
+    ChatMemoryManager.use_chat((data or {}).get("chat_id"))
+    stored = ChatMemoryManager.stored_reply(client_key)
+    if stored is not None:
+        return jsonify({"reply": stored})
+
     # Add user message to history first
-    ChatMemoryManager.add_to_active_chat_history({"role": "user", "content": user_msg, "image_url": image_url})
-    history = ChatMemoryManager.get_active_chat_history()
+    ChatMemoryManager.add_to_active_chat_history({"role": "user", "content": user_msg, "image_url": image_url, "client_key": client_key})
+    summary, history = ChatMemoryManager.get_prompt_context()
 
-    # Check for personal info or teaching commands first
-    personal_response = extract_personal_info(user_msg)
-    teaching_response = extract_teaching_command(user_msg)
-    api_command = extract_api_command(user_msg)
-    
-    if personal_response:
-        reply = personal_response
-        ChatMemoryManager.add_to_active_chat_history({"role": "assistant", "content": reply})
-        return jsonify({"reply": reply})
-    elif teaching_response:
-        reply = teaching_response
-        ChatMemoryManager.add_to_active_chat_history({"role": "assistant", "content": reply})
-        return jsonify({"reply": reply})
-    elif api_command:
-        if api_command == "URL_NOT_FOUND":
-            reply = "I can fetch data from APIs! Please provide a URL. For example: 'fetch api https://api.example.com/data' or 'get data from https://jsonplaceholder.typicode.com/posts/1'"
-        else:
-            # Fetch data from the API
-            try:
-                api_result = fetch_api_data(api_command)
-                if api_result['success']:
-                    # Store the API data
-                    storage_result = store_api_data(api_command, api_result['data'])
-                    reply = f" {storage_result}\n\nI've fetched and stored data from: {api_command}\n\nNow you can ask me questions about this data!"
-                else:
-                    reply = f" Failed to fetch API data: {api_result.get('error', 'Unknown error')}"
-            except Exception as e:
-                reply = f" Error processing API request: {str(e)}"
-        
-        ChatMemoryManager.add_to_active_chat_history({"role": "assistant", "content": reply})
+    # Check for personal info, teaching commands, or API commands first
+    reply = command_reply(user_msg)
+    if reply is not None:
+        ChatMemoryManager.add_to_active_chat_history({"role": "assistant", "content": reply, "client_key": ChatMemoryManager.reply_key(client_key)})
         return jsonify({"reply": reply})
 
-    if not client:
-        reply = "AI client not configured."
-        ChatMemoryManager.add_to_active_chat_history({"role": "assistant", "content": reply})
+    if not langchain_client.available:
+        reply = "Ollama client not available"
+        ChatMemoryManager.add_to_active_chat_history({"role": "assistant", "content": reply, "client_key": ChatMemoryManager.reply_key(client_key)})
         return jsonify({"reply": reply})
 
-    @stream_with_context
-    def ollama_stream():
-        full_chunks = []
-        try:
-            # Use LangChain for streaming - limit to recent context only
-            chat_history = []
-            recent_messages = history[-6:-1] if len(history) > 6 else history[:-1]  # Only last 5 exchanges
-            for msg in recent_messages:
-                if msg["role"] == "user":
-                    chat_history.append({"role": "user", "content": msg["content"]})
-                elif msg["role"] == "assistant":
-                    chat_history.append({"role": "assistant", "content": msg["content"]})
-            
-            for chunk in langchain_client.generate_streaming_response(user_msg, chat_history, image_url):
-                full_chunks.append(chunk)
-                yield f"data: {json.dumps({'delta': chunk})}\n\n"
-            
-            final_text = "".join(full_chunks).strip()
-            ChatMemoryManager.add_to_active_chat_history({"role": "assistant", "content": final_text})
-            yield f"data: {json.dumps({'done': True})}\n\n"
-        except Exception as e:
-            err = f"AI stream error: {e}"
-            ChatMemoryManager.add_to_active_chat_history({"role": "assistant", "content": err})
-            yield f"data: {json.dumps({'delta': err})}\n\n"
-            yield f"data: {json.dumps({'done': True})}\n\n"
-    return Response(ollama_stream(), mimetype="text/event-stream")
+    try:
+        slot = reserve_generation(OLLAMA_MODEL)
+    except OllamaBusy as busy:
+        return busy_response(busy)
+    request_id = dispatch_turn(user_msg, history, summary, client_key, slot)
+    return Response(relay_events(request_id), mimetype="text/event-stream")
+
+def dispatch_turn(user_msg, history, summary, client_key, slot):
+    """Plan the answer and hand it to a generation worker; returns its request id.
+
+    The slot belongs to this request until the worker takes it, so it is
+    released here if planning or the hand-off fails.
+    """
+    try:
+        chat_id = ChatMemoryManager.get_or_create_active_chat_id()
+        # Summary plus the recent turns it does not cover yet
+        chat_history = [msg for msg in history if msg["role"] in ("user", "assistant")]
+        plan = langchain_client.prepare_stream(user_msg, chat_history, chat_id, summary)
+
+        request_id = uuid.uuid4().hex
+        dispatch_generation({
+            'request_id': request_id,
+            'owner': str(session.get('user_id', 'guest')),
+            'chat_id': chat_id,
+            'reply_key': ChatMemoryManager.reply_key(client_key),
+            'model': OLLAMA_MODEL,
+            'plan': plan
+        }, slot)
+    except Exception:
+        if slot:
+            slot.release()
+        raise
+    return request_id
+
+@bp.get("/stream/<request_id>")
+def resume_stream(request_id):
+    """Re-attach to a running or finished generation after a dropped connection"""
+    bus = get_token_bus()
+    if bus.owner(request_id) != str(session.get('user_id', 'guest')):
+        return jsonify({"error": "stream not found"}), 404
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    if last_event_id and not bus.valid_event_id(last_event_id):
+        return jsonify({"error": "invalid Last-Event-ID"}), 400
+    metrics.incr('generation.resumed')
+    return Response(relay_events(request_id, last_event_id), mimetype="text/event-stream")
+
+@bp.post("/stream/<request_id>/cancel")
+def cancel_stream(request_id):
+    """Stop a generation; the partial answer is still saved"""
+    bus = get_token_bus()
+    if bus.owner(request_id) != str(session.get('user_id', 'guest')):
+        return jsonify({"error": "stream not found"}), 404
+    bus.cancel(request_id)
+    return jsonify({"success": True})
 
 @bp.post("/api-fetch")
 def api_fetch():
@@ -384,7 +467,12 @@ def api_fetch():
 
 @bp.get("/health")
 def health():
-    return jsonify({"ollama_present": bool(client)})
+    return jsonify({"ollama_present": langchain_client.available})
+
+@bp.get("/metrics")
+def get_metrics():
+    """In-process counters, timings and Ollama queue state"""
+    return jsonify({**metrics.snapshot(), "ollama": ollama_limiter.state(), "semantic_cache": semantic_cache.stats()})
 
 @bp.get("/config")
 def config():
@@ -423,20 +511,15 @@ def get_available_models():
 def get_ollama_models():
     """Get installed Ollama models"""
     try:
-        import requests
-        response = requests.get('http://localhost:11434/api/tags')
-        if response.status_code == 200:
-            data = response.json()
-            models = []
-            for model in data.get('models', []):
-                models.append({
-                    'name': model['name'],
-                    'size': f"{model['size'] // (1024**3):.1f}GB" if model['size'] > 0 else 'Unknown',
-                    'modified': model['modified_at'][:10] if 'modified_at' in model else 'Unknown'
-                })
-            return jsonify({'success': True, 'models': models})
-        else:
-            return jsonify({'success': False, 'error': 'Ollama not running'})
+        models = []
+        for model in get_ollama_client().list().models:
+            size = model.size or 0
+            models.append({
+                'name': model.model,
+                'size': f"{size // (1024**3):.1f}GB" if size > 0 else 'Unknown',
+                'modified': model.modified_at.isoformat()[:10] if model.modified_at else 'Unknown'
+            })
+        return jsonify({'success': True, 'models': models})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -446,7 +529,6 @@ def get_ollama_info():
     try:
         import psutil
         import shutil
-        import requests
         
         # Get RAM info
         ram = psutil.virtual_memory()
@@ -459,11 +541,8 @@ def get_ollama_info():
         # Calculate model storage usage
         model_storage = 0
         try:
-            response = requests.get('http://localhost:11434/api/tags')
-            if response.status_code == 200:
-                data = response.json()
-                for model in data.get('models', []):
-                    model_storage += model.get('size', 0)
+            for model in get_ollama_client().list().models:
+                model_storage += model.size or 0
         except:
             pass
         
@@ -490,14 +569,10 @@ def pull_ollama_model():
         return jsonify({'success': False, 'error': 'Model name required'})
     
     try:
-        import requests
-        response = requests.post('http://localhost:11434/api/pull', 
-                               json={'name': model}, 
-                               timeout=300)
-        if response.status_code == 200:
-            return jsonify({'success': True})
-        else:
-            return jsonify({'success': False, 'error': 'Pull failed'})
+        # Stream the progress so the read timeout applies per update, not to the whole pull
+        for _ in get_ollama_client().pull(model, stream=True):
+            pass
+        return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -511,13 +586,8 @@ def remove_ollama_model():
         return jsonify({'success': False, 'error': 'Model name required'})
     
     try:
-        import requests
-        response = requests.delete(f'http://localhost:11434/api/delete', 
-                                 json={'name': model})
-        if response.status_code == 200:
-            return jsonify({'success': True})
-        else:
-            return jsonify({'success': False, 'error': 'Remove failed'})
+        get_ollama_client().delete(model)
+        return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
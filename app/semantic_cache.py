@@ -0,0 +1,123 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from .metrics import metrics
+from .retrieval import tokenize
+from .config import (
+    SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_TTL,
+    SEMANTIC_CACHE_SCOPES, SEMANTIC_CACHE_PER_SCOPE, SEMANTIC_CACHE_DIM
+)
+
+
+def embed(text: str, dim: int = SEMANTIC_CACHE_DIM, n: int = 3) -> np.ndarray:
+    """Unit vector of hashed character n-grams over the question's content words."""
+    vector = np.zeros(dim, dtype=np.float32)
+    words = tokenize(text)
+    if not words:
+        return vector
+    normalized = f" {' '.join(words)} "
+    grams = [normalized[i:i + n] for i in range(max(1, len(normalized) - n + 1))]
+    buckets = [int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=4).digest(), "little") for g in grams]
+    np.add.at(vector, np.array(buckets) % dim, 1.0)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class _Scope:
+    """Ring buffer of question vectors and answers for one context fingerprint."""
+
+    def __init__(self, capacity: int, dim: int):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.expires = np.zeros(capacity, dtype=np.float64)
+        self.answers = [None] * capacity
+        self.next = 0
+
+    def add(self, vector, answer, expires_at):
+        i = self.next % len(self.answers)
+        self.vectors[i] = vector
+        self.expires[i] = expires_at
+        self.answers[i] = answer
+        self.next += 1
+
+    def best(self, vector, now):
+        scores = self.vectors @ vector
+        scores[self.expires <= now] = -1.0
+        i = int(np.argmax(scores))
+        return float(scores[i]), self.answers[i]
+
+
+class SemanticCache:
+    """Serves a stored answer when a paraphrased question arrives in the same context.
+
+    Only questions asked under an identical fingerprint (model, memory,
+    attached sources and recent turns) are compared, so an answer never leaks
+    into a conversation it was not written for. Opt-in via
+    SEMANTIC_CACHE_ENABLED; tune SEMANTIC_CACHE_THRESHOLD against the
+    hit rate and similarity figures in /metrics.
+    """
+
+    def __init__(self, enabled=SEMANTIC_CACHE_ENABLED, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 ttl=SEMANTIC_CACHE_TTL, max_scopes=SEMANTIC_CACHE_SCOPES,
+                 per_scope=SEMANTIC_CACHE_PER_SCOPE, dim=SEMANTIC_CACHE_DIM):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_scopes = max_scopes
+        self.per_scope = per_scope
+        self.dim = dim
+        self._scopes = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(model, memory_context, sources, history) -> str:
+        raw = json.dumps([model, memory_context, sorted(sources), history], separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def lookup(self, scope: str, question: str):
+        if not self.enabled:
+            return None
+        vector = embed(question, self.dim)
+        with self._lock:
+            bucket = self._scopes.get(scope)
+            if bucket is None:
+                metrics.incr("semantic_cache.miss")
+                return None
+            self._scopes.move_to_end(scope)
+            score, answer = bucket.best(vector, time.monotonic())
+
+        metrics.observe("semantic_cache.best_similarity", score)
+        if score >= self.threshold:
+            metrics.incr("semantic_cache.hit")
+            return answer
+        metrics.incr("semantic_cache.miss")
+        return None
+
+    def store(self, scope: str, question: str, answer: str):
+        if not self.enabled:
+            return
+        vector = embed(question, self.dim)
+        with self._lock:
+            bucket = self._scopes.get(scope)
+            if bucket is None:
+                bucket = self._scopes[scope] = _Scope(self.per_scope, self.dim)
+                while len(self._scopes) > self.max_scopes:
+                    self._scopes.popitem(last=False)
+            self._scopes.move_to_end(scope)
+            bucket.add(vector, answer, time.monotonic() + self.ttl)
+
+    def stats(self) -> dict:
+        counters = metrics.snapshot()["counters"]
+        hits = counters.get("semantic_cache.hit", 0)
+        misses = counters.get("semantic_cache.miss", 0)
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "scopes": len(self._scopes),
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0
+        }
+
+
+semantic_cache = SemanticCache()
@@ -2,6 +2,8 @@ import uuid
 from datetime import datetime
 from flask import Blueprint, session, request, jsonify
 from .models import db, Chat
+from .document_store import delete_chat_documents
+from .config import CHAT_LIST_PAGE_SIZE, CHAT_LIST_PAGE_MAX
 
 session_bp = Blueprint('session_manager', __name__)
 
@@ -18,16 +20,16 @@ class ChatSessionManager:
     def create_new_chat(user_id=None, chat_name=None):
         user_id = user_id or session.get('user_id', 'guest')
         chat_id = str(uuid.uuid4())
+        needs_title = not chat_name
         chat_name = chat_name or f"Chat {datetime.now().strftime('%m/%d %H:%M')}"
         
-        chat = Chat(id=chat_id, user_id=user_id, name=chat_name)
+        chat = Chat(id=chat_id, user_id=user_id, name=chat_name, needs_title=needs_title, is_auto_named=needs_title)
         db.session.add(chat)
         db.session.commit()
         
         chat_key = ChatSessionManager.get_chat_session_key(chat_id, user_id)
         session[chat_key] = {
             'chat_id': chat_id,
-            'history': [],
             'memory': {},
             'user_id': user_id
         }
@@ -67,20 +69,48 @@ class ChatSessionManager:
         session.modified = True
     
     @staticmethod
-    def get_user_chats(user_id=None):
+    def list_chats(user_id, limit=None, cursor=None, named_only=False):
+        """A page of the user's chats, most recently updated first.
+        
+        The cursor is the "<updated>|<id>" of the last chat on the previous
+        page, so each page is one range scan of the user's listing index.
+        Returns (chats, next_cursor); next_cursor is None on the last page.
+        Raises ValueError for a malformed cursor.
+        """
+        limit = max(1, min(limit or CHAT_LIST_PAGE_SIZE, CHAT_LIST_PAGE_MAX))
+        query = Chat.query.filter(Chat.user_id == user_id)
+        if named_only:
+            query = query.filter(Chat.is_auto_named.is_(False))
+        if cursor:
+            updated, _, chat_id = cursor.partition('|')
+            updated = datetime.fromisoformat(updated)
+            query = query.filter(db.or_(Chat.updated < updated, db.and_(Chat.updated == updated, Chat.id < chat_id)))
+        chats = query.order_by(Chat.updated.desc(), Chat.id.desc()).limit(limit + 1).all()
+        if len(chats) <= limit:
+            return chats, None
+        last = chats[limit - 1]
+        return chats[:limit], f"{last.updated.isoformat()}|{last.id}"
+    
+    @staticmethod
+    def get_user_chats(user_id=None, limit=None, cursor=None):
         user_id = user_id or session.get('user_id', 'guest')
-        chats = Chat.query.filter_by(user_id=user_id).order_by(Chat.updated.desc()).all()
+        chats, next_cursor = ChatSessionManager.list_chats(user_id, limit, cursor)
         
+        active_chat_id = ChatSessionManager.get_active_chat_id(user_id)
         return [{
             'id': chat.id,
             'name': chat.name,
-            'is_active': chat.id == ChatSessionManager.get_active_chat_id(user_id)
-        } for chat in chats]
+            'message_count': chat.message_count,
+            'last_message_at': chat.last_message_at.isoformat() if chat.last_message_at else None,
+            'last_message_preview': chat.last_message_preview,
+            'is_active': chat.id == active_chat_id
+        } for chat in chats], next_cursor
     
     @staticmethod
     def delete_chat(chat_id, user_id=None):
         chat = Chat.query.get(chat_id)
         if chat:
+            delete_chat_documents(chat_id)
             db.session.delete(chat)
             db.session.commit()
         
@@ -115,9 +145,16 @@ def create_new_chat():
 @session_bp.route('/api/chats/list', methods=['GET'])
 def list_user_chats():
     user_id = session.get('user_id', 'guest')
+    try:
+        chats, next_cursor = ChatSessionManager.get_user_chats(
+            user_id, request.args.get('limit', type=int), request.args.get('cursor')
+        )
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
     return jsonify({
         'success': True,
-        'chats': ChatSessionManager.get_user_chats(user_id),
+        'chats': chats,
+        'next_cursor': next_cursor,
         'active_chat_id': ChatSessionManager.get_active_chat_id(user_id)
     })
 
@@ -133,9 +170,21 @@ def delete_chat(chat_id):
 
 @session_bp.route('/api/chats/<chat_id>/history', methods=['GET'])
 def get_chat_history(chat_id):
-    chat_session = ChatSessionManager.get_chat_session(chat_id, session.get('user_id', 'guest'))
+    user_id = session.get('user_id', 'guest')
+    chat_session = ChatSessionManager.get_chat_session(chat_id, user_id)
+    chat = Chat.query.filter_by(id=chat_id, user_id=user_id).first()
+    messages, has_more = [], False
+    if chat:
+        from .chat_memory import ChatMemoryManager
+        messages, has_more = ChatMemoryManager.get_history_page(
+            chat_id,
+            limit=request.args.get('limit', type=int),
+            before=request.args.get('before', type=int),
+            after=request.args.get('after', type=int)
+        )
     return jsonify({
         'success': True,
-        'history': chat_session.get('history', []),
+        'history': [msg.to_dict() for msg in messages],
+        'has_more': has_more,
         'memory': chat_session.get('memory', {})
     })
\ No newline at end of file
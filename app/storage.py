@@ -0,0 +1,99 @@
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+from .config import (
+    SQLITE_BUSY_TIMEOUT_MS, SQLITE_SYNCHRONOUS, SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE,
+    SQLITE_READ_POOL_SIZE, SQLITE_READ_MAX_OVERFLOW, SQLITE_WRITE_POOL_SIZE, SQLITE_WRITE_TIMEOUT,
+)
+
+# Bind key of the engine ORM writes are routed to
+WRITER_BIND = 'writer'
+
+_WRITING = 'storage.writing'
+
+
+def is_sqlite_file(uri: str) -> bool:
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def configure_storage(app):
+    """Set engine options for the app's database before db.init_app.
+
+    For a SQLite file the default engine becomes the read pool and a
+    'writer' bind on the same file gets its own pool, so concurrent
+    commits wait their turn for a pooled connection. Other databases are
+    left to their own defaults.
+    """
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if not is_sqlite_file(uri):
+        return
+    connect_args = {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000, 'check_same_thread': False}
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': SQLITE_READ_POOL_SIZE,
+        'max_overflow': SQLITE_READ_MAX_OVERFLOW,
+        'connect_args': connect_args,
+    }
+    if SQLITE_WRITE_POOL_SIZE > 0:
+        app.config['SQLALCHEMY_BINDS'] = {
+            WRITER_BIND: {
+                'url': uri,
+                'pool_size': SQLITE_WRITE_POOL_SIZE,
+                'max_overflow': 0,
+                'pool_timeout': SQLITE_WRITE_TIMEOUT,
+                'connect_args': connect_args,
+            },
+        }
+
+
+def sqlite_pragmas() -> list:
+    return [
+        'PRAGMA journal_mode=WAL',
+        f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}',
+        f'PRAGMA synchronous={SQLITE_SYNCHRONOUS}',
+        f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}',
+        f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}',
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in sqlite_pragmas():
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+
+def install_storage_profile(engines):
+    """Run the pragmas on every new connection of the SQLite engines."""
+    for engine in engines:
+        if engine.dialect.name == 'sqlite' and is_sqlite_file(str(engine.url)):
+            if not event.contains(engine, 'connect', apply_sqlite_pragmas):
+                event.listen(engine, 'connect', apply_sqlite_pragmas)
+
+
+class RoutingSession(Session):
+    """Session that sends writes to the writer bind when there is one.
+
+    A flush or an UPDATE/DELETE statement moves the transaction onto the
+    writer connection, and it stays there until commit or rollback so the
+    rest of the transaction reads its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engines = self._db.engines
+        if bind is None and WRITER_BIND in engines:
+            if self._flushing or isinstance(clause, UpdateBase):
+                self.info[_WRITING] = True
+            if self.info.get(_WRITING):
+                return engines[WRITER_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _leave_writer(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_WRITING, None)
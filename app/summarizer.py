@@ -0,0 +1,102 @@
+import queue
+import threading
+from flask import current_app
+from .models import db, Chat, Message
+from .openai_client import get_ollama_client
+from .limiter import idle_slot
+from .metrics import metrics
+from .config import SUMMARY_MODEL, SUMMARY_EVERY_MESSAGES, SUMMARY_MAX_WORDS, HISTORY_MESSAGES, OLLAMA_KEEP_ALIVE
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an AI assistant. "
+    "Merge the new messages into the existing summary. Keep names, facts, decisions and open questions; "
+    f"drop small talk. Write at most {SUMMARY_MAX_WORDS} words of plain prose and output only the summary."
+)
+
+
+def unsummarized(chat):
+    return Message.query.filter(Message.chat_id == chat.id, Message.id > (chat.summary_upto or 0))
+
+
+def needs_summary(chat_id) -> bool:
+    chat = db.session.get(Chat, chat_id)
+    if not chat or SUMMARY_EVERY_MESSAGES <= 0:
+        return False
+    return unsummarized(chat).count() >= HISTORY_MESSAGES + SUMMARY_EVERY_MESSAGES
+
+
+def summarize(summary, messages) -> str:
+    transcript = "\n".join(f"{m.role.capitalize()}: {m.content[:1000]}" for m in messages)
+    prompt = f"Existing summary:\n{summary or '(none yet)'}\n\nNew messages:\n{transcript}"
+    # Summaries can wait; only a free slot is taken, never a place in the queue
+    with idle_slot(SUMMARY_MODEL):
+        response = get_ollama_client().chat(
+            model=SUMMARY_MODEL,
+            messages=[{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": prompt}],
+            keep_alive=OLLAMA_KEEP_ALIVE
+        )
+    return response['message']['content'].strip()
+
+
+def update_summary(chat_id, summarize_fn=summarize) -> bool:
+    """Fold everything older than the recent window into the chat's summary."""
+    chat = db.session.get(Chat, chat_id)
+    if not chat:
+        return False
+    rows = unsummarized(chat).order_by(Message.id).all()
+    fold = rows[:-HISTORY_MESSAGES] if HISTORY_MESSAGES else rows
+    if len(fold) < SUMMARY_EVERY_MESSAGES:
+        return False
+
+    new_summary = summarize_fn(chat.summary, fold)
+    # Only apply on top of the summary we read; a clear or a parallel run wins
+    updated = Chat.query.filter_by(id=chat_id, summary_upto=chat.summary_upto).update({
+        Chat.summary: new_summary,
+        Chat.summary_upto: fold[-1].id,
+        Chat.updated: Chat.updated
+    }, synchronize_session=False)
+    db.session.commit()
+    metrics.incr('summary.updated' if updated else 'summary.discarded')
+    return bool(updated)
+
+
+class SummaryWorker:
+    """One background thread that refreshes chat summaries off the request path."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, app, chat_id):
+        with self._lock:
+            if chat_id in self._pending:
+                return
+            self._pending.add(chat_id)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='summary-worker', daemon=True)
+                self._thread.start()
+        self._queue.put((app, chat_id))
+
+    def _run(self):
+        while True:
+            app, chat_id = self._queue.get()
+            with self._lock:
+                self._pending.discard(chat_id)
+            with app.app_context():
+                try:
+                    update_summary(chat_id)
+                except Exception as e:
+                    db.session.rollback()
+                    metrics.incr('summary.failed')
+                    print(f"Summary update failed for chat {chat_id}: {e}")
+
+
+summary_worker = SummaryWorker()
+
+
+def schedule_summary(chat_id):
+    """Queue a summary refresh once enough turns have piled up."""
+    if needs_summary(chat_id):
+        summary_worker.submit(current_app._get_current_object(), chat_id)
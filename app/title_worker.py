@@ -0,0 +1,121 @@
+import queue
+import threading
+import time
+from flask import current_app
+from .models import db, Chat, Message
+from .limiter import idle_slot
+from .metrics import metrics
+from .config import OLLAMA_MODEL, TITLE_BATCH_SIZE, TITLE_BATCH_WINDOW
+
+
+def first_exchange(chat_id):
+    """The chat's first user and first assistant message, or None before both exist."""
+    first_user = Message.query.filter_by(chat_id=chat_id, role='user').order_by(Message.id).first()
+    first_ai = Message.query.filter_by(chat_id=chat_id, role='assistant').order_by(Message.id).first()
+    if not first_user or not first_ai:
+        return None
+    return first_user.content, first_ai.content
+
+
+def title_chats(chat_ids):
+    """Name a batch of chats with one model call, falling back per chat."""
+    from .langchain_client import langchain_client
+
+    pending = []
+    for chat_id in chat_ids:
+        chat = db.session.get(Chat, chat_id)
+        exchange = first_exchange(chat_id) if chat and chat.needs_title else None
+        if exchange:
+            pending.append((chat_id, exchange))
+    if not pending:
+        return
+
+    if len(pending) > 1:
+        with idle_slot(OLLAMA_MODEL):
+            titles = langchain_client.generate_title_batch([exchange for _, exchange in pending])
+    else:
+        titles = [None]
+
+    # Generate every title before writing, so the write transaction never
+    # stays open across a model call or a wait for a free slot
+    named = []
+    for (chat_id, (user_msg, ai_msg)), title in zip(pending, titles):
+        if not title:
+            with idle_slot(OLLAMA_MODEL):
+                title = langchain_client.generate_title([
+                    {'role': 'user', 'content': user_msg},
+                    {'role': 'assistant', 'content': ai_msg}
+                ])
+        if not title or title == "New Chat":
+            metrics.incr('titles.failed')
+            continue
+        named.append((chat_id, title))
+
+    for chat_id, title in named:
+        # A rename by the user in the meantime wins
+        Chat.query.filter_by(id=chat_id, needs_title=True).update({
+            Chat.name: title,
+            Chat.needs_title: False,
+            Chat.is_auto_named: False,
+            Chat.updated: Chat.updated
+        }, synchronize_session=False)
+        metrics.incr('titles.generated')
+    db.session.commit()
+
+
+class TitleWorker:
+    """Background queue that gathers chats waiting for a title into batches."""
+
+    def __init__(self, batch_size=TITLE_BATCH_SIZE, window=TITLE_BATCH_WINDOW):
+        self.batch_size = batch_size
+        self.window = window
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, app, chat_id):
+        with self._lock:
+            if chat_id in self._pending:
+                return
+            self._pending.add(chat_id)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='title-worker', daemon=True)
+                self._thread.start()
+        self._queue.put((app, chat_id))
+
+    def _next_batch(self):
+        app, chat_id = self._queue.get()
+        batch = [chat_id]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout)[1])
+            except queue.Empty:
+                break
+        with self._lock:
+            self._pending.difference_update(batch)
+        return app, batch
+
+    def _run(self):
+        while True:
+            app, batch = self._next_batch()
+            with app.app_context():
+                try:
+                    title_chats(batch)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Title generation failed for {len(batch)} chats: {e}")
+
+
+title_worker = TitleWorker()
+
+
+def schedule_title(chat_id):
+    """Queue a chat for naming once it has its first answer."""
+    chat = db.session.get(Chat, chat_id)
+    if chat and chat.needs_title:
+        title_worker.submit(current_app._get_current_object(), chat_id)
@@ -0,0 +1,81 @@
+import math
+from .metrics import metrics
+from .config import PROMPT_TOKEN_BUDGET, PROMPT_TOKEN_BUDGETS
+
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD = 4  # role header and separators per chat message
+MIN_SECTION_TOKENS = 32
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for Llama-style BPE: ~4 chars a token, at least one per word."""
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / CHARS_PER_TOKEN), len(text.split()))
+
+
+def budget_for(model: str) -> int:
+    return PROMPT_TOKEN_BUDGETS.get(model, PROMPT_TOKEN_BUDGET)
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    if estimate_tokens(text) <= tokens:
+        return text
+    cut = text[:max(0, tokens * CHARS_PER_TOKEN - 3)]
+    if " " in cut:
+        cut = cut[:cut.rfind(" ")]
+    return cut.rstrip() + "..."
+
+
+def assemble_prompt(model: str, system: str, user_message: str, memory: str = "",
+                    history=(), retrieved=(), summary: str = "") -> list:
+    """Chat messages for one turn, kept inside the model's prompt budget.
+
+    Filled by priority: the system prompt and the new question always go in,
+    then memory, the conversation summary, recent turns newest first, then
+    retrieved sections in rank order. The last section that only partly fits
+    is cut short; the rest are dropped. History entries may carry a
+    precomputed token_count.
+    """
+    budget = budget_for(model)
+    remaining = budget - estimate_tokens(system) - estimate_tokens(user_message) - 2 * MESSAGE_OVERHEAD
+
+    if memory:
+        memory = truncate_to_tokens(memory, max(remaining, 0))
+        remaining -= estimate_tokens(memory)
+
+    if summary:
+        summary = truncate_to_tokens(f"[Conversation so far: {summary}]\n\n", max(remaining, 0))
+        remaining -= estimate_tokens(summary)
+
+    turns = []
+    for msg in reversed(list(history)):
+        cost = (msg.get("token_count") or estimate_tokens(msg["content"])) + MESSAGE_OVERHEAD
+        if cost > remaining:
+            break
+        turns.append({"role": msg["role"], "content": msg["content"]})
+        remaining -= cost
+    turns.reverse()
+
+    sections = []
+    for section in retrieved:
+        cost = estimate_tokens(section) + 1
+        if cost <= remaining:
+            sections.append(section)
+            remaining -= cost
+            continue
+        if remaining >= MIN_SECTION_TOKENS:
+            sections.append(truncate_to_tokens(section, remaining - 1))
+            remaining = 0
+        break
+
+    dropped = len(history) - len(turns) + len(retrieved) - len(sections)
+    if dropped:
+        metrics.incr("prompt.trimmed", dropped)
+    metrics.observe("prompt.tokens", budget - remaining)
+
+    context = memory + summary + "\n\n".join(sections)
+    messages = [{"role": "system", "content": f"{system} Context: {context}" if context else system}]
+    messages.extend(turns)
+    messages.append({"role": "user", "content": user_message})
+    return messages
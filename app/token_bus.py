@@ -0,0 +1,148 @@
+import json
+import re
+import threading
+import time
+from .config import GENERATION_REDIS_URL, GENERATION_STREAM_TTL, GENERATION_STREAM_MAXLEN
+
+
+class LocalTokenBus:
+    """In-process stand-in for Redis Streams: one event log per generation.
+
+    Event ids are increasing integers as strings; read() returns events
+    after a given id, which is what makes Last-Event-ID resumption work.
+    """
+
+    is_local = True
+    EVENT_ID = re.compile(r"\d{1,18}")
+
+    def __init__(self, ttl=GENERATION_STREAM_TTL):
+        self.ttl = ttl
+        self._streams = {}  # request_id -> {'owner', 'events', 'cancelled', 'created'}
+        self._cond = threading.Condition()
+
+    def open(self, request_id, owner):
+        now = time.monotonic()
+        with self._cond:
+            for rid in [r for r, s in self._streams.items() if now - s['created'] > self.ttl]:
+                del self._streams[rid]
+            self._streams[request_id] = {'owner': owner, 'events': [], 'cancelled': False, 'created': now}
+
+    def owner(self, request_id):
+        stream = self._streams.get(request_id)
+        return stream['owner'] if stream else None
+
+    def publish(self, request_id, event):
+        with self._cond:
+            stream = self._streams.get(request_id)
+            if stream is None:
+                return None
+            stream['events'].append(event)
+            self._cond.notify_all()
+            return str(len(stream['events']))
+
+    def read(self, request_id, after=None, timeout=15.0):
+        """Events after the given id as [(id, event)], waiting up to timeout for new ones."""
+        start = int(after or 0)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                stream = self._streams.get(request_id)
+                if stream is None:
+                    return []
+                if len(stream['events']) > start:
+                    return [(str(i + 1), e) for i, e in enumerate(stream['events'][start:], start)]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+
+    def valid_event_id(self, event_id):
+        return bool(self.EVENT_ID.fullmatch(event_id))
+
+    def cancel(self, request_id):
+        with self._cond:
+            if request_id in self._streams:
+                self._streams[request_id]['cancelled'] = True
+
+    def cancelled(self, request_id):
+        stream = self._streams.get(request_id)
+        return bool(stream and stream['cancelled'])
+
+
+class RedisTokenBus:
+    """Per-generation Redis Streams, shared by web and generation worker processes."""
+
+    is_local = False
+    EVENT_ID = re.compile(r"\d{1,20}-\d{1,20}")
+    PREFIX = "neuro_core:gen:"
+    JOBS = "neuro_core:gen:jobs"
+
+    def __init__(self, redis_client, ttl=GENERATION_STREAM_TTL, maxlen=GENERATION_STREAM_MAXLEN):
+        self.redis = redis_client
+        self.ttl = int(ttl)
+        self.maxlen = maxlen
+
+    def _key(self, request_id):
+        return f"{self.PREFIX}{request_id}"
+
+    def open(self, request_id, owner):
+        meta = f"{self._key(request_id)}:meta"
+        pipe = self.redis.pipeline()
+        pipe.hset(meta, mapping={'owner': owner, 'cancelled': 0})
+        pipe.expire(meta, self.ttl)
+        pipe.execute()
+
+    def owner(self, request_id):
+        value = self.redis.hget(f"{self._key(request_id)}:meta", 'owner')
+        return value.decode('utf-8') if value else None
+
+    def publish(self, request_id, event):
+        key = self._key(request_id)
+        pipe = self.redis.pipeline()
+        pipe.xadd(key, {'event': json.dumps(event)}, maxlen=self.maxlen, approximate=True)
+        pipe.expire(key, self.ttl)
+        event_id, _ = pipe.execute()
+        return event_id.decode('utf-8')
+
+    def read(self, request_id, after=None, timeout=15.0):
+        result = self.redis.xread({self._key(request_id): after or '0-0'}, block=int(timeout * 1000))
+        if not result:
+            return []
+        return [(event_id.decode('utf-8'), json.loads(fields[b'event'])) for event_id, fields in result[0][1]]
+
+    def valid_event_id(self, event_id):
+        return bool(self.EVENT_ID.fullmatch(event_id))
+
+    def cancel(self, request_id):
+        self.redis.hset(f"{self._key(request_id)}:meta", 'cancelled', 1)
+
+    def cancelled(self, request_id):
+        return self.redis.hget(f"{self._key(request_id)}:meta", 'cancelled') == b'1'
+
+    def push_job(self, job):
+        self.redis.rpush(self.JOBS, json.dumps(job))
+
+    def queued_jobs(self):
+        return self.redis.llen(self.JOBS)
+
+    def pop_job(self, timeout=5):
+        item = self.redis.blpop(self.JOBS, timeout=timeout)
+        return json.loads(item[1]) if item else None
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_token_bus():
+    """Redis Streams when GENERATION_REDIS_URL is set, otherwise the in-process bus."""
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                if GENERATION_REDIS_URL:
+                    import redis
+                    _bus = RedisTokenBus(redis.from_url(GENERATION_REDIS_URL))
+                else:
+                    _bus = LocalTokenBus()
+    return _bus
@@ -0,0 +1,127 @@
+"""Compare SQLite under concurrent chat traffic with and without the storage profile.
+
+Writer threads commit messages the way /chat and /stream do while reader
+threads page chat history, first on a default-configured engine (rollback
+journal, one shared pool) and then with the profile from app.storage (WAL,
+pragmas, a separate single-connection writer pool).
+
+    python bench_storage.py --seconds 10 --writers 8 --readers 16
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine, event, insert, select
+from sqlalchemy.exc import OperationalError
+from app.models import db, Chat, Message
+from app.storage import apply_sqlite_pragmas
+from app.config import SQLITE_BUSY_TIMEOUT_MS, SQLITE_READ_POOL_SIZE, SQLITE_READ_MAX_OVERFLOW, SQLITE_WRITE_TIMEOUT
+
+CHATS = 50
+
+
+def make_engines(path, profile):
+    url = f"sqlite:///{path}"
+    connect_args = {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000, 'check_same_thread': False}
+    if not profile:
+        engine = create_engine(url, connect_args=connect_args)
+        return engine, engine
+    reader = create_engine(url, pool_size=SQLITE_READ_POOL_SIZE, max_overflow=SQLITE_READ_MAX_OVERFLOW,
+                           connect_args=connect_args)
+    writer = create_engine(url, pool_size=1, max_overflow=0, pool_timeout=SQLITE_WRITE_TIMEOUT,
+                           connect_args=connect_args)
+    for engine in (reader, writer):
+        event.listen(engine, 'connect', apply_sqlite_pragmas)
+    return reader, writer
+
+
+def seed(engine):
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Chat), [{'id': f'chat-{i}', 'user_id': 'bench', 'name': f'Chat {i}'} for i in range(CHATS)])
+        conn.execute(insert(Message), [
+            {'chat_id': f'chat-{i % CHATS}', 'role': 'user', 'content': f'seed message {i} ' * 8}
+            for i in range(CHATS * 100)
+        ])
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    return statistics.quantiles(samples, n=100)[pct - 1] if len(samples) > 1 else samples[0]
+
+
+def run(profile, seconds, writers, readers):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    reader_engine, writer_engine = make_engines(path, profile)
+    seed(writer_engine)
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    results = {'write': [], 'read': [], 'errors': 0}
+
+    def record(kind, started):
+        with lock:
+            results[kind].append((time.perf_counter() - started) * 1000)
+
+    def write_loop(n):
+        i = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                with writer_engine.begin() as conn:
+                    conn.execute(insert(Message).values(chat_id=f'chat-{(n + i) % CHATS}', role='assistant',
+                                                        content='streamed answer ' * 20, token_count=40))
+                record('write', started)
+            except OperationalError:
+                with lock:
+                    results['errors'] += 1
+            i += 1
+
+    def read_loop(n):
+        i = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                with reader_engine.connect() as conn:
+                    conn.execute(select(Message).where(Message.chat_id == f'chat-{(n + i) % CHATS}')
+                                 .order_by(Message.id.desc()).limit(50)).all()
+                record('read', started)
+            except OperationalError:
+                with lock:
+                    results['errors'] += 1
+            i += 1
+
+    threads = [threading.Thread(target=write_loop, args=(n,)) for n in range(writers)]
+    threads += [threading.Thread(target=read_loop, args=(n,)) for n in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    reader_engine.dispose()
+    writer_engine.dispose()
+
+    print(f"{'profile' if profile else 'default'}:")
+    for kind in ('write', 'read'):
+        samples = results[kind]
+        print(f"  {kind}s/s {len(samples) / seconds:9.1f}   p50 {percentile(samples, 50):7.2f} ms"
+              f"   p95 {percentile(samples, 95):7.2f} ms   max {max(samples, default=0):8.2f} ms")
+    print(f"  locked errors {results['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=16)
+    args = parser.parse_args()
+    for profile in (False, True):
+        run(profile, args.seconds, args.writers, args.readers)
+
+
+if __name__ == '__main__':
+    main()
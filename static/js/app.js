@@ -38,6 +38,7 @@ let mediaRecorder = null;
 let audioChunks = [];
 let isRecording = false;
 let currentStreamController = null;
+let currentStreamRequestId = null;
 let activeChatId = null;
 let userChats = [];
 
@@ -51,6 +52,9 @@ const performanceMetrics = {
 console.log('🚀 Neuro-Core AI Assistant initialized with advanced features');
 
 // Chat management functions
+let chatListCursor = null; // next page of the sidebar, null when all are shown
+let chatListLoading = false;
+
 function loadUserChats() {
   fetch('/chats')
     .then(response => response.json())
@@ -58,6 +62,7 @@ function loadUserChats() {
       console.log('Loaded chats:', data);
       if (data.success) {
         userChats = data.chats;
+        chatListCursor = data.next_cursor;
         updateChatSidebar();
       }
     })
@@ -66,6 +71,33 @@ function loadUserChats() {
     });
 }
 
+function loadMoreChats() {
+  if (!chatListCursor || chatListLoading) return;
+  chatListLoading = true;
+  fetch(`/chats?cursor=${encodeURIComponent(chatListCursor)}`)
+    .then(response => response.json())
+    .then(data => {
+      if (data.success) {
+        const shown = new Set(userChats.map(chat => chat.id));
+        userChats = userChats.concat(data.chats.filter(chat => !shown.has(chat.id)));
+        chatListCursor = data.next_cursor;
+        updateChatSidebar();
+      }
+    })
+    .catch(error => {
+      console.error('Error loading more chats:', error);
+    })
+    .finally(() => {
+      chatListLoading = false;
+    });
+}
+
+// Further pages of the sidebar load as it is scrolled to the end
+sidebarHistory?.closest('.overflow-auto')?.addEventListener('scroll', (e) => {
+  const el = e.target;
+  if (el.scrollTop + el.clientHeight >= el.scrollHeight - 200) loadMoreChats();
+});
+
 async function createNewChat() {
   console.log('Resetting to new chat state...');
 
@@ -122,6 +154,11 @@ async function createNewChat() {
 
 
 
+function newClientKey() {
+  if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
 function switchToChat(chatId) {
   activeChatId = chatId;
   loadChatHistory(chatId);
@@ -154,8 +191,25 @@ function deleteChat(chatId) {
   });
 }
 
+const HISTORY_PAGE_SIZE = 50;
+let historyCursor = null; // id of the oldest rendered message
+let historyHasMore = false;
+let historyLoading = false;
+
+function renderHistoryMessages(history) {
+  history.forEach(msg => {
+    if (msg.role === 'user') {
+      addUserMessage(msg.content, msg.image_url);
+    } else {
+      addAssistantMessage(msg.content);
+    }
+  });
+}
+
 function loadChatHistory(chatId) {
-  fetch(`/chat/${chatId}/history`)
+  historyCursor = null;
+  historyHasMore = false;
+  fetch(`/chat/${chatId}/history?limit=${HISTORY_PAGE_SIZE}`)
     .then(response => response.json())
     .then(data => {
       if (data.success && messages) {
@@ -168,13 +222,9 @@ function loadChatHistory(chatId) {
           if (welcomeScreen) welcomeScreen.style.display = 'none';
           if (chatMessages) chatMessages.classList.remove('hidden');
 
-          data.history.forEach(msg => {
-            if (msg.role === 'user') {
-              addUserMessage(msg.content, msg.image_url);
-            } else {
-              addAssistantMessage(msg.content);
-            }
-          });
+          renderHistoryMessages(data.history);
+          historyCursor = data.before;
+          historyHasMore = data.has_more;
         } else {
           if (welcomeScreen) {
             welcomeScreen.style.display = 'block';
@@ -191,6 +241,46 @@ function loadChatHistory(chatId) {
     });
 }
 
+// Older messages are fetched a page at a time as the user scrolls up
+function loadOlderHistory() {
+  if (!activeChatId || !historyHasMore || historyLoading || !messages) return;
+  const chatId = activeChatId;
+  historyLoading = true;
+
+  fetch(`/chat/${chatId}/history?limit=${HISTORY_PAGE_SIZE}&before=${historyCursor}`)
+    .then(response => response.json())
+    .then(data => {
+      if (!data.success || chatId !== activeChatId) return;
+      const chat = document.getElementById('chat');
+      const previousHeight = chat ? chat.scrollHeight : 0;
+      const previousTop = chat ? chat.scrollTop : 0;
+
+      // The add* helpers append, so move the new page above what is shown
+      const firstShown = messages.firstChild;
+      const shownCount = messages.children.length;
+      renderHistoryMessages(data.history);
+      Array.from(messages.children).slice(shownCount).forEach(node => messages.insertBefore(node, firstShown));
+
+      historyCursor = data.before ?? historyCursor;
+      historyHasMore = data.has_more;
+
+      // Keep the messages the user was reading in place
+      requestAnimationFrame(() => {
+        if (chat) chat.scrollTop = chat.scrollHeight - previousHeight + previousTop;
+      });
+    })
+    .catch(error => {
+      console.error('Error loading older messages:', error);
+    })
+    .finally(() => {
+      historyLoading = false;
+    });
+}
+
+document.getElementById('chat')?.addEventListener('scroll', (e) => {
+  if (e.target.scrollTop < 200) loadOlderHistory();
+});
+
 function formatRelativeDate(dateString) {
   const date = new Date(dateString);
   const now = new Date();
@@ -221,7 +311,8 @@ function updateChatSidebar() {
     let displayTitle = chat.name.replace(/['"]+/g, '').trim();
     // No JS truncation needed, CSS will handle it
 
-    const dateDisplay = formatRelativeDate(chat.updated || chat.created_at || Date.now());
+    const dateDisplay = formatRelativeDate(chat.last_message_at || chat.updated || chat.created_at || Date.now())
+      + (chat.message_count ? ` · ${chat.message_count} messages` : '');
 
     sidebarHistory.innerHTML += `
       <div class="group relative p-3 rounded-lg mb-2 flex justify-between items-center transition-all duration-200 ${isActive ? 'bg-blue-50 dark:bg-blue-900/40 border border-blue-200 dark:border-blue-800' : 'hover:bg-gray-100 dark:hover:bg-gray-800 border border-transparent'}">
@@ -710,8 +801,28 @@ fileInput?.addEventListener('change', async (e) => {
       }
     }
   }
+
+  if (data.job_id && data.status === 'processing') {
+    watchIngestion(data.job_id, file.name);
+  }
 });
 
+// Documents are indexed in the background; report when they are ready
+function watchIngestion(jobId, fileName) {
+  const events = new EventSource(`/upload/${jobId}/events`);
+  events.onmessage = (event) => {
+    const job = JSON.parse(event.data);
+    if (job.status === 'ready') {
+      showNotification(`📄 ${fileName} is ready`, 'success', 2000);
+      events.close();
+    } else if (job.status === 'failed') {
+      showNotification(`❌ Could not read ${fileName}: ${job.error || 'unknown error'}`, 'error');
+      events.close();
+    }
+  };
+  events.onerror = () => events.close();
+}
+
 function scrollToBottom() {
   requestAnimationFrame(() => {
     const chat = document.getElementById('chat');
@@ -951,18 +1062,8 @@ async function send(useStream = false) {
   // Always add user message to UI first
   addUserMessage(text || '(image only)', lastImageUrl);
 
-  // Save user message to backend
-  if (activeChatId) {
-    await fetch(`/chat/${activeChatId}/message`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({
-        role: 'user',
-        content: text || '(image only)',
-        image_url: lastImageUrl
-      })
-    });
-  }
+  // The server saves both sides of the turn; the key makes a retried post a no-op
+  const clientKey = newClientKey();
 
   preview?.classList.add('hidden');
   if (preview) preview.innerHTML = '';
@@ -984,61 +1085,90 @@ async function send(useStream = false) {
       const abortController = new AbortController();
       currentStreamController = abortController;
 
-      const res = await fetch('/stream', {
+      let res = await fetch('/stream', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
           message: contextualMessage,
           image_url: lastImageUrl,
-          chatbot_id: currentChatbot?.id
+          chatbot_id: currentChatbot?.id,
+          chat_id: activeChatId,
+          client_key: clientKey
         }),
         signal: abortController.signal
       });
 
-      const reader = res.body.getReader();
-      const decoder = new TextDecoder();
       let fullResponse = '';
       let isFirstChunk = true;
-
-      while (true) {
-        const { value, done } = await reader.read();
-        if (done) break;
-
-        const chunk = decoder.decode(value, { stream: true });
-        const lines = chunk.split('\n');
-
-        for (const line of lines) {
-          if (line.startsWith('data: ')) {
-            try {
-              const data = JSON.parse(line.slice(6));
-              if (data.delta) {
-                if (isFirstChunk) {
-                  hideTypingIndicator();
-                  isFirstChunk = false;
-                }
-                fullResponse += data.delta;
-                const rendered = renderMarkdown(fullResponse);
-                container.innerHTML = '';
-                container.appendChild(rendered);
-                scrollToBottom();
+      let requestId = null;
+      let lastEventId = null;
+      let finished = false;
+      let reconnects = 0;
+
+      while (!finished) {
+        try {
+          const reader = res.body.getReader();
+          const decoder = new TextDecoder();
+          let buffer = '';
+
+          while (!finished) {
+            const { value, done } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+
+            for (const line of lines) {
+              if (line.startsWith('id: ')) {
+                lastEventId = line.slice(4);
+                continue;
+              }
+              if (line.startsWith('data: ')) {
+                try {
+                  const data = JSON.parse(line.slice(6));
+                  if (data.request_id) {
+                    requestId = data.request_id;
+                    currentStreamRequestId = requestId;
+                  }
+                  if (data.delta) {
+                    if (isFirstChunk) {
+                      hideTypingIndicator();
+                      isFirstChunk = false;
+                    }
+                    fullResponse += data.delta;
+                    const rendered = renderMarkdown(fullResponse);
+                    container.innerHTML = '';
+                    container.appendChild(rendered);
+                    scrollToBottom();
+                  }
+                  if (data.done) {
+                    finished = true;
+                    break;
+                  }
+                } catch (e) { }
               }
-              if (data.done) break;
-            } catch (e) { }
+            }
           }
+          if (finished || !requestId) break;
+        } catch (error) {
+          if (error.name === 'AbortError' || !requestId) throw error;
         }
+
+        // Connection dropped mid-answer: the server keeps generating, so
+        // re-attach and continue after the last event we rendered
+        if (reconnects++ >= 3) throw new Error('Stream connection lost');
+        await new Promise(resolve => setTimeout(resolve, 1000 * reconnects));
+        res = await fetch(`/stream/${requestId}`, {
+          headers: lastEventId ? { 'Last-Event-ID': lastEventId } : {},
+          signal: abortController.signal
+        });
+        if (!res.ok) throw new Error('Stream connection lost');
       }
 
-      // Save AI response and update chat title
+      // The reply is saved on the server; pick up the generated title
       if (activeChatId && fullResponse) {
-        await fetch(`/chat/${activeChatId}/message`, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({
-            role: 'assistant',
-            content: fullResponse
-          })
-        });
-        updateChatTitle(activeChatId, text, fullResponse);
+        updateChatTitle(activeChatId);
       }
 
       // Track performance
@@ -1057,6 +1187,7 @@ async function send(useStream = false) {
       }
     } finally {
       currentStreamController = null;
+      currentStreamRequestId = null;
     }
   } else {
     try {
@@ -1066,7 +1197,9 @@ async function send(useStream = false) {
         body: JSON.stringify({
           message: contextualMessage,
           image_url: lastImageUrl,
-          chatbot_id: currentChatbot?.id
+          chatbot_id: currentChatbot?.id,
+          chat_id: activeChatId,
+          client_key: clientKey
         })
       });
 
@@ -1076,17 +1209,9 @@ async function send(useStream = false) {
       const aiResponse = data.reply || 'No response received';
       addAssistantMessage(aiResponse);
 
-      // Save AI response and update chat title
+      // The reply is saved on the server; pick up the generated title
       if (activeChatId) {
-        await fetch(`/chat/${activeChatId}/message`, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({
-            role: 'assistant',
-            content: aiResponse
-          })
-        });
-        updateChatTitle(activeChatId, text, aiResponse);
+        updateChatTitle(activeChatId);
       }
 
       // Track performance
@@ -1183,26 +1308,21 @@ function submitFeedback(messageId, type, userInput, aiResponse) {
 
 // Unused generateChatTitle function removed
 
-async function updateChatTitle(chatId, userMessage, aiResponse) {
+async function updateChatTitle(chatId, attempt = 0) {
+  // Titles are generated in the background once the first answer is saved;
+  // poll the chat list until this chat's name is ready.
   try {
-    // Only generate title if it's a new chat or has very few messages
-    // We let the backend decide based on history length or just force it for now
-    // But to avoid spamming, let's only do it if the current title is "New Chat" 
-    // or if we want to refresh it.
-
-    // For now, let's call the generator. The backend will use the history.
-    // We can optimize by checking if we really need to update.
+    const response = await fetch('/chats');
+    const data = await response.json();
+    if (!data.success) return;
 
-    const response = await fetch(`/chat/${chatId}/generate_title`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' }
-    });
+    userChats = data.chats;
+    chatListCursor = data.next_cursor;
+    updateChatSidebar();
 
-    if (response.ok) {
-      const data = await response.json();
-      if (data.success) {
-        loadUserChats(); // Refresh sidebar
-      }
+    const chat = userChats.find(c => c.id === chatId);
+    if (chat && chat.title_pending && attempt < 10) {
+      setTimeout(() => updateChatTitle(chatId, attempt + 1), 3000);
     }
   } catch (error) {
     console.error('Error updating chat title:', error);
@@ -2286,6 +2406,10 @@ document.addEventListener('DOMContentLoaded', async () => {
   if (stopBtn) {
     stopBtn.addEventListener('click', () => {
       if (currentStreamController) {
+        // Stop the generation itself, not just this connection to it
+        if (currentStreamRequestId) {
+          fetch(`/stream/${currentStreamRequestId}/cancel`, { method: 'POST' });
+        }
         currentStreamController.abort();
         showNotification('⏹️ Stopping response...', 'info', 1500);
       }
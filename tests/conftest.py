@@ -0,0 +1,24 @@
+import pytest
+from app import create_app
+from app.models import db
+
+@pytest.fixture
+def app_config(tmp_path):
+    """Settings for the test app; a module overrides this fixture to change them"""
+    return {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'chats.db'}",
+        'SESSION_FILE_DIR': str(tmp_path / 'sessions'),
+    }
+
+@pytest.fixture
+def app(app_config):
+    app = create_app(app_config)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,74 @@
+import asyncio
+import importlib
+import httpx
+import pytest
+from app.langchain_client import langchain_client
+from app.models import db, Message
+
+@pytest.fixture(scope='module')
+def asgi(tmp_path_factory):
+    """app.asgi, which builds its Flask app on import, on a temporary database"""
+    tmp_dir = tmp_path_factory.mktemp('asgi')
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('DATABASE_URL', f"sqlite:///{tmp_dir / 'chats.db'}")
+        mp.setenv('SESSION_FILE_DIR', str(tmp_dir / 'sessions'))
+        yield importlib.import_module('app.asgi')
+
+@pytest.fixture
+def fake_model(asgi, monkeypatch):
+    async def fake_astream(plan):
+        for token in ['Hello', ' there']:
+            yield token
+    def fake_stream(plan):
+        yield from ['Hello', ' there']
+    monkeypatch.setattr(langchain_client, 'available', True)
+    monkeypatch.setattr(langchain_client, 'astream_plan', fake_astream)
+    monkeypatch.setattr(langchain_client, 'stream_plan', fake_stream)
+    with asgi.flask_app.app_context():
+        db.create_all()
+        yield asgi
+        db.drop_all()
+
+def post(asgi, path, payload):
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.application)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.post(path, json=payload)
+    return asyncio.run(run())
+
+def test_async_stream_sends_deltas_and_saves_reply(fake_model):
+    """Test that /stream relays id'd events from the token bus and persists the answer"""
+    async def run():
+        transport = httpx.ASGITransport(app=fake_model.application)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            response = await client.post('/stream', json={'message': 'Hi'})
+            request_id = response.text.split('"request_id": "')[1].split('"')[0]
+            resumed = await client.get(f'/stream/{request_id}', headers={'Last-Event-ID': '2'})
+            return response, resumed
+    response, resumed = asyncio.run(run())
+
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/event-stream')
+    assert 'id: 2\ndata: {"delta": "Hello"}' in response.text
+    assert response.text.rstrip().endswith('data: {"done": true}')
+    assert 'Hello"' not in resumed.text and 'data: {"delta": " there"}' in resumed.text
+    with fake_model.flask_app.app_context():
+        assert [m.content for m in Message.query.order_by(Message.id)] == ['Hi', 'Hello there']
+
+def test_async_chat_returns_reply_json(fake_model):
+    """Test that /chat returns the joined answer as JSON"""
+    response = post(fake_model, '/chat', {'message': 'Hi'})
+
+    assert response.status_code == 200
+    assert response.json() == {'reply': 'Hello there'}
+
+def test_other_routes_fall_through_to_flask(fake_model):
+    """Test that non-generation routes are served by the WSGI app"""
+    response = post(fake_model, '/stream', {})
+    assert response.status_code == 400
+
+    async def get_health():
+        transport = httpx.ASGITransport(app=fake_model.application)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.get('/health')
+    assert asyncio.run(get_health()).status_code == 200
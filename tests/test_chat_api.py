@@ -1,22 +1,9 @@
 import pytest
 import json
-from app import create_app
+from sqlalchemy import create_engine, event, text
+from app.migrations import upgrade_schema
 from app.models import db, Chat, Message
-
-@pytest.fixture
-def app():
-    app = create_app()
-    app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    
-    with app.app_context():
-        db.create_all()
-        yield app
-        db.drop_all()
-
-@pytest.fixture
-def client(app):
-    return app.test_client()
+from app.session_manager import ChatSessionManager
 
 def test_start_chat(client):
     """Test creating a new chat"""
@@ -121,4 +108,143 @@ def test_chat_ownership_validation(client):
     # This would require proper session management in tests
     # For now, just test that invalid chat_id returns 404
     response = client.get('/chat/invalid-id/history')
-    assert response.status_code == 404
\ No newline at end of file
+    assert response.status_code == 404
+def test_save_message_is_idempotent_per_client_key(client):
+    """Test that reposting a message with the same key does not add a row"""
+    chat_id = json.loads(client.post('/start_chat').data)['chat_id']
+    payload = {'role': 'user', 'content': 'Hello', 'client_key': 'k1'}
+
+    first = json.loads(client.post(f'/chat/{chat_id}/message', json=payload).data)
+    second = json.loads(client.post(f'/chat/{chat_id}/message', json=payload).data)
+    third = json.loads(client.post(f'/chat/{chat_id}/message', json={'role': 'user', 'content': 'Hello'},
+                                   headers={'Idempotency-Key': 'k2'}).data)
+
+    assert second == {'success': True, 'message_id': first['message_id'], 'duplicate': True}
+    assert 'duplicate' not in third
+    assert Message.query.filter_by(chat_id=chat_id).count() == 2
+
+def test_chat_history_pages_by_message_id(client):
+    """Test keyset pagination of chat history in both directions"""
+    chat_id = json.loads(client.post('/start_chat').data)['chat_id']
+    for i in range(7):
+        client.post(f'/chat/{chat_id}/message', json={'role': 'user', 'content': f'm{i}'})
+
+    last = json.loads(client.get(f'/chat/{chat_id}/history?limit=3').data)
+    assert [m['content'] for m in last['history']] == ['m4', 'm5', 'm6']
+    assert last['has_more'] is True
+
+    older = json.loads(client.get(f'/chat/{chat_id}/history?limit=3&before={last["before"]}').data)
+    oldest = json.loads(client.get(f'/chat/{chat_id}/history?limit=3&before={older["before"]}').data)
+    assert [m['content'] for m in older['history']] == ['m1', 'm2', 'm3']
+    assert [m['content'] for m in oldest['history']] == ['m0'] and oldest['has_more'] is False
+
+    newer = json.loads(client.get(f'/chat/{chat_id}/history?limit=3&after={older["after"]}').data)
+    assert [m['content'] for m in newer['history']] == ['m4', 'm5', 'm6'] and newer['has_more'] is False
+
+def test_chat_listing_columns_follow_message_writes(client):
+    """Test that message count and preview are kept on the chat row"""
+    chat_id = json.loads(client.post('/start_chat').data)['chat_id']
+    client.post(f'/chat/{chat_id}/message', json={'role': 'user', 'content': 'Hello'})
+    client.post(f'/chat/{chat_id}/message', json={'role': 'assistant', 'content': 'Hi there!\nHow can I help?'})
+
+    chat = db.session.get(Chat, chat_id)
+    db.session.refresh(chat)
+    assert chat.message_count == 2
+    assert chat.last_message_preview == 'Hi there! How can I help?'
+
+    db.session.delete(Message.query.filter_by(chat_id=chat_id, role='assistant').one())
+    db.session.commit()
+    db.session.refresh(chat)
+    assert (chat.message_count, chat.last_message_preview) == (1, 'Hello')
+
+    Message.query.filter_by(chat_id=chat_id).delete()
+    db.session.commit()
+    db.session.refresh(chat)
+    assert (chat.message_count, chat.last_message_preview, chat.last_message_at) == (0, None, None)
+
+def test_chat_listing_uses_user_updated_index(app):
+    """Test that every sidebar query list_chats runs is one indexed scan without a sort"""
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('SELECT') and 'FROM chat' in statement:
+            statements.append((statement, parameters))
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        ChatSessionManager.list_chats('u')
+        ChatSessionManager.list_chats('u', named_only=True)
+        ChatSessionManager.list_chats('u', cursor='2024-01-01T00:00:00|c9', named_only=True)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+    assert len(statements) == 3
+    for statement, parameters in statements:
+        plan = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+        assert any('ix_chat_user_' in row[3] for row in plan)
+        assert not any('TEMP B-TREE' in row[3] for row in plan)
+
+def test_chat_list_hides_auto_named_and_pages_by_cursor(client):
+    """Test that /chats filters in SQL and walks pages with next_cursor"""
+    named = [json.loads(client.post('/start_chat').data)['chat_id'] for _ in range(5)]
+    auto_id = json.loads(client.post('/api/chats/new', json={}).data)['chat_id']
+
+    seen, cursor = [], None
+    while True:
+        data = json.loads(client.get('/chats?limit=2' + (f'&cursor={cursor}' if cursor else '')).data)
+        seen += [chat['id'] for chat in data['chats']]
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+
+    assert sorted(seen) == sorted(named)
+    client.put(f'/chat/{auto_id}', json={'name': 'Renamed'})
+    assert auto_id in [c['id'] for c in json.loads(client.get('/chats').data)['chats']]
+    assert client.get('/chats?cursor=garbage').status_code == 400
+
+def test_upgrade_schema_backfills_chat_listing_columns(tmp_path):
+    """Test that existing chats get their counts and triggers on upgrade"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE chat (id TEXT PRIMARY KEY, user_id TEXT, name TEXT, updated DATETIME)'))
+        conn.execute(text('CREATE TABLE message (id INTEGER PRIMARY KEY, chat_id TEXT, role TEXT, content TEXT, timestamp DATETIME)'))
+        conn.execute(text("INSERT INTO chat VALUES ('c1', 'u1', 'Old', '2024-01-01 00:00:00')"))
+        conn.execute(text("INSERT INTO message (chat_id, role, content, timestamp) VALUES "
+                          "('c1', 'user', 'first', '2024-01-01 00:00:00'), ('c1', 'assistant', 'second', '2024-01-02 00:00:00')"))
+
+    upgrade_schema(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO message (chat_id, role, content, timestamp) VALUES ('c1', 'user', 'third', '2024-01-03 00:00:00')"))
+        row = conn.execute(text('SELECT message_count, last_message_preview, updated FROM chat')).one()
+
+    assert tuple(row) == (3, 'third', '2024-01-03 00:00:00')
+
+def test_search_ranks_user_messages_with_snippets(client):
+    """Test that /chats/search finds, ranks and pages the user's messages"""
+    chat_id = json.loads(client.post('/start_chat').data)['chat_id']
+    for content in ['Our refund policy covers <b>30 days</b>', 'Shipping takes a week',
+                    'Refunds and refund requests: see the refund page', 'Nothing here']:
+        client.post(f'/chat/{chat_id}/message', json={'role': 'assistant', 'content': content})
+    db.session.add(Chat(id='other', user_id='someone-else', name='Other'))
+    db.session.add(Message(chat_id='other', role='user', content='refund please'))
+    db.session.commit()
+
+    data = json.loads(client.get('/chats/search?q=refunds&limit=1').data)
+    assert data['results'][0]['chat_id'] == chat_id
+    assert '<mark>Refunds</mark>' in data['results'][0]['snippet']
+    second = json.loads(client.get(f'/chats/search?q=refunds&limit=1&offset={data["next_offset"]}').data)
+    assert '&lt;b&gt;' in second['results'][0]['snippet'] and second['next_offset'] is None
+
+    Message.query.filter_by(chat_id=chat_id).delete()
+    db.session.commit()
+    assert json.loads(client.get('/chats/search?q=refund').data)['results'] == []
+    assert client.get('/chats/search?q=').status_code == 400
+
+@pytest.mark.parametrize('fts5', [True, False])
+def test_search_results_share_timestamp_format(client, monkeypatch, fts5):
+    """Test that FTS5 and substring search both return ISO timestamps"""
+    monkeypatch.setattr('app.message_search.fts5_ready', lambda: fts5)
+    chat_id = json.loads(client.post('/start_chat').data)['chat_id']
+    client.post(f'/chat/{chat_id}/message', json={'role': 'user', 'content': 'refund please'})
+    message = Message.query.filter_by(chat_id=chat_id).one()
+
+    result = json.loads(client.get('/chats/search?q=refund').data)['results'][0]
+    assert result['timestamp'] == message.timestamp.isoformat()
@@ -0,0 +1,57 @@
+import json
+from app.conversation_state import ConversationStateCache
+
+SYSTEM = "You are Neuro-Core, an advanced AI assistant."
+
+def history_after(user, reply):
+    return [{"role": "user", "content": user}, {"role": "assistant", "content": reply}]
+
+def test_resumes_when_prefix_unchanged():
+    """Test that the next turn reuses the saved context tokens"""
+    cache = ConversationStateCache(max_chats=4, max_tokens=100)
+    cache.save('chat-1', SYSTEM, 'Hi, I am Sam', 'Hello Sam!', [1, 2, 3])
+
+    assert cache.resume('chat-1', SYSTEM, history_after('Hi, I am Sam', 'Hello Sam! ')) == [1, 2, 3]
+
+def test_full_resend_when_context_or_history_changes():
+    """Test that a changed system prompt or extra turn falls back to a resend"""
+    cache = ConversationStateCache(max_chats=4, max_tokens=100)
+    cache.save('chat-1', SYSTEM, 'Hi, I am Sam', 'Hello Sam!', [1, 2, 3])
+
+    assert cache.resume('chat-1', SYSTEM + " Context: new file", history_after('Hi, I am Sam', 'Hello Sam!')) is None
+    assert cache.resume('chat-1', SYSTEM, history_after('Something else', 'Hello Sam!')) is None
+    assert cache.resume('chat-2', SYSTEM, history_after('Hi, I am Sam', 'Hello Sam!')) is None
+
+def test_context_over_cap_is_not_kept():
+    """Test that a context near num_ctx is dropped instead of resumed"""
+    cache = ConversationStateCache(max_chats=4, max_tokens=3)
+    cache.save('chat-1', SYSTEM, 'Hi', 'Hello!', [1, 2, 3, 4])
+
+    assert cache.resume('chat-1', SYSTEM, history_after('Hi', 'Hello!')) is None
+
+def test_full_resend_primes_state_for_next_turn(monkeypatch):
+    """Test that a resend with file context saves its context and the next turn resumes"""
+    from app import langchain_client as module
+    from app.conversation_state import conversation_state
+    client = module.LangChainClient()
+    sections = iter([["notes.pdf: chapter one"], ["notes.pdf: chapter two"]])
+    monkeypatch.setattr(module, 'get_memory_context', lambda: "")
+    monkeypatch.setattr(module, 'get_file_context_sections', lambda message: next(sections))
+    monkeypatch.setattr(module, 'get_api_context_sections', lambda message: [])
+    monkeypatch.setattr(module.semantic_cache, 'enabled', False)
+    history = history_after('Hi, I am Sam', 'Hello Sam!')
+
+    plan = client.prepare_stream('Summarise chapter one', history, 'file-chat')
+    kwargs = client._generate_kwargs(plan)
+    assert plan['use_context'] and kwargs['context'] is None
+    assert kwargs['prompt'].startswith('User: Hi, I am Sam')
+    assert 'chapter one' in kwargs['system']
+    client._finish_plan(plan, 'It is about Sam.', [1, 2, 3])
+
+    history += history_after('Summarise chapter one', 'It is about Sam.')
+    # Plans reach a worker process as JSON; the resume happens there
+    plan = json.loads(json.dumps(client.prepare_stream('And chapter two?', history, 'file-chat')))
+    kwargs = client._generate_kwargs(plan)
+    assert kwargs['context'] == [1, 2, 3] and kwargs['system'] is None
+    assert kwargs['prompt'] == "Context: notes.pdf: chapter two\n\nAnd chapter two?"
+    conversation_state.drop('file-chat')
@@ -0,0 +1,176 @@
+import io
+import json
+import os
+import pytest
+from app.models import db, Blob, Chat, Document, DocumentChunk
+from datetime import datetime, timedelta
+from app.blob_store import blob_path
+from app.document_store import search_chunks, save_extraction, attach_document, json_index_for, _match_expression
+from app.extraction import extract_pdf
+
+@pytest.fixture(autouse=True)
+def upload_dirs(tmp_path, monkeypatch):
+    uploads = tmp_path / 'uploads'
+    monkeypatch.setattr('app.blob_store.BLOB_DIR', uploads / 'blobs')
+    monkeypatch.setattr('app.blob_store.TMP_DIR', uploads / 'tmp')
+
+@pytest.fixture
+def app_config(app_config):
+    return {**app_config, 'INGEST_WORKERS': 0}
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 'test-user'
+    return client
+
+def upload(client, name, body):
+    return client.post('/upload', data={'file': (io.BytesIO(body), name)},
+                       content_type='multipart/form-data')
+
+def test_upload_keeps_only_handle_in_session(client):
+    """Test that uploaded text goes to the chunk store, not the session"""
+    body = ("lorem ipsum " * 400 + "the refund policy allows returns within thirty days").encode()
+    response = upload(client, 'handbook.txt', body)
+    assert response.status_code == 200
+
+    memory = json.loads(client.get('/memory').data)['memory']
+    handle = next(iter(memory['files'].values()))
+
+    assert 'content' not in handle
+    assert handle['type'] == 'text'
+    blob = db.session.get(Document, handle['document_id']).blob
+    assert blob.status == 'ready'
+    assert DocumentChunk.query.filter_by(blob_digest=blob.digest).count() == blob.chunk_count
+
+def test_upload_job_status(client):
+    """Test that an upload returns a job id that can be polled"""
+    data = json.loads(upload(client, 'notes.txt', b'some notes').data)
+
+    response = client.get(f"/upload/{data['job_id']}")
+    job = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert job['status'] == 'ready'
+    assert job['filename'] == 'notes.txt'
+    assert client.get('/upload/unknown-job').status_code == 404
+
+def test_search_chunks_is_scoped_to_chat(client):
+    """Test that chunk search ranks matches and ignores other chats"""
+    upload(client, 'handbook.txt', b"shipping takes five days. " * 50 + b"refunds are issued within thirty days.")
+    document = Document.query.first()
+
+    hits = search_chunks(document.chat_id, 'how do refunds work?')
+    assert hits
+    assert 'refunds' in hits[0][2]
+    assert search_chunks('another-chat', 'refunds') == []
+
+def test_chunk_match_is_scoped_inside_fts(client):
+    """Test that the FTS5 expression only matches chunks of the chat's own blobs"""
+    upload(client, 'mine.txt', b'refunds are issued within thirty days')
+    mine = Document.query.one()
+    client.post('/start_chat')
+    upload(client, 'theirs.txt', b'refunds take a week for other customers')
+
+    expression = _match_expression([mine.blob_digest], 'refunds')
+    rows = db.session.execute(db.text('SELECT rowid FROM document_chunk_fts WHERE document_chunk_fts MATCH :e'),
+                              {'e': expression}).all()
+    chunk_ids = {c.id for c in DocumentChunk.query.filter_by(blob_digest=mine.blob_digest)}
+    assert {row[0] for row in rows} == chunk_ids
+    assert [hit[0] for hit in search_chunks(mine.chat_id, 'refunds')] == ['mine.txt']
+
+def test_json_upload_stores_compact_payload(client):
+    """Test that JSON uploads are stored once, compactly"""
+    upload(client, 'data.json', json.dumps({'items': [{'name': 'widget', 'price': 3}]}, indent=2).encode())
+    blob = Blob.query.filter_by(doc_type='json').first()
+
+    assert blob.payload == '{"items":[{"name":"widget","price":3}]}'
+
+def test_same_bytes_share_one_blob(client):
+    """Test that re-uploading a file in another chat reuses the stored blob"""
+    first = json.loads(upload(client, 'handbook.txt', b'employee handbook text').data)
+    client.post('/new-chat')
+    second = json.loads(upload(client, 'copy.txt', b'employee handbook text').data)
+
+    blob = db.session.get(Blob, first['digest'])
+    assert second['digest'] == first['digest']
+    assert second['url'] == first['url']
+    assert blob.ref_count == 2
+    assert DocumentChunk.query.filter_by(blob_digest=blob.digest).count() == blob.chunk_count
+
+def test_deleting_last_chat_frees_blob(client):
+    """Test that a blob is removed once no chat references it"""
+    data = json.loads(upload(client, 'notes.txt', b'temporary notes').data)
+    blob = db.session.get(Blob, data['digest'])
+    path = blob_path(blob.digest, blob.ext)
+    chat_id = db.session.get(Document, data['job_id']).chat_id
+    assert path.exists()
+
+    client.delete(f'/chat/{chat_id}')
+
+    assert db.session.get(Blob, data['digest']) is None
+    assert DocumentChunk.query.filter_by(blob_digest=data['digest']).count() == 0
+    assert not path.exists()
+
+def test_pdf_chunks_are_spooled_and_inserted_in_batches(app, monkeypatch):
+    """Test that PDF chunks travel through a spool file, not the result"""
+    monkeypatch.setattr('app.extraction.iter_pdf_pages', lambda path, stats: iter(f"page {i} " * 300 for i in range(5)))
+    monkeypatch.setattr('app.document_store.INGEST_CHUNK_BATCH', 3)
+    db.session.add(Blob(digest='pdf-digest', ext='.pdf', size=1, doc_type='pdf', ref_count=1))
+    db.session.commit()
+
+    result = extract_pdf('book.pdf')
+    assert 'chunks' not in result
+    save_extraction('pdf-digest', result)
+
+    blob = db.session.get(Blob, 'pdf-digest')
+    assert blob.status == 'ready'
+    assert blob.chunk_count == result['chunk_count'] > 3
+    assert DocumentChunk.query.filter_by(blob_digest='pdf-digest').count() == blob.chunk_count
+    assert not os.path.exists(result['chunk_file'])
+
+def test_stalled_extraction_is_retried(app):
+    """Test that a blob stuck in 'processing' is claimed again once stale"""
+    db.session.add(Chat(id='c1', user_id='u', name='One'))
+    db.session.add(Chat(id='c2', user_id='u', name='Two'))
+    db.session.add(Blob(digest='stuck', ext='.txt', size=1, doc_type='text', ref_count=1, status='processing'))
+    db.session.commit()
+
+    assert attach_document('c1', 'a.txt', 'stuck', '.txt', 1, 'text')[1] is False  # still fresh
+
+    db.session.get(Blob, 'stuck').claimed_at = datetime.utcnow() - timedelta(hours=1)
+    db.session.commit()
+    assert attach_document('c2', 'a.txt', 'stuck', '.txt', 1, 'text')[1] is True
+    assert db.session.get(Blob, 'stuck').claimed_at > datetime.utcnow() - timedelta(minutes=1)
+
+def test_freeing_blob_removes_copies_under_every_extension(client):
+    """Test that the same bytes saved as .txt and .md are both deleted"""
+    data = json.loads(upload(client, 'notes.txt', b'shared notes').data)
+    client.post('/new-chat')
+    upload(client, 'notes.md', b'shared notes')
+    blob = db.session.get(Blob, data['digest'])
+    paths = [blob_path(blob.digest, '.txt'), blob_path(blob.digest, '.md')]
+    assert all(path.exists() for path in paths)
+
+    for (chat_id,) in db.session.query(Document.chat_id).all():
+        client.delete(f'/chat/{chat_id}')
+
+    assert db.session.get(Blob, data['digest']) is None
+    assert not any(path.exists() for path in paths)
+
+def test_api_data_is_stored_as_document(client, monkeypatch):
+    """Test that fetched API JSON goes to the document store, leaving a handle in the session"""
+    payload = {'orders': [{'id': i, 'status': 'shipped' if i == 7 else 'pending'} for i in range(200)]}
+    monkeypatch.setattr('app.routes.fetch_api_data', lambda url, key=None, headers=None: {'success': True, 'data': payload})
+    assert client.post('/api-fetch', json={'url': 'https://example.com/orders'}).status_code == 200
+
+    memory = json.loads(client.get('/memory').data)['memory']
+    handle = memory['apis']['api_1']
+    assert set(handle) == {'url', 'fetched_at', 'api_key_provided', 'type', 'document_id', 'uploaded_at'}
+
+    document = db.session.get(Document, handle['document_id'])
+    assert document.blob.status == 'ready'
+    assert json_index_for(document.blob_digest) is json_index_for(document.blob_digest)  # parsed once
+    hits = json_index_for(document.blob_digest).search('which order is shipped')
+    assert any('"id":7' in hit['json'] for hit in hits)
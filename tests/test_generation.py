@@ -0,0 +1,141 @@
+import threading
+import time
+import pytest
+from app.langchain_client import langchain_client
+from app.models import db, Message
+from app.generation import DeltaCoalescer, relay_events
+from app.token_bus import LocalTokenBus
+from app.limiter import ollama_limiter, OllamaBusy
+from app.config import OLLAMA_MODEL
+
+@pytest.fixture
+def app(app, monkeypatch):
+    def fake_stream(plan):
+        for token in ['Hello', ' there']:
+            yield token
+    monkeypatch.setattr(langchain_client, 'available', True)
+    monkeypatch.setattr(langchain_client, 'stream_plan', fake_stream)
+    return app
+
+def test_local_bus_reads_after_event_id():
+    """Test that the local bus replays only events after the given id"""
+    bus = LocalTokenBus()
+    bus.open('r1', 'u1')
+    for delta in ['a', 'b', 'c']:
+        bus.publish('r1', {'delta': delta})
+
+    assert [e['delta'] for _, e in bus.read('r1')] == ['a', 'b', 'c']
+    assert bus.read('r1', after='2') == [('3', {'delta': 'c'})]
+    assert bus.read('r1', after='3', timeout=0.01) == []
+    assert bus.owner('r1') == 'u1'
+    bus.cancel('r1')
+    assert bus.cancelled('r1')
+
+def test_stream_runs_in_worker_and_saves_reply(client):
+    """Test that /stream relays id'd events from the generation worker"""
+    response = client.post('/stream', json={'message': 'Hi'})
+    body = response.get_data(as_text=True)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert 'id: 2\ndata: {"delta": "Hello"}' in body
+    assert body.rstrip().endswith('data: {"done": true}')
+    assert [m.content for m in Message.query.order_by(Message.id)] == ['Hi', 'Hello there']
+
+def test_stream_resumes_from_last_event_id(client):
+    """Test that a reconnecting client gets only the events it missed"""
+    body = client.post('/stream', json={'message': 'Hi'}).get_data(as_text=True)
+    request_id = body.split('"request_id": "')[1].split('"')[0]
+
+    resumed = client.get(f'/stream/{request_id}', headers={'Last-Event-ID': '2'}).get_data(as_text=True)
+    assert 'Hello"' not in resumed
+    assert 'id: 3\ndata: {"delta": " there"}' in resumed
+    assert client.get('/stream/unknown').status_code == 404
+    assert client.get(f'/stream/{request_id}', headers={'Last-Event-ID': 'abc'}).status_code == 400
+    assert client.get(f'/stream/{request_id}?last_event_id=1-0').status_code == 400
+
+def test_coalescer_flushes_first_token_then_by_window_or_size():
+    """Test that deltas after the first are joined until the window or byte limit"""
+    now = [0.0]
+    coalescer = DeltaCoalescer(window_ms=40, max_bytes=8, clock=lambda: now[0])
+
+    assert coalescer.add('Hi') == 'Hi'
+    assert coalescer.add(' a') is None
+    now[0] = 0.05
+    assert coalescer.add(' b') == ' a b'
+    assert coalescer.add('123456789') == '123456789'
+    assert coalescer.add('!') is None
+    assert coalescer.flush() == '!'
+    assert coalescer.flush() is None
+
+def test_stream_saves_turn_once_in_requested_chat(client):
+    """Test that the server is the only writer and a retried turn is a no-op"""
+    chat_id = client.post('/start_chat').get_json()['chat_id']
+    client.post('/start_chat')  # another chat becomes the session's active one
+    payload = {'message': 'Hi', 'chat_id': chat_id, 'client_key': 'turn-1'}
+
+    client.post('/stream', json=payload).get_data()
+    retried = client.post('/stream', json=payload)
+
+    assert retried.get_json() == {'reply': 'Hello there'}
+    rows = Message.query.filter_by(chat_id=chat_id).order_by(Message.id).all()
+    assert [(m.content, m.client_key) for m in rows] == [('Hi', 'turn-1'), ('Hello there', 'turn-1:reply')]
+
+def test_slot_released_when_dispatch_fails(client, monkeypatch):
+    """Test that a failed hand-off to the worker gives the limiter slot back"""
+    def broken_dispatch(job, slot):
+        raise RuntimeError('executor shut down')
+    monkeypatch.setattr('app.routes.dispatch_generation', broken_dispatch)
+    monkeypatch.setattr(langchain_client, 'prepare_stream', lambda *args: {'messages': []})
+
+    with pytest.raises(RuntimeError):
+        client.post('/stream', json={'message': 'Hi'})
+
+    assert ollama_limiter.state()[OLLAMA_MODEL]['active'] == 0
+
+def test_stream_rejects_when_redis_job_queue_is_full(client, monkeypatch):
+    """Test that /stream answers 429 once the shared job queue is over its limit"""
+    class BacklogBus(LocalTokenBus):
+        is_local = False
+
+        def queued_jobs(self):
+            return 40
+    monkeypatch.setattr('app.generation.get_token_bus', lambda: BacklogBus())
+
+    response = client.post('/stream', json={'message': 'Hi'})
+
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+def test_relay_flushes_buffered_text_when_model_pauses(monkeypatch):
+    """Test that buffered deltas go out after the window even if no new delta arrives"""
+    bus = LocalTokenBus()
+    monkeypatch.setattr('app.generation.get_token_bus', lambda: bus)
+    bus.open('r1', 'u1')
+    bus.publish('r1', {'delta': 'Hi'})
+    bus.publish('r1', {'delta': ' there'})
+    finished = threading.Event()
+
+    def finish_later():
+        time.sleep(0.5)
+        finished.set()
+        bus.publish('r1', {'done': True})
+    threading.Thread(target=finish_later).start()
+
+    frames = relay_events('r1')
+    assert next(frames) == 'id: 1\ndata: {"delta": "Hi"}\n\n'
+    assert next(frames) == 'id: 2\ndata: {"delta": " there"}\n\n'
+    assert not finished.is_set()
+    assert next(frames) == 'id: 3\ndata: {"done": true}\n\n'
+
+def test_chat_cache_hit_skips_the_limiter(client, monkeypatch):
+    """Test that /chat answers from the cache without waiting for a model slot"""
+    def busy(model, blocking=True):
+        raise OllamaBusy(model, 3)
+    monkeypatch.setattr(ollama_limiter, 'slot', busy)
+    plans = iter([{'cached': 'Stored answer'}, {'cached': None}])
+    monkeypatch.setattr(langchain_client, 'prepare_stream', lambda *args: next(plans))
+
+    assert client.post('/chat', json={'message': 'Hi'}).get_json() == {'reply': 'Stored answer'}
+    missed = client.post('/chat', json={'message': 'Something new'})
+    assert missed.status_code == 429 and missed.headers['Retry-After'] == '3'
@@ -0,0 +1,40 @@
+import threading
+import pytest
+from app.limiter import ModelGate, OllamaBusy
+
+def test_gate_rejects_when_queue_full():
+    """Test that requests beyond concurrency plus queue are rejected"""
+    gate = ModelGate('test-model', max_concurrency=1, max_queue=0, wait_timeout=1)
+    slot = gate.acquire()
+
+    with pytest.raises(OllamaBusy) as busy:
+        gate.acquire()
+
+    assert busy.value.retry_after >= 1
+    slot.release()
+    slot.release()  # second release is a no-op
+    assert gate.state()['active'] == 0
+
+def test_gate_queued_request_gets_freed_slot():
+    """Test that a queued request proceeds once a slot is released"""
+    gate = ModelGate('test-model', max_concurrency=1, max_queue=1, wait_timeout=5)
+    slot = gate.acquire()
+    acquired = []
+
+    waiter = threading.Thread(target=lambda: acquired.append(gate.acquire()))
+    waiter.start()
+    while gate.waiting == 0:
+        pass
+    slot.release()
+    waiter.join(timeout=5)
+
+    assert len(acquired) == 1
+    assert gate.state()['active'] == 1
+
+def test_gate_wait_times_out():
+    """Test that waiting longer than the timeout raises OllamaBusy"""
+    gate = ModelGate('test-model', max_concurrency=1, max_queue=1, wait_timeout=0.05)
+    gate.acquire()
+
+    with pytest.raises(OllamaBusy):
+        gate.acquire()
@@ -0,0 +1,99 @@
+import time
+from app.response_cache import ResponseCache
+
+MESSAGES = [
+    {"role": "system", "content": "You are Neuro-Core, an advanced AI assistant."},
+    {"role": "user", "content": "What is   BM25?"}
+]
+
+def test_key_ignores_whitespace_but_not_model_or_options():
+    """Test that equivalent prompts share a key and other settings do not"""
+    spaced = [dict(m, content=f"  {m['content']}\n") for m in MESSAGES]
+
+    key = ResponseCache.make_key('llama3.2:3b', MESSAGES)
+    assert ResponseCache.make_key('llama3.2:3b', spaced) == key
+    assert ResponseCache.make_key('mistral', MESSAGES) != key
+    assert ResponseCache.make_key('llama3.2:3b', MESSAGES, {'temperature': 0}) != key
+
+def test_lru_and_ttl_eviction():
+    """Test that the oldest entry is evicted and expired entries miss"""
+    cache = ResponseCache(max_entries=2, ttl=60, redis_url='')
+    cache.set('a', 'A')
+    cache.set('b', 'B')
+    assert cache.get('a') == 'A'  # a is now most recently used
+    cache.set('c', 'C')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 'A'
+
+    short = ResponseCache(max_entries=2, ttl=0.01, redis_url='')
+    short.set('a', 'A')
+    time.sleep(0.02)
+    assert short.get('a') is None
+
+def test_invalidate_by_chat_tag():
+    """Test that invalidating a chat only drops that chat's answers"""
+    cache = ResponseCache(max_entries=10, ttl=60, redis_url='')
+    cache.set('k1', 'one', tags=['chat-1'])
+    cache.set('k2', 'two', tags=['chat-2'])
+
+    cache.invalidate('chat-1')
+
+    assert cache.get('k1') is None
+    assert cache.get('k2') == 'two'
+
+def test_tags_are_pruned_with_their_entries():
+    """Test that evicted and expired entries leave no tag references behind"""
+    cache = ResponseCache(max_entries=2, ttl=60, redis_url='')
+    for i in range(5):
+        cache.set(f'k{i}', 'v', tags=[f'chat-{i}'])
+    assert set(cache._tags) == {'chat-3', 'chat-4'}
+
+    short = ResponseCache(max_entries=10, ttl=0.01, redis_url='')
+    short.set('a', 'A', tags=['chat-1'])
+    time.sleep(0.02)
+    assert short.get('a') is None
+    assert short._tags == {}
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self):
+        return self
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value.encode() if isinstance(value, str) else value
+
+    def sadd(self, key, member):
+        self.data.setdefault(key, set()).add(member.encode())
+
+    def expire(self, key, ttl):
+        pass
+
+    def execute(self):
+        pass
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def smembers(self, key):
+        return self.data.get(key, set())
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+def test_redis_hit_keeps_tags_for_invalidation():
+    """Test that an answer another worker cached can still be invalidated by chat"""
+    shared = FakeRedis()
+    writer = ResponseCache(max_entries=10, ttl=60, redis_url='')
+    reader = ResponseCache(max_entries=10, ttl=60, redis_url='')
+    writer._redis = reader._redis = shared
+    writer.set('k1', 'one', tags=['chat-1'])
+
+    assert reader.get('k1') == 'one'  # served from Redis, now cached locally
+    shared.data.clear()
+    reader.invalidate('chat-1')
+
+    assert reader.get('k1') is None
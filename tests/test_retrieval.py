@@ -0,0 +1,63 @@
+import json
+from app.retrieval import BM25Index, chunk_text, iter_chunks, tokenize
+from app.json_index import JsonPathIndex
+
+def test_chunk_text_overlaps_fixed_windows():
+    """Test that text is split into overlapping fixed-size chunks"""
+    text = " ".join(f"w{i}" for i in range(25))
+    chunks = chunk_text(text, chunk_words=10, overlap=2)
+
+    assert chunks[0].split()[0] == 'w0'
+    assert chunks[1].split()[0] == 'w8'
+    assert chunks[-1].split()[-1] == 'w24'
+    assert all(len(c.split()) <= 10 for c in chunks)
+
+def test_bm25_ranks_matching_chunk_first():
+    """Test that the chunk containing the query terms wins"""
+    filler = " ".join(["lorem ipsum dolor"] * 60)
+    text = f"{filler} the refund policy allows returns within thirty days {filler}"
+    index = BM25Index.from_chunks(chunk_text(text, chunk_words=40))
+
+    results = index.search("What is the refund policy?", top_k=2)
+
+    assert results
+    assert 'refund policy' in index.chunks[results[0][1]]
+
+def test_bm25_matches_tokenized_query():
+    """Test that queries are tokenized the same way as the chunks"""
+    index = BM25Index.from_chunks(["alpha beta", "gamma delta"])
+
+    assert [idx for _, idx in index.search("The Gamma!")] == [1]
+    assert tokenize("The Gamma!") == ['gamma']
+
+def test_json_index_compact_matches_json_dumps():
+    """Test that the indexed serialization is the standard compact form"""
+    data = {'users': [{'name': 'Ada', 'age': 36}, {'name': 'Linus', 'active': True}], 'total': 2}
+    index = JsonPathIndex.build(data)
+
+    assert index.compact == json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+def test_json_index_returns_enclosing_object_slice():
+    """Test that a leaf match is reported with its enclosing object"""
+    data = {'users': [{'name': 'Ada', 'age': 36}, {'name': 'Linus', 'age': 54}]}
+    index = JsonPathIndex.build(data)
+
+    hits = index.search('how old is linus?')
+
+    assert hits[0]['path'] == '/users/1'
+    assert json.loads(hits[0]['json']) == {'name': 'Linus', 'age': 54}
+
+def test_json_index_falls_back_to_preview():
+    """Test that an unmatched query still gets a top-level preview"""
+    index = JsonPathIndex.build({'a': 1})
+    restored = JsonPathIndex.from_dict(index.compact, index.to_dict())
+
+    assert restored.search('unrelated words') == [{'path': '/', 'json': '{"a":1}'}]
+
+def test_iter_chunks_streaming_matches_whole_text():
+    """Test that feeding pages one at a time gives the same chunks"""
+    pages = [" ".join(f"p{p}w{i}" for i in range(37)) for p in range(5)]
+
+    streamed = list(iter_chunks(pages, chunk_words=20, overlap=4))
+
+    assert streamed == chunk_text(" ".join(pages), chunk_words=20, overlap=4)
@@ -0,0 +1,37 @@
+from app.semantic_cache import SemanticCache, embed
+
+def make_cache(**overrides):
+    settings = dict(enabled=True, threshold=0.75, ttl=60, max_scopes=4, per_scope=8, dim=512)
+    settings.update(overrides)
+    return SemanticCache(**settings)
+
+def test_paraphrase_hits_within_scope():
+    """Test that a reworded question gets the stored answer"""
+    cache = make_cache()
+    scope = SemanticCache.fingerprint('llama3.2:3b', '', ['file:abc:ready'], [])
+    cache.store(scope, 'What is the refund policy?', 'Refunds within 30 days.')
+
+    assert cache.lookup(scope, 'what is the refund policy') == 'Refunds within 30 days.'
+    assert cache.lookup(scope, 'How do I reset my password?') is None
+
+def test_other_scope_never_hits():
+    """Test that answers stay inside their context fingerprint"""
+    cache = make_cache()
+    scope = SemanticCache.fingerprint('llama3.2:3b', '', ['file:abc:ready'], [])
+    other = SemanticCache.fingerprint('llama3.2:3b', '', ['file:def:ready'], [])
+    cache.store(scope, 'What is the refund policy?', 'Refunds within 30 days.')
+
+    assert cache.lookup(other, 'What is the refund policy?') is None
+
+def test_disabled_cache_is_a_no_op():
+    """Test that the cache stays out of the way unless enabled"""
+    cache = make_cache(enabled=False)
+    cache.store('scope', 'What is the refund policy?', 'Refunds within 30 days.')
+
+    assert cache.lookup('scope', 'What is the refund policy?') is None
+
+def test_embedding_is_unit_length():
+    """Test that embeddings are normalized so dot product is cosine"""
+    vector = embed('Refund policy, please!')
+    assert abs(float((vector * vector).sum()) - 1.0) < 1e-5
+    assert not embed('   ').any()
@@ -0,0 +1,44 @@
+import pickle
+import struct
+from app.metrics import metrics
+from app.models import db, Message
+from trim_sessions import trim, trim_files
+
+def test_history_is_not_mirrored_into_session(client, monkeypatch):
+    """Test that chat messages are stored in the database only"""
+    monkeypatch.setattr('app.routes.command_reply', lambda msg: 'Noted')
+    client.post('/chat', json={'message': 'Remember this'})
+
+    with client.session_transaction() as sess:
+        assert not any('history' in value for value in sess.values() if isinstance(value, dict))
+    assert Message.query.count() == 2
+    assert metrics.snapshot()['timings']['session.bytes']['count'] > 0
+
+def test_trim_sessions_removes_history_and_keeps_expiry(tmp_path):
+    """Test that stored sessions lose their history lists but nothing else"""
+    session = {'user_id': 'u1', 'user_u1_chat_c1': {'chat_id': 'c1', 'history': ['x'] * 100, 'memory': {'a': 1}}}
+    path = tmp_path / 'abc'
+    path.write_bytes(struct.pack('I', 12345) + pickle.dumps(session))
+    (tmp_path / 'other').write_bytes(b'not a session')
+
+    seen, trimmed, before, after = trim_files(str(tmp_path), dry_run=False)
+
+    assert (seen, trimmed) == (1, 1) and after < before
+    raw = path.read_bytes()
+    assert struct.unpack('I', raw[:4])[0] == 12345
+    assert pickle.loads(raw[4:]) == {'user_id': 'u1', 'user_u1_chat_c1': {'chat_id': 'c1', 'memory': {'a': 1}}}
+    assert trim({'user_id': 'u1'}) is False
+
+def test_session_size_measured_only_when_modified(client):
+    """Test that static files and unchanged sessions skip the session.bytes pickle"""
+    def measured():
+        return metrics.snapshot()['timings'].get('session.bytes', {}).get('count', 0)
+
+    client.post('/start_chat')
+    before = measured()
+    client.get('/static/css/style.css')
+    client.get('/chats')
+    assert measured() == before
+
+    client.post('/start_chat')
+    assert measured() == before + 1
@@ -0,0 +1,52 @@
+from sqlalchemy import event, text
+from app.models import db, Chat, User, UserMemory
+from app.database import user_db
+from app.storage import WRITER_BIND
+
+def test_connections_use_wal_profile(app):
+    """Test that every pooled connection gets the storage pragmas"""
+    for engine in db.engines.values():
+        with engine.connect() as conn:
+            assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            assert conn.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+            assert conn.execute(text('PRAGMA busy_timeout')).scalar() > 0
+
+def test_writes_go_to_writer_pool(app):
+    """Test that reads use the default pool and flushes the writer until commit"""
+    statements = []
+    for key, engine in db.engines.items():
+        event.listen(engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args, key=key: statements.append((key, statement.split()[0])))
+
+    db.session.add(Chat(id='storage-chat', user_id='u', name='Storage'))
+    db.session.commit()
+    chat = db.session.get(Chat, 'storage-chat')
+    chat.name = 'Renamed'
+    db.session.flush()
+    assert Chat.query.filter_by(name='Renamed').count() == 1  # reads its own write
+    db.session.commit()
+    Chat.query.filter_by(id='storage-chat').delete()
+    db.session.commit()
+
+    assert statements == [
+        (WRITER_BIND, 'INSERT'),
+        (None, 'SELECT'),
+        (WRITER_BIND, 'UPDATE'),
+        (WRITER_BIND, 'SELECT'),
+        (WRITER_BIND, 'DELETE'),
+    ]
+
+def test_user_database_uses_app_models(app):
+    """Test that UserDatabase reads and writes the shared User and UserMemory tables"""
+    assert user_db.create_user('u-1', 'Sam', 'sam@example.com', '555', 'hash')
+    assert not user_db.create_user('u-2', 'Other', 'sam@example.com', '555', 'hash')  # email taken
+    assert user_db.get_user_by_email('sam@example.com')['user_id'] == 'u-1'
+
+    user_db.save_user_memory('u-1', 'name', 'Sam')
+    user_db.save_user_memory('u-1', 'name', 'Samantha')
+    assert user_db.get_user_memory('u-1') == {'name': 'Samantha'}
+    assert UserMemory.query.count() == 1
+
+    user_db.delete_user('u-1')
+    assert user_db.get_user_by_id('u-1') is None
+    assert db.session.get(User, 'u-1').is_active is False
@@ -0,0 +1,52 @@
+from app.models import db, Chat, Message
+from app.summarizer import update_summary, needs_summary, summarize
+from app.limiter import ollama_limiter
+from app.config import HISTORY_MESSAGES, SUMMARY_EVERY_MESSAGES, SUMMARY_MODEL
+
+def add_messages(chat_id, count):
+    for i in range(count):
+        db.session.add(Message(chat_id=chat_id, role='user' if i % 2 == 0 else 'assistant', content=f'message {i}'))
+    db.session.commit()
+
+def test_summary_folds_all_but_recent_window(app):
+    """Test that older messages are folded and the recent window is kept"""
+    db.session.add(Chat(id='long-chat', user_id='u', name='Long'))
+    add_messages('long-chat', HISTORY_MESSAGES + SUMMARY_EVERY_MESSAGES)
+    assert needs_summary('long-chat')
+
+    folded = []
+    def fake_summarize(summary, messages):
+        folded.extend(m.content for m in messages)
+        return 'User and assistant exchanged numbered messages.'
+
+    assert update_summary('long-chat', fake_summarize)
+
+    chat = db.session.get(Chat, 'long-chat')
+    db.session.refresh(chat)
+    assert chat.summary == 'User and assistant exchanged numbered messages.'
+    assert len(folded) == SUMMARY_EVERY_MESSAGES
+    assert Message.query.filter(Message.chat_id == 'long-chat', Message.id > chat.summary_upto).count() == HISTORY_MESSAGES
+    assert not needs_summary('long-chat')
+
+def test_short_chat_is_not_summarized(app):
+    """Test that chats within the window are left alone"""
+    db.session.add(Chat(id='short-chat', user_id='u', name='Short'))
+    add_messages('short-chat', HISTORY_MESSAGES)
+
+    assert not needs_summary('short-chat')
+    assert not update_summary('short-chat', lambda summary, messages: 'unused')
+
+def test_summary_waits_for_idle_slot_on_summary_model(monkeypatch):
+    """Test that summaries only take a free slot on their own model, never a queue place"""
+    class FakeClient:
+        def chat(self, model, messages, keep_alive):
+            return {'message': {'content': f' summary from {model} '}}
+    taken = []
+    def fake_slot(model, blocking=True):
+        taken.append((model, blocking))
+        return ollama_limiter.gate(model).acquire(blocking)
+    monkeypatch.setattr('app.summarizer.get_ollama_client', lambda: FakeClient())
+    monkeypatch.setattr(ollama_limiter, 'slot', fake_slot)
+
+    assert summarize('', [Message(role='user', content='hi')]) == f'summary from {SUMMARY_MODEL}'
+    assert taken == [(SUMMARY_MODEL, False)]
@@ -0,0 +1,44 @@
+import pytest
+from app.models import db, Chat, Message
+from app.langchain_client import langchain_client
+from app.title_worker import title_chats, first_exchange
+from app.storage import _WRITING
+
+def add_chat(chat_id, needs_title=True):
+    db.session.add(Chat(id=chat_id, user_id='u', name='New Chat', needs_title=needs_title))
+    db.session.add(Message(chat_id=chat_id, role='user', content=f'question for {chat_id}'))
+    db.session.add(Message(chat_id=chat_id, role='assistant', content=f'answer for {chat_id}'))
+    db.session.add(Message(chat_id=chat_id, role='user', content='a later question'))
+    db.session.commit()
+
+def test_first_exchange_only(app):
+    """Test that only the opening user and assistant messages are used"""
+    add_chat('c1')
+    assert first_exchange('c1') == ('question for c1', 'answer for c1')
+
+def test_batch_titles_with_per_chat_fallback(app, monkeypatch):
+    """Test that one batch call names chats and unparsed ones fall back"""
+    add_chat('c1')
+    add_chat('c2')
+    batch_calls = []
+    monkeypatch.setattr(langchain_client, 'generate_title_batch',
+                        lambda convs: batch_calls.append(convs) or ['Batch Title', None])
+    writing_during_fallback = []
+    monkeypatch.setattr(langchain_client, 'generate_title',
+                        lambda history: writing_during_fallback.append(db.session.info.get(_WRITING)) or 'Fallback Title')
+
+    title_chats(['c1', 'c2'])
+
+    assert len(batch_calls) == 1
+    assert writing_during_fallback == [None]  # no write transaction held across the model call
+    names = {c.id: (c.name, c.needs_title) for c in Chat.query.all()}
+    assert names == {'c1': ('Batch Title', False), 'c2': ('Fallback Title', False)}
+
+def test_renamed_chat_is_left_alone(app, monkeypatch):
+    """Test that chats the user already named are skipped"""
+    add_chat('c1', needs_title=False)
+    monkeypatch.setattr(langchain_client, 'generate_title', lambda history: pytest.fail('should not be called'))
+
+    title_chats(['c1'])
+
+    assert db.session.get(Chat, 'c1').name == 'New Chat'
@@ -0,0 +1,47 @@
+from sqlalchemy import create_engine, inspect, text
+from app.models import db, Chat, Message
+from app.migrations import upgrade_schema
+from app.token_budget import assemble_prompt, estimate_tokens, budget_for
+
+def test_estimate_tokens():
+    """Test the rough chars-per-token estimate"""
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('hello world') == 3
+    assert estimate_tokens('a b c d e f') == 6  # at least one per word
+
+def test_prompt_fits_budget_by_priority():
+    """Test that recent turns win over retrieved sections and old turns"""
+    budget = budget_for('llama3.2:3b')
+    history = [{'role': 'user', 'content': f'old question {i} ' + 'x' * 400} for i in range(20)]
+    history.append({'role': 'assistant', 'content': 'latest answer'})
+    sections = ['[Relevant Content from a.txt, part 1]:\n' + 'word ' * 2000, '[Relevant Content from a.txt, part 2]:\nmore']
+
+    messages = assemble_prompt('llama3.2:3b', 'You are Neuro-Core.', 'What next?', memory='[User Info: name: Sam]\n\n',
+                               history=history, retrieved=sections)
+
+    assert messages[0]['role'] == 'system'
+    assert 'name: Sam' in messages[0]['content']
+    assert messages[-1] == {'role': 'user', 'content': 'What next?'}
+    assert messages[-2]['content'] == 'latest answer'
+    assert len(messages) < len(history) + 2
+    assert sum(estimate_tokens(m['content']) for m in messages) <= budget
+
+def test_message_token_count_set_on_insert(app):
+    """Test that token counts are stored when a message is written"""
+    chat = Chat(id='budget-chat', user_id='u', name='Budget')
+    db.session.add(chat)
+    db.session.add(Message(chat_id='budget-chat', role='user', content='hello world'))
+    db.session.commit()
+
+    assert Message.query.filter_by(chat_id='budget-chat').one().token_count == 3
+
+def test_upgrade_schema_adds_missing_columns(tmp_path):
+    """Test that an old message table gains the token_count column"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE message (id INTEGER PRIMARY KEY, content TEXT)'))
+
+    upgrade_schema(engine)
+    upgrade_schema(engine)  # second run is a no-op
+
+    assert 'token_count' in {c['name'] for c in inspect(engine).get_columns('message')}
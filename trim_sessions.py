@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Remove chat history copies from stored sessions.
+
+Chat history used to be mirrored into every session as well as the
+database, so old sessions carry lists that grew with every message. The
+database is now the only copy; run this once after upgrading to shrink the
+sessions already in Redis or on disk. Each session keeps its expiry.
+
+    python trim_sessions.py [--dry-run]
+"""
+
+import os
+import pickle
+import struct
+import sys
+import tempfile
+from app import create_app
+
+
+def trim(data):
+    """Drop history lists from a session dict; True if anything was removed."""
+    changed = data.pop('history', None) is not None
+    for key, value in data.items():
+        if '_chat_' in key and isinstance(value, dict) and 'history' in value:
+            del value['history']
+            changed = True
+    return changed
+
+
+def trim_redis(redis_client, prefix, dry_run):
+    seen = trimmed = before = after = 0
+    for key in redis_client.scan_iter(match=f"{prefix}*", count=500):
+        raw = redis_client.get(key) if redis_client.type(key) == b'string' else None
+        try:
+            data = pickle.loads(raw) if raw else None
+        except Exception:
+            data = None
+        if not isinstance(data, dict):
+            continue
+        seen += 1
+        before += len(raw)
+        if not trim(data):
+            after += len(raw)
+            continue
+        value = pickle.dumps(data)
+        after += len(value)
+        trimmed += 1
+        if not dry_run:
+            ttl = redis_client.pttl(key)
+            redis_client.set(key, value, px=ttl if ttl > 0 else None)
+    return seen, trimmed, before, after
+
+
+def trim_files(directory, dry_run):
+    seen = trimmed = before = after = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            continue
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(4)
+                struct.unpack('I', header)
+                raw = f.read()
+            data = pickle.loads(raw)
+        except Exception:
+            continue
+        if not isinstance(data, dict):
+            continue
+        seen += 1
+        before += len(raw)
+        if not trim(data):
+            after += len(raw)
+            continue
+        value = pickle.dumps(data)
+        after += len(value)
+        trimmed += 1
+        if not dry_run:
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix='.__wz_cache')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                f.write(value)
+            os.replace(tmp, path)
+    return seen, trimmed, before, after
+
+
+def trim_sessions(dry_run=False):
+    app = create_app()
+    if app.config['SESSION_TYPE'] == 'redis':
+        # Sessions share the prefix with the generation streams, which are not pickles
+        result = trim_redis(app.config['SESSION_REDIS'], app.config['SESSION_KEY_PREFIX'], dry_run)
+    else:
+        result = trim_files(app.config['SESSION_FILE_DIR'], dry_run)
+    seen, trimmed, before, after = result
+    action = "Would trim" if dry_run else "Trimmed"
+    print(f"✅ {action} {trimmed} of {seen} sessions: {before:,} → {after:,} bytes")
+    return result
+
+
+if __name__ == "__main__":
+    trim_sessions(dry_run='--dry-run' in sys.argv)